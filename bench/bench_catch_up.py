@@ -0,0 +1,89 @@
+"""Catch-up benchmark: one pass over N channels against a fake Telegram client with network latency.
+
+Every call to the fake client sleeps like a round trip (--rtt, plus jitter),
+and a username resolution costs one more. Compares the old loop (resolve
+every channel with get_entity, then fetch, one channel after another) with
+catch_up(): concurrent fetches through input peers that are resolved once
+and persisted. "restart" clears the in-memory peers and reloads them from
+channel_state, as a new process would. The last line hangs one channel to
+show CHANNEL_FETCH_TIMEOUT bounding the pass.
+
+Usage: python bench/bench_catch_up.py [--rtt SECONDS] [--channels 3,10,30]
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+
+from telethon.tl.types import InputPeerChannel
+
+from common import load_bot
+
+class FakeClient:
+    def __init__(self, rtt, hang=None):
+        self.rtt = rtt
+        self.hang = hang
+        self.calls = 0
+
+    async def round_trip(self):
+        self.calls += 1
+        await asyncio.sleep(self.rtt * random.uniform(0.8, 1.5))
+
+    async def get_entity(self, username):
+        await self.round_trip()
+        return InputPeerChannel(int(username.removeprefix('channel')), 0)
+
+    get_input_entity = get_entity
+
+    async def get_messages(self, peer, min_id=0, limit=None, reverse=False):
+        if peer.channel_id == self.hang:
+            await asyncio.sleep(3600)
+        await self.round_trip()
+        return []
+
+async def sequential_catch_up(client, usernames):
+    """The loop catch_up() used to run: resolve and fetch one channel after another."""
+    for username in usernames:
+        channel = await client.get_entity(username)
+        await client.get_messages(channel, min_id=0, limit=10)
+
+def timed(coroutine):
+    start = time.perf_counter()
+    asyncio.run(coroutine)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rtt', type=float, default=0.1, help='simulated round trip (seconds)')
+    parser.add_argument('--channels', default='3,10,30')
+    args = parser.parse_args()
+    os.environ['CHANNEL_FETCH_TIMEOUT'] = '1'
+    bot = load_bot()
+
+    print(f"one catch-up pass, {args.rtt * 1000:.0f} ms round trips")
+    for count in map(int, args.channels.split(',')):
+        usernames = [f'channel{count * 1000 + i}' for i in range(count)]  # new names, nothing cached yet
+        bot.app.sources.configure([{'channel': username} for username in usernames])
+        client = bot.app.client = FakeClient(args.rtt)
+        old = timed(sequential_catch_up(client, usernames))
+        client.calls = 0
+        first = timed(bot.catch_up())
+        first_calls = client.calls
+        client.calls = 0
+        warm = timed(bot.catch_up())
+        warm_calls = client.calls
+        bot.channel_peers.clear()
+        bot.load_channel_state()
+        client.calls = 0
+        restart = timed(bot.catch_up())
+        print(f"{count:3} channels  sequential {old:6.2f}s ({2 * count} calls)   concurrent: first {first:.2f}s "
+              f"({first_calls} calls)  warm {warm:.2f}s ({warm_calls})  after restart {restart:.2f}s ({client.calls})")
+
+    bot.app.client = FakeClient(args.rtt, hang=bot.channel_peers[usernames[0]].channel_id)
+    print(f"one channel hanging: pass over {len(usernames)} channels took "
+          f"{timed(bot.catch_up()):.2f}s (CHANNEL_FETCH_TIMEOUT {bot.CHANNEL_FETCH_TIMEOUT:g}s)")
+    bot.app.writer.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""Alert coalescing benchmark: Telegram sends per real event with and without the merge window.
+
+Each token is announced by all four feeds within a second of each other, in
+the order they usually race (solearlytrending, early100xgems,
+BullishCallsPremium, then the DexScreener poll), each reporting a higher cap.
+Counts the alerts that reach the dispatcher with coalescing off and on.
+
+Usage: python bench/bench_coalesce.py [tokens]
+"""
+import sys
+import time
+
+from common import load_bot
+
+WINDOW = 1.0  # seconds; shorter than the default so the run is quick
+
+def announce(bot, token_ids):
+    for i, token_id in enumerate(token_ids):
+        name = f"Token {i}"
+        trending = bot.TokenUpdate(token_id=token_id, token_name=name, market_cap=40_000, old_cap=20_000,
+                                   percent_change=100)
+        bot.notify(bot.handle_update('solearlytrending', trending))
+        info = bot.TokenUpdate(token_id=token_id, token_name=name, market_cap=45_000,
+                               created_at=int(time.time()) - 240)
+        bot.notify(bot.handle_update('early100xgems', info))
+        call = bot.TokenUpdate(token_id=token_id, token_name=name, market_cap=95_000)
+        bot.notify(bot.handle_update('BullishCallsPremium', call))
+        api = bot.TokenUpdate(token_id=token_id, token_name=name, market_cap=100_000)
+        bot.notify(bot.save_tokens([api], 'solearlytrending', source='dexscreener'))
+
+def main():
+    token_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    bot = load_bot()
+    sent = []
+    bot.dispatcher.submit = lambda message, recipients=None, prune=True, key=None: sent.append(message)
+    bot.subscriber_index.put(bot.SubscriberPrefs(1))  # one unfiltered subscriber so every alert is routed
+
+    results = {}
+    for window in (0, WINDOW):
+        bot.coalescer.window = window
+        sent.clear()
+        start = time.perf_counter()
+        announce(bot, [f"w{window}-tok{i}" for i in range(token_count)])
+        elapsed = time.perf_counter() - start
+        # Let the last windows close
+        deadline = time.monotonic() + window + 1
+        while bot.coalescer.pending and time.monotonic() < deadline:
+            time.sleep(0.05)
+        results[window] = len(sent)
+        label = f"window {window:.0f}s" if window else "no coalescing"
+        print(f"{label:14} {len(sent):>6,} alerts for {token_count:,} tokens "
+              f"({len(sent) / token_count:.1f} per token, ingest {token_count * 4 / elapsed:,.0f} updates/s)")
+    print(f"sends saved: {1 - results[WINDOW] / results[0]:.0%}")
+    merged = [message for message in sent if '📡 Seen in:' in message]
+    if merged:
+        print("example:", merged[-1].splitlines()[-1])
+
+if __name__ == '__main__':
+    main()
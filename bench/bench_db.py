@@ -0,0 +1,65 @@
+"""Token write-path benchmark: tokens/second through save_tokens at 10k and 100k rows.
+
+Each size runs on a fresh database. Updates arrive in ingestion-sized cycles
+(CYCLE_SIZE tokens per save_tokens call); about a third of them revisit a
+known token with a higher market cap, the rest are new tokens.
+
+Usage: python bench/bench_db.py [sizes...]
+"""
+import random
+import sys
+import time
+
+from common import load_bot
+
+CYCLE_SIZE = 50
+
+def make_updates(bot, count, seed=1):
+    rng = random.Random(seed)
+    caps = {}
+    updates = []
+    for i in range(count):
+        if caps and rng.random() < 0.33:
+            token_id = f"tok{rng.randrange(len(caps))}"
+            caps[token_id] = int(caps[token_id] * rng.uniform(1.05, 2.5))
+        else:
+            token_id = f"tok{len(caps)}"
+            caps[token_id] = rng.randint(10_000, 500_000)
+        updates.append(bot.TokenUpdate(token_id=token_id, token_name=f"Token {i}", market_cap=caps[token_id],
+                                       created_at=int(time.time()) - rng.randint(1, 60) * 60))
+    return updates
+
+def reset(bot):
+    bot.app.writer.wait()
+    with bot.app.db.write() as w:
+        w.execute('DELETE FROM tokens')
+        w.execute('DELETE FROM market_updates')
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000]
+    bot = load_bot()
+    # Alerts are only queued; nothing is sent
+    bot.dispatcher.submit = lambda *args, **kwargs: None
+
+    for size in sizes:
+        reset(bot)
+        updates = make_updates(bot, size)
+        start = time.perf_counter()
+        for i in range(0, size, CYCLE_SIZE):
+            bot.save_tokens(updates[i:i + CYCLE_SIZE], 'bench')
+        bot.app.writer.wait()
+        elapsed = time.perf_counter() - start
+        rows = bot.app.db.query_one('SELECT COUNT(*) FROM tokens')[0]
+        print(f"{size:>8,} updates  {size / elapsed:>10,.0f} tokens/s end to end  ({rows:,} tokens, {elapsed:.2f}s)")
+
+        snapshot = bot.metrics.snapshot()
+        written = snapshot['counters'].get('db_rows_written', 0)
+        writes = snapshot['timings'].get('db_write_seconds')
+        if writes:
+            busy = writes['count'] * writes['avg']
+            print(f"{'':>8}          {written / busy:>10,.0f} rows/s in the writer  "
+                  f"({writes['count']} transactions, {busy:.2f}s busy)")
+        bot.metrics = bot.Metrics()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Retention pass benchmark: space reclaimed and how long the writer waits meanwhile.
+
+Fills a fresh database with a week of market history (concentrated on a few
+active tokens, like the real feeds) and a mix of live and dead tokens. It
+then measures the writer's transaction latency under steady ingestion,
+first on its own and then while run_maintenance() works through the backlog,
+and reports what the pass did. A second pass with ingestion stopped shows the
+bytes given back to the filesystem.
+
+Usage: python bench/bench_maintenance.py [tokens] [updates]
+"""
+import random
+import sys
+import threading
+import time
+
+from common import load_bot
+from bench_db import CYCLE_SIZE, make_updates
+
+INGEST_PAUSE = 0.005  # seconds between ingestion cycles
+
+def populate(bot, token_count, update_count):
+    rng = random.Random(5)
+    now = int(time.time())
+    with bot.app.db.write() as w:
+        # Half the tokens were last seen within a day, the rest up to a month ago
+        w.executemany(
+            'INSERT INTO tokens (token_id, token_name, market_cap, channel_name, updated_at) VALUES (?, ?, ?, ?, ?)',
+            ((f"old{i}", f"Old token {i}", rng.randint(1_000, 10_000_000), 'bench',
+              now - (rng.randrange(86400) if i % 2 else rng.randrange(86400, 30 * 86400))) for i in range(token_count)))
+        active = max(token_count // 500, 1)
+        w.executemany(
+            'INSERT INTO market_updates (token_id, old_cap, new_cap, change_type, time) VALUES (?, ?, ?, ?, ?)',
+            ((f"old{rng.randrange(active)}", 0, rng.randint(1_000, 10_000_000), 'Increase', now - age)
+             for age in sorted((rng.randrange(7 * 86400) for _ in range(update_count)), reverse=True)))
+
+def ingest_while(bot, updates, work):
+    """Feed ingestion cycles while work() runs; returns (work seconds, writer timing summary)."""
+    bot.app.writer.wait()
+    bot.metrics = bot.Metrics()
+    done = threading.Event()
+    def feed():
+        for i in range(0, len(updates), CYCLE_SIZE):
+            if done.is_set():
+                break
+            bot.save_tokens(updates[i:i + CYCLE_SIZE], 'bench')
+            time.sleep(INGEST_PAUSE)
+    feeder = threading.Thread(target=feed)
+    feeder.start()
+    start = time.perf_counter()
+    work()
+    elapsed = time.perf_counter() - start
+    done.set()
+    feeder.join()
+    bot.app.writer.wait()
+    return elapsed, bot.metrics.snapshot()
+
+def describe(label, snapshot):
+    writes = snapshot['timings']['db_write_seconds']
+    print(f"{label:28} writer {writes['count']:>5} transactions  "
+          f"avg {writes['avg'] * 1000:>6.1f} ms  max {writes['max'] * 1000:>6.1f} ms")
+
+def main():
+    token_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    update_count = int(sys.argv[2]) if len(sys.argv) > 2 else 500_000
+    bot = load_bot()
+    bot.dispatcher.submit = lambda *args, **kwargs: None
+    populate(bot, token_count, update_count)
+    print(f"database {bot.database_size() / 1e6:,.1f} MB: {token_count:,} tokens, {update_count:,} market updates")
+
+    updates = make_updates(bot, 400_000)
+    _, baseline = ingest_while(bot, updates[:200_000], lambda: time.sleep(10))
+    describe("ingestion alone (10s)", baseline)
+
+    elapsed, during = ingest_while(bot, updates[200_000:], bot.run_maintenance)
+    describe(f"during maintenance ({elapsed:.0f}s)", during)
+    counters = during['counters']
+    print(f"rolled up {counters['maintenance.rows_rolled_up']:,} updates into "
+          f"{bot.app.db.query_one('SELECT COUNT(*) FROM market_updates_hourly')[0]:,} hourly rows, "
+          f"removed {counters['maintenance.tokens_removed']:,} tokens, "
+          f"reclaimed {counters['maintenance.bytes_reclaimed'] / 1e6:,.1f} MB, "
+          f"database now {bot.database_size() / 1e6:,.1f} MB")
+
+    # Ingestion reuses pages freed during the pass; with the feed stopped the space goes back to the filesystem
+    populate(bot, 0, update_count)
+    before = bot.database_size()
+    reclaimed = bot.run_maintenance()
+    print(f"quiet pass over another {update_count:,} old updates: reclaimed {reclaimed / 1e6:,.1f} MB, "
+          f"database {before / 1e6:,.1f} -> {bot.database_size() / 1e6:,.1f} MB")
+
+if __name__ == '__main__':
+    main()
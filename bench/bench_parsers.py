@@ -0,0 +1,193 @@
+"""Parser micro-benchmark: messages/second over the recorded channel corpus.
+
+Each channel's parser runs against the one it replaced: the baseline
+parsers below are the original bot's, one re.search per field, with their
+logging kept but without the database lookup and admin message
+parse_solearlytrending also did.
+
+Usage: python bench/bench_parsers.py [rounds]
+"""
+import logging
+import re
+import sys
+import time
+
+from common import load_bot, load_messages
+
+logger = logging.getLogger('bot')
+
+def baseline_token_info(text):
+    try:
+        # Extract token name
+        token_name = re.search(r'Token name:\s*💬\s*(.+)', text)
+        token_name = token_name.group(1).strip() if token_name else "Unknown"
+
+        # Extract other token information
+        token_id = re.search(r'Token ID:\s*(\S+)', text).group(1)
+        liq_percent = float(re.search(r'Liq %:\s*([\d.]+)%', text).group(1))
+        total_liq = float(re.search(r'Total Liq:\s*([\d.]+) SOL', text).group(1))
+        age = re.search(r'Age:\s*(.+)', text).group(1)
+        market_cap = int(re.search(r'Market Cap:\s*\$([\d,]+)', text).group(1).replace(',', ''))
+        bonding = float(re.search(r'Bonding %:\s*([\d.]+)%', text).group(1))
+
+        return {
+            "token_id": token_id,
+            "token_name": token_name,
+            "liq_percent": liq_percent,
+            "total_liq": total_liq,
+            "age": age,
+            "market_cap": market_cap,
+            "bonding": bonding
+        }
+    except Exception as e:
+        logger.error(f"❌ Error parsing token info: {e}")
+        return None
+
+def baseline_bullish_calls(text):
+    try:
+        name_match = re.search(r'Token:\s*(.+)', text)
+        token_name = name_match.group(1).strip() if name_match else "Unknown"
+
+        now_cap_match = re.search(r'Now:\s*([\d,]+\.?[\d]*)K', text)
+        market_cap = 0
+        if now_cap_match:
+            cap_str = now_cap_match.group(1).replace(',', '')
+            market_cap = int(float(cap_str) * 1000)
+
+        contract_match = re.search(r'Contract:\n*(\w+)', text)
+        token_id = contract_match.group(1).strip() if contract_match else None
+
+        if not token_id:
+            return None
+
+        return {
+            "token_id": token_id,
+            "token_name": token_name,
+            "market_cap": market_cap,
+            "total_liq": 0,
+            "liq_percent": 0,
+            "bonding": 0,
+            "age": "Unknown"
+        }
+    except Exception:
+        return None
+
+def baseline_solearlytrending(text):
+    try:
+        logger.info(f"🔍 Parsing solearlytrending message: {text[:200]}...")
+
+        token_url_match = re.search(r'📈\s*\[\*\*(.+?)\*\*\]\((https://www\.geckoterminal\.com/solana/pools/(\w+))\)', text)
+        if not token_url_match:
+            token_url_match = re.search(r'📈\s*\s*(.+?)\s*\((https://www\.geckoterminal\.com/solana/pools/(\w+))\)', text)
+            if not token_url_match:
+                token_url_match = re.search(r'🔥\s*(.+?)\s*\(https://t\.me/soul_sniper_bot\?start=15_(\w+)\)', text)
+                if not token_url_match:
+                    logger.warning("⚠️ Could not find token name or URL in message")
+                    return None
+
+        token_name = token_url_match.group(1).strip()
+        contract_address = token_url_match.group(2) if len(token_url_match.groups()) == 2 else token_url_match.group(3)
+        logger.info(f"✅ Found token: {token_name} with contract: {contract_address}")
+
+        mc_match = re.search(r'💰 MC: \$([\d,]+)', text)
+        if mc_match:
+            new_cap = int(float(mc_match.group(1).replace(',', '')))
+            old_cap = 0
+            logger.info(f"✅ Found market cap: ${new_cap:,}")
+        else:
+            new_format_match = re.search(r'MC: \$([\d,]+).*?🔝 \$([\d,]+\.?[\d]*)K', text)
+            if new_format_match:
+                old_cap = int(float(new_format_match.group(1).replace(',', '')))
+                new_cap = int(float(new_format_match.group(2).replace(',', '')) * 1000)
+                logger.info(f"✅ Found market cap in new format: ${old_cap:,} —> ${new_cap:,}")
+            else:
+                mega_kilo_match = re.search(r'\$([\d,]+\.?[\d]*)([KM])\s*—>\s*\$([\d,]+\.?[\d]*)([KM])', text)
+                if mega_kilo_match:
+                    old_cap = float(mega_kilo_match.group(1).replace(',', ''))
+                    old_cap *= 1000 if mega_kilo_match.group(2) == 'K' else 1000000
+                    new_cap = float(mega_kilo_match.group(3).replace(',', ''))
+                    new_cap *= 1000 if mega_kilo_match.group(4) == 'K' else 1000000
+                    old_cap = int(old_cap)
+                    new_cap = int(new_cap)
+                    logger.info(f"✅ Found market cap in $K —> $M format: ${old_cap:,} —> ${new_cap:,}")
+                else:
+                    cap_match = re.search(r'\*\*\$([\d,]+\.?[\d]*)K\*\*\s*—>\s*\*\*\$([\d,]+\.?[\d]*)K\*\*', text)
+                    if not cap_match:
+                        cap_match = re.search(r'\$([\d,]+\.?[\d]*)K\s*—>\s*\$([\d,]+\.?[\d]*)K', text)
+                    if not cap_match:
+                        cap_match = re.search(r'\$([\d,]+\.?[\d]*)K\s*—>\s*\$([\d,]+\.?[\d]*)K\s*💵', text)
+
+                    old_cap = 0
+                    new_cap = 0
+                    if cap_match:
+                        old_cap = int(float(cap_match.group(1).replace(',', '')) * 1000)
+                        new_cap = int(float(cap_match.group(2).replace(',', '')) * 1000)
+                        logger.info(f"✅ Found market cap: ${old_cap:,} —> ${new_cap:,}")
+                    else:
+                        logger.warning("⚠️ Could not find market cap in message")
+
+        percent_change = 0
+        if old_cap > 0 and new_cap > 0:
+            percent_change = int(((new_cap - old_cap) / old_cap) * 100)
+            logger.info(f"✅ Calculated percentage change: {percent_change}%")
+        else:
+            percent_match = re.search(r'is up\s*\*\*(\d+(?:\.\d+)?)X?\*\*', text)
+            if not percent_match:
+                percent_match = re.search(r'is up\s*(\d+(?:\.\d+)?)X?', text)
+            if percent_match:
+                percent_str = percent_match.group(1)
+                percent_change = int(float(percent_str) * 100) if 'X' in text else int(float(percent_str))
+                logger.info(f"✅ Found percentage change in message: {percent_change}%")
+
+        return {
+            "token_id": contract_address,
+            "token_name": token_name,
+            "market_cap": new_cap,
+            "total_liq": 0,
+            "liq_percent": 0,
+            "bonding": 0,
+            "age": "Unknown",
+            "percent_change": percent_change
+        }
+    except Exception as e:
+        logger.error(f"❌ Error parsing solearlytrending info: {e}")
+        return None
+
+# Which parser the original bot picked for each channel
+BASELINE = {'BullishCallsPremium': baseline_bullish_calls, 'solearlytrending': baseline_solearlytrending}
+
+def throughput(parser, texts, rounds):
+    """(messages/second, seconds, messages parsed) for one parser over a channel's texts."""
+    parsed = sum(1 for text in texts if parser(text))
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for text in texts:
+            parser(text)
+    elapsed = time.perf_counter() - start
+    return rounds * len(texts) / elapsed, elapsed, parsed
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    bot = load_bot()
+    messages = load_messages()
+
+    by_channel = {}
+    for channel, text in messages:
+        by_channel.setdefault(channel, []).append(text)
+
+    total_count = 0
+    totals = {'baseline': 0.0, 'current': 0.0}
+    print(f"{'':22} {'baseline':>14}  {'current':>14}")
+    for channel, texts in sorted(by_channel.items()):
+        old_rate, old_elapsed, old_parsed = throughput(BASELINE.get(channel, baseline_token_info), texts, rounds)
+        rate, elapsed, parsed = throughput(bot.app.sources.parser(channel), texts, rounds)
+        total_count += rounds * len(texts)
+        totals['baseline'] += old_elapsed
+        totals['current'] += elapsed
+        print(f"{channel:22} {old_rate:>7,.0f} msgs/s  {rate:>7,.0f} msgs/s  "
+              f"({old_parsed} -> {parsed}/{len(texts)} parsed, {rate / old_rate:.1f}x)")
+    print(f"{'total':22} {total_count / totals['baseline']:>7,.0f} msgs/s  {total_count / totals['current']:>7,.0f} msgs/s  "
+          f"({totals['baseline'] / totals['current']:.1f}x)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Query benchmark for the token tables at a million rows.
+
+Fills a fresh database with TOKENS tokens and UPDATES market_updates rows,
+then times each hot query against its index and against a forced full scan
+(NOT INDEXED / plain LIKE), which is how the same query ran before the
+indexes existed.
+
+Usage: python bench/bench_queries.py [tokens] [updates]
+"""
+import random
+import sys
+import time
+
+from common import load_bot
+
+CHANNELS = ['early100xgems', 'BullishCallsPremium', 'solearlytrending', 'dexscreener']
+WORDS = ['pepe', 'moon', 'cat', 'doge', 'wif', 'bonk', 'chad', 'frog', 'ape', 'sol', 'giga', 'nyan', 'goat']
+
+def populate(bot, token_count, update_count):
+    rng = random.Random(3)
+    now = int(time.time())
+    with bot.app.db.write() as w:
+        w.executemany(
+            'INSERT INTO tokens (token_id, token_name, market_cap, channel_name, updated_at) VALUES (?, ?, ?, ?, ?)',
+            ((f"tok{i}", f"{rng.choice(WORDS)} {rng.choice(WORDS)} {i}", rng.randint(1_000, 10_000_000),
+              rng.choice(CHANNELS), now) for i in range(token_count)))
+        w.executemany(
+            'INSERT INTO market_updates (token_id, old_cap, new_cap, change_type, time) VALUES (?, ?, ?, ?, ?)',
+            ((f"tok{rng.randrange(token_count)}", 0, rng.randint(1_000, 10_000_000), 'Increase',
+              now - rng.randrange(7 * 86400)) for _ in range(update_count)))
+
+def timed(bot, sql, params_list):
+    start = time.perf_counter()
+    for params in params_list:
+        bot.app.db.query(sql, params)
+    return (time.perf_counter() - start) / len(params_list) * 1000
+
+def main():
+    token_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    update_count = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000
+    bot = load_bot()
+
+    start = time.perf_counter()
+    populate(bot, token_count, update_count)
+    print(f"populated {token_count:,} tokens and {update_count:,} market updates in {time.perf_counter() - start:.1f}s")
+
+    rng = random.Random(4)
+    since = int(time.time()) - 3600
+    history = [(f"tok{rng.randrange(token_count)}", since) for _ in range(200)]
+    names = [(f"{rng.choice(WORDS)} {rng.choice(WORDS)} {rng.randrange(token_count)}",) for _ in range(20)]
+    channels = [(channel,) for channel in CHANNELS]
+
+    cases = [
+        ("cap history of one token (last hour)",
+         'SELECT new_cap, time FROM market_updates WHERE token_id = ? AND time >= ? ORDER BY time',
+         'SELECT new_cap, time FROM market_updates NOT INDEXED WHERE token_id = ? AND time >= ? ORDER BY time',
+         history, history),
+        ("token name match (check_token_match)",
+         '''SELECT token_id, market_cap, channel_name FROM tokens
+            WHERE rowid IN (SELECT rowid FROM tokens_name_fts WHERE tokens_name_fts MATCH ?)
+            AND channel_name = 'solearlytrending' LIMIT 1''',
+         '''SELECT token_id, market_cap, channel_name FROM tokens
+            WHERE token_name LIKE ? AND channel_name = 'solearlytrending' ''',
+         [(f'"{name}"',) for (name,) in names], [(f"%{name}%",) for (name,) in names[:5]]),
+        ("tokens per channel",
+         'SELECT COUNT(*) FROM tokens WHERE channel_name = ?',
+         'SELECT COUNT(*) FROM tokens NOT INDEXED WHERE channel_name = ?',
+         channels, channels),
+    ]
+    for label, indexed_sql, scan_sql, indexed_params, scan_params in cases:
+        indexed = timed(bot, indexed_sql, indexed_params)
+        scan = timed(bot, scan_sql, scan_params)
+        print(f"{label:40} indexed {indexed:>9.3f} ms   full scan {scan:>9.3f} ms   ({scan / indexed:,.0f}x)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Alert rendering benchmark: Markdown escaping, template rendering and fan-out.
+
+- corpus: token names the parsers pull out of the recorded messages, plus a
+  copy of each with one of _ * ` [ in the middle (as in DOGE_KING), and how
+  many alerts for them would break legacy Markdown with and without escaping
+  (checked with a rough version of Telegram's parser)
+- escape / render: escape_markdown() per name, and the increase alert built
+  with the old f-string against INCREASE_ALERT.render()
+- fan-out: alerts through notify() -> deliver() to --subscribers subscribers,
+  counting how often a message is rendered against how often it is sent
+
+Usage: python bench/bench_render.py [--rounds N] [--subscribers N]
+"""
+import argparse
+import time
+
+from common import load_bot, load_messages
+
+def markdown_ok(text):
+    """Roughly what Telegram's legacy Markdown parser accepts: every _ * ` entity closed, [ starts a link."""
+    entity = None
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if entity == '`':
+            if char == '`':
+                entity = None
+        elif char == '\\' and entity is None and text[i + 1:i + 2] in ('_', '*', '`', '['):
+            i += 1
+        elif char in '_*`':
+            if entity is None:
+                entity = char
+            elif entity == char:
+                entity = None
+        elif char == '[' and entity is None:
+            close = text.find('](', i)
+            if close < 0 or text.find(')', close) < 0:
+                return False
+            i = text.find(')', close)
+        i += 1
+    return entity is None
+
+def f_string_alert(fields):
+    """The increase alert as it used to be built, with nothing escaped."""
+    return (
+        f"{fields['rule']}!\n\n"
+        f"🪙 Token: {fields['token_name']}\n"
+        f"📊 Market Cap Update:\n"
+        f"📉 Previous: ${fields['old_cap']:,}\n"
+        f"📈 Updated: ${fields['market_cap']:,}\n"
+        f"📈 Increase: +{fields['percent_increase']:.1f}%\n"
+        f"⏱️ Age: {fields['age']}\n"
+        f"⏱️ Time since last update: {fields['minutes_since_update']:.1f} minutes\n"
+        f"{fields['movement']}\n"
+        f"🔗 Contract: `{fields['token_id']}`\n\n"
+        f"🔍 Check on GeckoTerminal:\n"
+        f"https://www.geckoterminal.com/solana/pools/{fields['token_id']}"
+    )
+
+def per_call(func, items, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for item in items:
+            func(item)
+    return (time.perf_counter() - start) / (rounds * len(items)) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--subscribers', type=int, default=1000)
+    args = parser.parse_args()
+    bot = load_bot()
+
+    updates = [data for channel, text in load_messages()
+               if channel in bot.app.sources.channels() and (data := bot.parse_message(channel, text))]
+    # Same tokens again with a Markdown character in the name
+    updates += [bot.TokenUpdate(token_id=data.token_id, market_cap=data.market_cap,
+                                token_name=data.token_name[:len(data.token_name) // 2] + '_*`['[i % 4]
+                                + data.token_name[len(data.token_name) // 2:])
+                for i, data in enumerate(updates)]
+    names = [data.token_name for data in updates]
+    fields = [{'rule': '🚀 2x Alert', 'token_name': data.token_name, 'token_id': data.token_id,
+               'old_cap': max(data.market_cap // 2, 1), 'market_cap': data.market_cap, 'percent_increase': 100.0,
+               'age': '12m', 'minutes_since_update': 3.5,
+               'movement': '🏎️ Velocity: 1m +4.1%/min, 5m +2.0%/min, 15m +0.9%/min'} for data in updates]
+    broken = sum(1 for item in fields if not markdown_ok(f_string_alert(item)))
+    still_broken = sum(1 for item in fields if not markdown_ok(bot.INCREASE_ALERT.render(item)))
+    special = sum(1 for name in names if name != bot.escape_markdown(name))
+    print(f"corpus: {len(names):,} token names, {special} with Markdown characters")
+    print(f"  alerts Telegram would reject: {broken} unescaped, {still_broken} rendered from the template")
+
+    print(f"escape_markdown          {per_call(bot.escape_markdown, names, args.rounds):6.2f} us/name")
+    print(f"increase alert f-string  {per_call(f_string_alert, fields, args.rounds):6.2f} us/message (nothing escaped)")
+    print(f"INCREASE_ALERT.render    {per_call(bot.INCREASE_ALERT.render, fields, args.rounds):6.2f} us/message")
+
+    renders = 0
+    render = bot.Notification.render
+
+    def counted(notification):
+        nonlocal renders
+        renders += 1
+        return render(notification)
+
+    bot.Notification.render = counted
+    sends = 0
+
+    def submit(message, recipients=None, prune=True, key=None):
+        nonlocal sends
+        sends += len(recipients or ())
+
+    bot.dispatcher.submit = submit
+    for chat_id in range(args.subscribers):
+        bot.subscriber_index.put(bot.SubscriberPrefs(chat_id + 1))
+    bot.coalescer.window = 0
+    alerts = [bot.Notification(item['token_id'], 'early100xgems', bot.INCREASE_ALERT, item,
+                               market_cap=item['market_cap'], multiplier=2.0) for item in fields]
+    start = time.perf_counter()
+    bot.notify(alerts)
+    elapsed = time.perf_counter() - start
+    print(f"fan-out: {len(alerts):,} alerts to {args.subscribers:,} subscribers: {renders:,} renders for "
+          f"{sends:,} sends ({elapsed / len(alerts) * 1e6:.0f} us/alert to route and render)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Subscriber routing benchmark: indexed routing vs checking every subscriber's filters.
+
+Builds a subscriber base where most people keep the defaults and the rest
+set a min cap, a min multiplier, a couple of sources and/or mute hours,
+then routes random alerts both ways and checks they pick the same people.
+
+Usage: python bench/bench_routing.py [subscribers] [alerts]
+"""
+import random
+import sys
+import time
+
+from common import load_bot
+
+def random_prefs(bot, rng, user_id):
+    prefs = bot.SubscriberPrefs(user_id)
+    if rng.random() < 0.6:
+        return prefs
+    prefs.min_cap = rng.choice([0, 50_000, 100_000, 250_000, 1_000_000])
+    prefs.min_multiplier = rng.choice([0, 0, 1.5, 2, 3])
+    if rng.random() < 0.5:
+        prefs.sources = frozenset(rng.sample(sorted(bot.alert_sources().values()), rng.randint(1, 2)))
+    if rng.random() < 0.3:
+        prefs.mute_start = rng.randrange(24)
+        prefs.mute_end = (prefs.mute_start + rng.randint(4, 10)) % 24
+    return prefs
+
+def naive_route(subscribers, market_cap, multiplier, sources, hour):
+    return [prefs.user_id for prefs, muted_hours in subscribers
+            if market_cap >= prefs.min_cap and multiplier >= prefs.min_multiplier
+            and (prefs.sources is None or not prefs.sources.isdisjoint(sources))
+            and hour not in muted_hours]
+
+def main():
+    subscriber_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    alert_count = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    bot = load_bot()
+    rng = random.Random(42)
+    prefs_list = [random_prefs(bot, rng, user_id) for user_id in range(subscriber_count)]
+    for prefs in prefs_list:
+        bot.subscriber_index.put(prefs)
+    names = sorted(bot.alert_sources().values())
+    alerts = [(rng.choice([20_000, 80_000, 300_000, 2_000_000]), rng.choice([0, 1.2, 2.5, 4]),
+               rng.sample(names, rng.randint(1, 2)), rng.randrange(24)) for _ in range(alert_count)]
+
+    start = time.perf_counter()
+    bot.subscriber_index.route(0, 0, [])  # first call builds the index
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    indexed = [bot.subscriber_index.route(*alert) for alert in alerts]
+    indexed_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    subscribers = [(prefs, frozenset(prefs.muted_hours())) for prefs in prefs_list]
+    naive = [naive_route(subscribers, *alert) for alert in alerts]
+    naive_time = time.perf_counter() - start
+
+    assert all(sorted(a) == sorted(b) for a, b in zip(indexed, naive))
+    fanout = sum(map(len, indexed)) / alert_count
+    print(f"{subscriber_count:,} subscribers, {alert_count:,} alerts, average fan-out {fanout:,.0f} "
+          f"({fanout / subscriber_count:.0%} of subscribers), index build {build * 1000:.1f} ms")
+    print(f"indexed routing {indexed_time / alert_count * 1000:8.3f} ms/alert")
+    print(f"scan all        {naive_time / alert_count * 1000:8.3f} ms/alert")
+
+if __name__ == '__main__':
+    main()
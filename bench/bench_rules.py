@@ -0,0 +1,112 @@
+"""Alert rule evaluation benchmark: cost per update with hundreds of rules and thousands of tokens.
+
+Builds RULES random rules (channel filters, cap/age/liquidity thresholds,
+plain and windowed multipliers, once-rules) and streams UPDATES cap increases
+over TOKENS active tokens through RuleEngine.evaluate(). For comparison the
+same rules are also run by a naive interpreter that walks every rule dict
+on every update.
+
+Usage: python bench/bench_rules.py [rules] [tokens] [updates]
+"""
+import random
+import sys
+import time
+
+from common import load_bot
+
+CHANNELS = ['early100xgems', 'BullishCallsPremium', 'solearlytrending', 'dexscreener']
+
+def make_rules(count, rng):
+    rules = []
+    for i in range(count):
+        rule = {'name': f"rule {i}"}
+        if rng.random() < 0.7:
+            rule['channels'] = rng.sample(CHANNELS, rng.randint(1, 2))
+        if rng.random() < 0.5:
+            rule['min_cap'] = rng.choice([50_000, 100_000, 250_000, 1_000_000, 5_000_000])
+        if rng.random() < 0.3:
+            rule['max_age_minutes'] = rng.choice([5, 10, 30, 60])
+        if rng.random() < 0.3:
+            rule['min_liquidity'] = rng.choice([10, 50, 100])
+        rule['min_multiplier'] = rng.choice([1.5, 2, 3, 5, 10])
+        if rng.random() < 0.5:
+            rule['window_minutes'] = rng.choice([1, 5, 15])
+        if rng.random() < 0.3:
+            rule['once'] = True
+        rules.append(rule)
+    return rules
+
+def naive_match(specs, fired, channel, data, prev, age, history, now):
+    """Reference: interpret every rule spec on every update."""
+    for index, spec in enumerate(specs):
+        if spec.get('once') and index in fired:
+            continue
+        if spec.get('on', 'increase') != 'increase':
+            continue
+        if 'channels' in spec and channel not in spec['channels']:
+            continue
+        if 'min_cap' in spec and data.market_cap < spec['min_cap']:
+            continue
+        if 'max_age_minutes' in spec and age > spec['max_age_minutes']:
+            continue
+        if 'min_liquidity' in spec and data.total_liq < spec['min_liquidity']:
+            continue
+        if 'min_multiplier' in spec:
+            window = spec.get('window_minutes', 0) * 60
+            base = min(cap for seen_at, cap in history if seen_at >= now - window) if window else prev
+            if data.market_cap < base * spec['min_multiplier']:
+                continue
+        if spec.get('once'):
+            fired.add(index)
+        return index
+    return None
+
+def make_stream(bot, token_count, update_count, rng):
+    caps = {f"tok{i}": rng.randint(5_000, 50_000) for i in range(token_count)}
+    tokens = list(caps)
+    stream = []
+    for _ in range(update_count):
+        token_id = rng.choice(tokens)
+        prev = caps[token_id]
+        caps[token_id] = int(prev * rng.uniform(1.01, 1.6))
+        stream.append((rng.choice(CHANNELS), prev,
+                       bot.TokenUpdate(token_id=token_id, market_cap=caps[token_id], total_liq=rng.uniform(0, 150)),
+                       rng.randint(0, 90)))
+    return stream
+
+def main():
+    rule_count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    token_count = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    update_count = int(sys.argv[3]) if len(sys.argv) > 3 else 200_000
+    bot = load_bot()
+    rng = random.Random(7)
+    specs = make_rules(rule_count, rng)
+    stream = make_stream(bot, token_count, update_count, rng)
+
+    engine = bot.RuleEngine(specs, token_count * 2)
+    for channel, prev, data, age in stream[:token_count]:  # seed per-token state
+        engine.evaluate('increase', channel, data, prev, 0, age)
+    checked = sum(len(engine.candidates('increase', channel)) for channel, _, _, _ in stream) / len(stream)
+    start = time.perf_counter()
+    fired = sum(engine.evaluate('increase', channel, data, prev, 0, age) is not None
+                for channel, prev, data, age in stream)
+    compiled = (time.perf_counter() - start) / len(stream) * 1e6
+
+    histories = {}
+    fired_sets = {}
+    start = time.perf_counter()
+    naive_fired = 0
+    for channel, prev, data, age in stream:
+        now = int(time.time())
+        history = histories.setdefault(data.token_id, [])
+        history.append((now, data.market_cap))
+        naive_fired += naive_match(specs, fired_sets.setdefault(data.token_id, set()), channel, data, prev, age,
+                                   history, now) is not None
+    naive = (time.perf_counter() - start) / len(stream) * 1e6
+
+    print(f"{rule_count} rules, {token_count:,} tokens, {update_count:,} updates")
+    print(f"compiled + indexed  {compiled:>6.2f} us/update  ({checked:.0f} rules apply per update, {fired:,} alerts)")
+    print(f"naive interpreter   {naive:>6.2f} us/update  ({rule_count} rules walked per update, {naive_fired:,} alerts)")
+
+if __name__ == '__main__':
+    main()
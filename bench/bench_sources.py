@@ -0,0 +1,146 @@
+"""Source isolation benchmark: a flooding channel and a broken one next to a quiet one.
+
+"noisy" posts a burst of messages all at once, "quiet" posts one message
+for every 20 of the burst, and "broken" posts messages its parser chokes on.
+Reports how long the quiet channel's messages waited. The first run
+processes every update in arrival order, as the bot did before sources had
+their own queues. The second uses the per-source workers: the noisy queue
+overflows and that channel catches up on everything it dropped, a
+BACKFILL_LIMIT page per fetch, and the broken channel spends its error
+budget and is paused.
+
+Usage: python bench/bench_sources.py [burst]
+"""
+import asyncio
+import sys
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from telethon.tl.types import InputPeerChannel
+
+from common import load_bot, load_messages
+
+SOURCES = [
+    {'channel': 'noisy', 'parser': 'token_info', 'max_pending': 100},
+    {'channel': 'quiet', 'parser': 'token_info'},
+    {'channel': 'broken', 'parser': 'garbled'},
+]
+CHANNEL_IDS = {'noisy': 1, 'quiet': 2, 'broken': 3}
+
+def parse_garbled(text):
+    """A parser that raises on everything, like one left behind by a change of post format."""
+    raise ValueError("unexpected post format")
+
+class FakeEvent:
+    def __init__(self, channel, message):
+        self.chat = SimpleNamespace(username=channel)
+        self.message = message
+
+    async def get_chat(self):
+        return self.chat
+
+class FakeClient:
+    """Serves catch-up fetches from the messages posted so far."""
+
+    def __init__(self, posted):
+        self.posted = posted
+        self.fetches = 0
+
+    async def get_input_entity(self, username):
+        return InputPeerChannel(CHANNEL_IDS[username], 0)
+
+    async def get_messages(self, peer, min_id=0, limit=None, reverse=False):
+        self.fetches += 1
+        channel = next(name for name, channel_id in CHANNEL_IDS.items() if channel_id == peer.channel_id)
+        newer = [message for message in self.posted[channel] if message.id > min_id]
+        return newer[:limit] if reverse else list(reversed(newer))[:limit]
+
+def arrivals(texts, burst, offset):
+    """(channel, message) in arrival order; message ids continue from offset so each run sees new messages."""
+    events = []
+    for i in range(burst):
+        events.append(('noisy', SimpleNamespace(id=offset + i + 1, text=texts[i % len(texts)], edit_date=None)))
+        if i % 20 == 0:
+            events.append(('quiet', SimpleNamespace(id=offset + i + 1, text=texts[(i + 7) % len(texts)], edit_date=None)))
+        if i % 10 == 0:
+            events.append(('broken', SimpleNamespace(id=offset + i + 1, text=texts[(i + 3) % len(texts)], edit_date=None)))
+    return events
+
+def stamp(events):
+    now = datetime.now(timezone.utc)
+    for _, message in events:
+        message.date = now
+
+def quiet_waits(bot):
+    timing = bot.metrics.snapshot()['timings']['ingest_latency.quiet']
+    bot.metrics.timings.pop('ingest_latency.quiet')
+    return timing
+
+async def in_arrival_order(bot, events):
+    stamp(events)
+    for channel, message in events:
+        try:
+            bot.process_message(channel, message.text)
+        except ValueError:
+            pass
+        bot.record_latency(channel, message)
+        bot.set_last_message_id(channel, message.id)
+        await asyncio.sleep(0)
+
+async def per_source(bot, events):
+    posted = {channel: [] for channel in CHANNEL_IDS}
+    for channel, message in events:
+        posted[channel].append(message)
+    bot.app.client = client = FakeClient(posted)
+    for source in bot.app.sources:
+        bot.start_source(source)
+    stamp(events)
+    for channel, message in events:
+        await bot.on_channel_message(FakeEvent(channel, message))
+    deadline = time.monotonic() + 60
+    noisy = bot.app.sources.get('noisy')
+    while time.monotonic() < deadline and (noisy.behind or any(source.queue.qsize() for source in bot.app.sources)):
+        await asyncio.sleep(0.01)
+    return client.fetches
+
+def main():
+    burst = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    bot = load_bot()
+    bot.PARSERS['garbled'] = parse_garbled
+    bot.app.sources.configure(SOURCES)
+    bot.app.writer.start()
+    texts = [text for channel, text in load_messages() if channel == 'early100xgems']
+
+    start = time.perf_counter()
+    asyncio.run(in_arrival_order(bot, arrivals(texts, burst, 0)))
+    elapsed = time.perf_counter() - start
+    before = quiet_waits(bot)
+
+    # Fresh sources, so the budget spent by the first run doesn't carry over
+    bot.app.sources.configure([])
+    bot.app.sources.configure(SOURCES)
+    counters_before = bot.metrics.snapshot()['counters']
+    start = time.perf_counter()
+    fetches = asyncio.run(per_source(bot, arrivals(texts, burst, burst)))
+    elapsed_sources = time.perf_counter() - start
+    after = quiet_waits(bot)
+    counters = bot.metrics.snapshot()['counters']
+    counters = {name: count - counters_before.get(name, 0) for name, count in counters.items()}
+    noisy_processed = counters.get('parse_ok.noisy', 0) + counters.get('parse_failed.noisy', 0)
+    broken_done = sum(1 for channel, message in arrivals(texts, burst, burst)
+                      if channel == 'broken' and message.id <= bot.get_last_message_id('broken'))
+    bot.app.writer.close()
+
+    print(f"burst of {burst:,} noisy messages, {burst // 20} quiet, {burst // 10} broken")
+    print(f"arrival order      quiet waited p50 {before['p50'] * 1000:7.1f} ms  max {before['max'] * 1000:7.1f} ms  "
+          f"({elapsed:.2f}s for everything)")
+    print(f"per-source queues  quiet waited p50 {after['p50'] * 1000:7.1f} ms  max {after['max'] * 1000:7.1f} ms  "
+          f"({elapsed_sources:.2f}s for everything)")
+    print(f"  noisy overflowed {counters.get('source_overflows.noisy', 0)}x ({fetches} catch-up fetches in all): "
+          f"{noisy_processed:,} of {burst:,} processed (BACKFILL_LIMIT={bot.BACKFILL_LIMIT} per fetch)")
+    print(f"  broken paused {counters.get('source_paused.broken', 0)}x after {bot.SOURCE_ERROR_WINDOW} messages, "
+          f"{broken_done} of its {burst // 10} messages processed before the pause")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Startup benchmark: import, database open and launch-to-first-message, each in a fresh process.
+
+- import: `import bot` with an empty data dir (nothing may be created yet)
+- database: app.db on a fresh data dir (all migrations) and again on the
+  migrated one, plus loading the in-memory caches (open_storage)
+- cold start: main() with a fake Telegram client whose connect() takes
+  --connect-latency seconds and whose catch-up returns one corpus message;
+  reports cold_start_seconds, the time from the end of the imports until
+  that message is saved (the database opens while the client connects)
+
+Usage: python bench/bench_startup.py [--runs N] [--connect-latency SECONDS]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+from telethon.tl.types import InputPeerChannel
+
+from common import load_bot, load_messages
+
+class FakeClient:
+    """The TelegramClient calls main() and catch_up() make, served from memory."""
+
+    def __init__(self, latency, channel, text):
+        self.latency = latency
+        self.channel = channel
+        self.message = SimpleNamespace(id=1, text=text)
+
+    async def connect(self):
+        await asyncio.sleep(self.latency)
+
+    async def is_user_authorized(self):
+        return True
+
+    def is_connected(self):
+        return True
+
+    def add_event_handler(self, handler, event):
+        pass
+
+    def remove_event_handler(self, handler):
+        pass
+
+    async def get_input_entity(self, username):
+        return InputPeerChannel(hash(username) & 0xffffffff, 0)
+
+    async def get_messages(self, peer, min_id=0, limit=None, reverse=False):
+        return [self.message] if peer.channel_id == hash(self.channel) & 0xffffffff else []
+
+    async def run_until_disconnected(self):
+        pass
+
+    async def disconnect(self):
+        pass
+
+def child_import():
+    start = time.perf_counter()
+    bot = load_bot()
+    elapsed = time.perf_counter() - start
+    return {'import_seconds': elapsed, 'data_dir_created': os.path.exists(bot.DATA_DIR)}
+
+def child_database():
+    bot = load_bot()
+    start = time.perf_counter()
+    bot.app.db
+    fresh = time.perf_counter() - start
+    start = time.perf_counter()
+    bot.migrate(bot.Database(os.path.join(bot.DATA_DIR, 'token_data.db')))
+    migrated = time.perf_counter() - start
+    start = time.perf_counter()
+    bot.open_storage()
+    storage = time.perf_counter() - start
+    bot.app.writer.close()
+    return {'fresh_db_seconds': fresh, 'migrated_db_seconds': migrated, 'open_storage_seconds': storage}
+
+def child_cold_start(latency):
+    bot = load_bot()
+    channel, text = next((channel, text) for channel, text in load_messages()
+                         if channel in bot.app.sources.channels() and bot.parse_message(channel, text))
+    bot.app.client = FakeClient(latency, channel, text)
+    bot.app.bot = SimpleNamespace(polling=lambda: None)
+    asyncio.run(bot.main())
+    return {'cold_start_seconds': bot.metrics.snapshot()['timings']['cold_start_seconds']['max']}
+
+def run_child(mode, latency):
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', mode,
+                             '--connect-latency', str(latency)],
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--connect-latency', type=float, default=0.3, help='simulated Telegram connect time (seconds)')
+    parser.add_argument('--child', choices=['import', 'database', 'cold-start'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = {'import': child_import, 'database': child_database,
+                  'cold-start': lambda: child_cold_start(args.connect_latency)}[args.child]()
+        print(json.dumps(result))
+        return
+
+    runs = {mode: [run_child(mode, args.connect_latency) for _ in range(args.runs)]
+            for mode in ('import', 'database', 'cold-start')}
+
+    def median(mode, key):
+        return statistics.median(run[key] for run in runs[mode]) * 1000
+
+    created = any(run['data_dir_created'] for run in runs['import'])
+    print(f"median of {args.runs} fresh processes each")
+    print(f"import bot             {median('import', 'import_seconds'):8.1f} ms  "
+          f"(data dir {'CREATED' if created else 'untouched'})")
+    print(f"open fresh database    {median('database', 'fresh_db_seconds'):8.1f} ms  (all migrations)")
+    print(f"open migrated database {median('database', 'migrated_db_seconds'):8.1f} ms")
+    print(f"open_storage           {median('database', 'open_storage_seconds'):8.1f} ms  (writer, caches, index)")
+    print(f"cold start             {median('cold-start', 'cold_start_seconds'):8.1f} ms  "
+          f"imported -> first message saved, with a {args.connect_latency * 1000:.0f} ms connect")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Velocity benchmark: rolling 1m/5m/15m windows over many tokens, and /top over them.
+
+Simulates --minutes of market activity: --tokens tokens, each updated every
+few seconds to a couple of minutes (a random walk with drift, some tokens
+pumping), all through VelocityTracker.update(). Then asks for the top movers
+of each window and checks them against a brute-force recomputation
+from the raw samples.
+
+Usage: python bench/bench_velocity.py [--tokens N] [--minutes M]
+"""
+import argparse
+import heapq
+import math
+import random
+import time
+
+from common import load_bot
+
+def simulate(tokens, minutes, rng):
+    """(time, token_id, cap) updates in time order."""
+    start = 1_700_000_000
+    events = []
+    for i in range(tokens):
+        token_id = f"token{i}"
+        cap = rng.uniform(5_000, 500_000)
+        drift = rng.choice([0.0] * 8 + [0.02, 0.05])  # per update, a few tokens pump
+        gap = rng.choice([5, 15, 30, 60, 120])
+        t = start + rng.uniform(0, gap)
+        while t < start + minutes * 60:
+            cap *= math.exp(drift + rng.gauss(0, 0.03))
+            events.append((int(t), token_id, int(cap)))
+            t += rng.expovariate(1 / gap)
+    events.sort()
+    return events
+
+def brute_force_top(samples, now, window, count):
+    """Same definition as VelocityTracker, recomputed from every sample."""
+    rates = []
+    for token_id, history in samples.items():
+        seen_at, cap = history[-1]
+        if seen_at < now - window:
+            continue
+        older = [sample for sample in history if sample[0] <= seen_at - window]
+        base_at, base_cap = older[-1] if older else history[0]
+        if seen_at > base_at:
+            rates.append((math.log(cap / base_cap) / ((seen_at - base_at) / 60), token_id))
+    return [token_id for _, token_id in heapq.nlargest(count, rates)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tokens', type=int, default=50_000)
+    parser.add_argument('--minutes', type=int, default=30)
+    args = parser.parse_args()
+    bot = load_bot()
+    rng = random.Random(7)
+    events = simulate(args.tokens, args.minutes, rng)
+    tracker = bot.VelocityTracker(args.tokens)
+
+    start = time.perf_counter()
+    for seen_at, token_id, cap in events:
+        tracker.update(token_id, token_id, cap, seen_at)
+    elapsed = time.perf_counter() - start
+    now = events[-1][0]
+    print(f"{len(events):,} updates over {args.minutes} min for {args.tokens:,} tokens: "
+          f"{elapsed / len(events) * 1e6:.2f} us/update")
+
+    samples = {}
+    for seen_at, token_id, cap in events:
+        samples.setdefault(token_id, []).append((seen_at, cap))
+    for window, label in enumerate(bot.VELOCITY_LABELS):
+        runs = []
+        for _ in range(20):
+            start = time.perf_counter()
+            top = tracker.top(window, 10, now)
+            runs.append(time.perf_counter() - start)
+        active = sum(1 for history in samples.values() if history[-1][0] >= now - bot.VELOCITY_WINDOWS[window])
+        expected = brute_force_top(samples, now, bot.VELOCITY_WINDOWS[window], 10)
+        same = [movement.token_id for movement in top] == expected
+        print(f"/top {label:>3}  {sorted(runs)[len(runs) // 2] * 1000:6.2f} ms  ({active:,} tokens moved in the window, "
+              f"leader {top[0].percent_per_minute(window):+.1f}%/min, matches brute force: {same})")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+"""Shared setup for the benchmark scripts.
+
+Imports bot.py against a throwaway working directory and data dir so a
+benchmark run never touches the real database, session or log file.
+"""
+import json
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def load_bot():
+    workdir = tempfile.mkdtemp(prefix='bot-bench-')
+    os.environ['DATA_DIR'] = os.path.join(workdir, 'data')
+    # Placeholder credentials: nothing here talks to Telegram
+    os.environ.setdefault('API_ID', '1')
+    os.environ.setdefault('API_HASH', 'bench')
+    os.environ.setdefault('BOT_TOKEN', '1:bench')
+    os.environ.setdefault('ADMIN_ID', '1')
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    import bot
+    # Same log level and file as a real run so logging cost is part of the
+    # measurement, but don't flood the terminal
+    bot.configure_logging(console=False)
+    return bot
+
+def load_messages(path=None):
+    """Return the recorded corpus as a list of (channel, text) pairs."""
+    with open(path or os.path.join(BENCH_DIR, 'messages.jsonl'), encoding='utf-8') as f:
+        return [(item['channel'], item['text']) for item in map(json.loads, f)]
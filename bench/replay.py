@@ -0,0 +1,251 @@
+"""Replay harness: the recorded corpus through the whole parse -> save -> notify pipeline, offline.
+
+Channel messages (messages.jsonl) are fed to on_channel_message as fake
+Telethon events, and every so often an API payload (api_payloads.jsonl) is
+served to fetch_tokens_from_api by a fake HTTP session. Sends go to a fake
+TeleBot that only counts them, so the real token writer, rule engine,
+coalescer, subscriber routing, outbox and dispatcher threads all run.
+Every round after the first renames the corpus's contract addresses, so
+each round meets new tokens the way the first one does.
+
+Reports messages/s, alerts/s, DB write latency, log volume and peak memory. --json
+appends the results as one JSON line to a file; --compare prints the change
+against the last line of such a file, e.g. one written on another commit.
+
+Usage: python bench/replay.py [--rounds N] [--subscribers N] [--window SECONDS]
+                              [--json FILE] [--compare FILE]
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import resource
+import subprocess
+import threading
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from common import BENCH_DIR, ROOT, load_bot, load_messages
+
+B58 = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+
+class FakeEvent:
+    """Just enough of a Telethon NewMessage event for on_channel_message."""
+
+    def __init__(self, channel, message_id, text):
+        self.chat = SimpleNamespace(username=channel)
+        self.message = SimpleNamespace(id=message_id, text=text, date=datetime.now(timezone.utc), edit_date=None)
+
+    async def get_chat(self):
+        return self.chat
+
+class FakeResponse:
+    def __init__(self, payload, etag):
+        self.payload = payload
+        self.status_code = 200 if payload is not None else 304
+        self.headers = {'ETag': etag}
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+class FakeHttp:
+    """Serves the current payload, answering 304 when the caller already has it."""
+
+    def __init__(self):
+        self.payload = None
+        self.etag = None
+        self.requests = 0
+
+    def get(self, url, headers=None, timeout=None):
+        self.requests += 1
+        if headers and headers.get('If-None-Match') == self.etag:
+            return FakeResponse(None, self.etag)
+        return FakeResponse(self.payload, self.etag)
+
+class FakeTeleBot:
+    def __init__(self):
+        self.sent = 0
+        self.lock = threading.Lock()
+
+    def send_message(self, chat_id, text, parse_mode=None):
+        with self.lock:
+            self.sent += 1
+
+def load_corpus():
+    """Channel messages with the API polls spread evenly between them."""
+    messages = load_messages()
+    with open(os.path.join(BENCH_DIR, 'api_payloads.jsonl'), encoding='utf-8') as f:
+        polls = [json.loads(line)['api'] for line in f]
+    every = max(1, len(messages) // (len(polls) + 1))
+    corpus = []
+    for i, (channel, text) in enumerate(messages):
+        corpus.append(('message', channel, text))
+        if i % every == every - 1 and polls:
+            corpus.append(('api', None, polls.pop(0)))
+    return corpus
+
+ADDRESS_RE = re.compile(r'[1-9A-HJ-NP-Za-km-z]{32,44}')
+
+def render_rounds(bot, corpus, rounds):
+    """The corpus once per round, each round with its own contract addresses (rendered before timing starts)."""
+    token_ids = set()
+    for kind, channel, item in corpus:
+        if kind == 'message':
+            data = bot.parse_message(channel, item)
+            if data and data.token_id:
+                token_ids.add(data.token_id)
+        else:
+            token_ids.update(token['tokenId'] for token in item)
+
+    rendered = []
+    for round_number in range(rounds):
+        suffix = B58[round_number // 58 % 58] + B58[round_number % 58]
+        def rename(match):
+            address = match.group(0)
+            return address[:-2] + suffix if address in token_ids else address
+        for kind, channel, item in corpus:
+            if kind == 'message':
+                rendered.append((kind, channel, ADDRESS_RE.sub(rename, item) if round_number else item))
+            else:
+                rendered.append((kind, channel, json.loads(ADDRESS_RE.sub(rename, json.dumps(item)))
+                                 if round_number else item))
+    return rendered
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+async def replay(bot, items, http):
+    for source in bot.app.sources:
+        bot.start_source(source)
+    messages = polls = 0
+    for kind, channel, item in items:
+        if kind == 'message':
+            messages += 1
+            source = bot.app.sources.get(channel)
+            await bot.on_channel_message(FakeEvent(channel, messages, item))
+            # Telethon dispatches each update as its own task; let the source's worker take it
+            while source.queue.qsize():
+                await asyncio.sleep(0)
+        else:
+            polls += 1
+            http.payload = item
+            http.etag = f'"{polls}"'
+            await bot.fetch_tokens_from_api()
+    return messages, polls
+
+def drain(bot, timeout=120):
+    """Wait for the writer, the coalescer and the outbox to empty."""
+    deadline = time.monotonic() + timeout
+    bot.app.writer.wait()
+    while time.monotonic() < deadline:
+        if not bot.coalescer.pending and bot.dispatcher.alerts.empty() and not bot.dispatcher.backlog()[0]:
+            return True
+        time.sleep(0.02)
+    return False
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--subscribers', type=int, default=100)
+    parser.add_argument('--window', type=float, default=0.0, help='alert coalescing window (seconds)')
+    parser.add_argument('--json', help='append the results as a JSON line to this file')
+    parser.add_argument('--compare', help='compare with the last results line in this file')
+    args = parser.parse_args()
+    # load_bot() moves into a scratch directory, so pin relative paths first
+    args.json = args.json and os.path.abspath(args.json)
+    args.compare = args.compare and os.path.abspath(args.compare)
+
+    # Sends are fake, so don't let the Telegram rate limits set the pace
+    os.environ.setdefault('GLOBAL_SEND_RATE', '1000000')
+    os.environ.setdefault('PER_CHAT_SEND_INTERVAL', '0')
+    os.environ['ALERT_COALESCE_WINDOW'] = str(args.window)
+    bot = load_bot()
+    telebot = FakeTeleBot()
+    bot.app.bot.send_message = telebot.send_message
+    http = FakeHttp()
+    bot.app.http = http
+
+    with bot.app.db.write() as w:
+        w.executemany('INSERT INTO subscribers (user_id, username) VALUES (?, ?)',
+                      [(user_id, f"user{user_id}") for user_id in range(1000, 1000 + args.subscribers)])
+    bot.app.writer.start()
+    bot.subscriber_index.load()
+    bot.dispatcher.start()
+    bot.coalescer.start()
+
+    items = render_rounds(bot, load_corpus(), args.rounds)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    messages, polls = asyncio.run(replay(bot, items, http))
+    ingest = time.perf_counter() - start
+    drained = drain(bot)
+    total = time.perf_counter() - start
+
+    # Everything logged has been queued by now; let the listener write it out before measuring the file
+    while not bot.log_listener.queue.empty():
+        time.sleep(0.01)
+    with open(bot.LOG_FILE, 'rb') as f:
+        log = f.read()
+
+    snapshot = bot.metrics.snapshot()
+    counters = snapshot['counters']
+    writes = snapshot['timings'].get('db_write_seconds', {})
+    results = {
+        'revision': git_revision(),
+        'rounds': args.rounds,
+        'subscribers': args.subscribers,
+        'window': args.window,
+        'messages': messages,
+        'api_polls': polls,
+        'messages_per_sec': messages / ingest,
+        'alerts': counters.get('alerts_queued', 0),
+        'alerts_per_sec': counters.get('alerts_queued', 0) / total,
+        'sends': telebot.sent,
+        'sends_per_sec': telebot.sent / total,
+        'ingest_seconds': ingest,
+        'total_seconds': total,
+        'db_write_p50_ms': writes.get('p50', 0) * 1000,
+        'db_write_p95_ms': writes.get('p95', 0) * 1000,
+        'db_write_p99_ms': writes.get('p99', 0) * 1000,
+        'db_write_max_ms': writes.get('max', 0) * 1000,
+        'log_lines_per_message': log.count(b'\n') / messages,
+        'log_bytes_per_message': len(log) / messages,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'rss_growth_mb': (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024,
+    }
+
+    print(f"replayed {messages:,} messages and {polls} API polls ({args.rounds} rounds, "
+          f"{args.subscribers} subscribers, coalescing window {args.window:g}s) at {results['revision']}")
+    print(f"ingest          {results['messages_per_sec']:>10,.0f} messages/s  ({ingest:.2f}s)")
+    print(f"alerts          {results['alerts_per_sec']:>10,.0f} alerts/s    ({results['alerts']:,} alerts, "
+          f"{telebot.sent:,} sends, {total:.2f}s until delivered{'' if drained else ', NOT fully drained'})")
+    print(f"db writes       p50 {results['db_write_p50_ms']:.2f} ms  p95 {results['db_write_p95_ms']:.2f} ms  "
+          f"p99 {results['db_write_p99_ms']:.2f} ms  max {results['db_write_max_ms']:.2f} ms")
+    print(f"log volume      {results['log_lines_per_message']:.2f} lines, "
+          f"{results['log_bytes_per_message']:,.0f} bytes per message")
+    print(f"peak memory     {results['peak_rss_mb']:.1f} MB RSS (+{results['rss_growth_mb']:.1f} MB during the replay)")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.loads(f.read().splitlines()[-1])
+        print(f"\ncompared with {baseline.get('revision')}:")
+        for key, value in results.items():
+            old = baseline.get(key)
+            if isinstance(value, float) and isinstance(old, (int, float)) and old:
+                print(f"  {key:18} {old:>12,.2f} -> {value:>12,.2f}  ({(value - old) / old:+.1%})")
+    if args.json:
+        with open(args.json, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(results) + '\n')
+
+if __name__ == '__main__':
+    main()
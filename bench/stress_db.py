@@ -0,0 +1,93 @@
+"""Concurrency stress test for the SQLite layer.
+
+Hammers /start and /stop from several bot-handler threads while ingestion
+keeps writing tokens and the dispatcher keeps reading the subscriber list,
+the same mix the live bot runs under. Fails (exit code 1) if any database
+error is logged or the final subscriber table doesn't match what the
+handler threads last did.
+
+Usage: python bench/stress_db.py [seconds]
+"""
+import logging
+import random
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+from common import load_bot
+
+class ErrorCounter(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.errors = []
+
+    def emit(self, record):
+        self.errors.append(record.getMessage())
+
+def main():
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    bot = load_bot()
+    errors = ErrorCounter()
+    logging.getLogger().addHandler(errors)
+    bot.app.bot.reply_to = lambda message, text: None
+
+    stop = threading.Event()
+    final_state = {}
+    counts = {'commands': 0, 'reads': 0, 'tokens': 0}
+
+    def subscriber_thread(user_ids):
+        rng = random.Random(user_ids[0])
+        while not stop.is_set():
+            user_id = rng.choice(user_ids)
+            message = SimpleNamespace(from_user=SimpleNamespace(id=user_id, username=f"user{user_id}"))
+            if rng.random() < 0.5:
+                bot.send_welcome(message)
+                final_state[user_id] = True
+            else:
+                bot.unsubscribe(message)
+                final_state[user_id] = False
+            counts['commands'] += 1
+
+    def ingestion_thread():
+        rng = random.Random(0)
+        while not stop.is_set():
+            updates = [bot.TokenUpdate(token_id=f"tok{rng.randrange(500)}", market_cap=rng.randint(1, 10**7),
+                                       created_at=int(time.time()) - 300) for _ in range(20)]
+            bot.save_tokens(updates, 'stress')
+            counts['tokens'] += len(updates)
+
+    def reader_thread():
+        while not stop.is_set():
+            rows = bot.app.db.query('SELECT user_id FROM subscribers')
+            assert all(isinstance(row[0], int) for row in rows)
+            bot.app.db.query_one('SELECT market_cap, updated_at, notified, created_at FROM tokens WHERE token_id = ?', ('tok1',))
+            counts['reads'] += 1
+
+    bot.dispatcher.submit = lambda *args, **kwargs: None
+    # Each handler thread owns its own users so the expected end state is well defined
+    threads = [threading.Thread(target=subscriber_thread, args=(list(range(n * 100, n * 100 + 50)),))
+               for n in range(4)]
+    threads += [threading.Thread(target=ingestion_thread), threading.Thread(target=reader_thread),
+                threading.Thread(target=reader_thread)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    bot.app.writer.wait()
+
+    expected = {user_id for user_id, subscribed in final_state.items() if subscribed}
+    actual = {row[0] for row in bot.app.db.query('SELECT user_id FROM subscribers')}
+    print(f"{counts['commands']:,} /start+/stop, {counts['reads']:,} read rounds, "
+          f"{counts['tokens']:,} token updates in {duration:.0f}s")
+    routed = set(bot.subscriber_index.prefs)
+    print(f"logged errors: {len(errors.errors)}, subscriber table consistent: {expected == actual}, "
+          f"routing index consistent: {routed == actual}")
+    for message in errors.errors[:5]:
+        print(f"  {message}")
+    sys.exit(0 if not errors.errors and expected == actual == routed else 1)
+
+if __name__ == '__main__':
+    main()
@@ -1,649 +1,3506 @@
-import re
-import asyncio
-import time
-import sqlite3
-import requests
-import os
-import logging
-import sys
-from datetime import datetime
-from telethon.sync import TelegramClient
-from telebot import TeleBot
-from dotenv import load_dotenv
-
-# Configure logging with UTF-8 encoding
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler('bot.log', encoding='utf-8')
-    ]
-)
-logger = logging.getLogger(__name__)
-
-# Load environment variables
-load_dotenv()
-
-# === CONFIG === #
-# Get environment variables
-API_ID = int(os.getenv('API_ID'))
-API_HASH = os.getenv('API_HASH')
-BOT_TOKEN = os.getenv('BOT_TOKEN')
-ADMIN_ID = int(os.getenv('ADMIN_ID'))
-CHANNEL_USERNAMES = ['early100xgems', 'BullishCallsPremium', 'solearlytrending']
-
-# Create data directory if it doesn't exist
-# Use a persistent volume path for Railway deployment
-DATA_DIR = os.getenv('DATA_DIR', '/mnt/volume/data') # Default to /mnt/volume/data for Railway
-# DATA_DIR = 'data' # Original local data directory
-if not os.path.exists(DATA_DIR):
-    os.makedirs(DATA_DIR)
-
-logger.info("🚀 Bot is starting...")
-logger.info("📡 Initializing connections...")
-
-# === INIT === #
-bot = TeleBot(BOT_TOKEN)
-client = TelegramClient('bot_session', API_ID, API_HASH)
-conn = sqlite3.connect(os.path.join(DATA_DIR, 'token_data.db'), check_same_thread=False)
-cursor = conn.cursor()
-
-logger.info("✅ Database connection established")
-logger.info("✅ Telegram client initialized")
-
-# === DB SETUP === #
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS tokens (
-    token_id TEXT PRIMARY KEY,
-    token_name TEXT,
-    market_cap INTEGER,
-    total_liq REAL,
-    liq_percent REAL,
-    bonding REAL,
-    age TEXT,
-    channel_name TEXT,
-    notified INTEGER DEFAULT 0,
-    time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-)
-''')
-
-# Add time column if it doesn't exist
-try:
-    cursor.execute('ALTER TABLE tokens ADD COLUMN time TIMESTAMP DEFAULT CURRENT_TIMESTAMP')
-    conn.commit()
-    logger.info("✅ Added time column to tokens table")
-except sqlite3.OperationalError as e:
-    if "duplicate column name" not in str(e):
-        logger.error(f"❌ Error adding time column: {e}")
-
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS market_updates (
-    token_id TEXT,
-    old_cap INTEGER,
-    new_cap INTEGER,
-    change_type TEXT,
-    time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-)
-''')
-
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS subscribers (
-    user_id INTEGER PRIMARY KEY,
-    username TEXT,
-    subscribed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-)
-''')
-conn.commit()
-
-logger.info("✅ Database tables created/verified")
-
-# === PARSER === #
-def parse_token_info(text):
-    try:
-        # Extract token name
-        token_name = re.search(r'Token name:\s*💬\s*(.+)', text)
-        token_name = token_name.group(1).strip() if token_name else "Unknown"
-
-        # Extract other token information
-        token_id = re.search(r'Token ID:\s*(\S+)', text).group(1)
-        liq_percent = float(re.search(r'Liq %:\s*([\d.]+)%', text).group(1))
-        total_liq = float(re.search(r'Total Liq:\s*([\d.]+) SOL', text).group(1))
-        age = re.search(r'Age:\s*(.+)', text).group(1)
-        market_cap = int(re.search(r'Market Cap:\s*\$([\d,]+)', text).group(1).replace(',', ''))
-        bonding = float(re.search(r'Bonding %:\s*([\d.]+)%', text).group(1))
-
-        return {
-            "token_id": token_id,
-            "token_name": token_name,
-            "liq_percent": liq_percent,
-            "total_liq": total_liq,
-            "age": age,
-            "market_cap": market_cap,
-            "bonding": bonding
-        }
-    except Exception as e:
-        logger.error(f"❌ Error parsing token info: {e}")
-        return None
-
-def parse_bullish_calls(text):
-    try:
-        # Extract token name
-        name_match = re.search(r'Token:\s*(.+)', text)
-        token_name = name_match.group(1).strip() if name_match else "Unknown"
-
-        # Extract current market cap (handles different formats like 51.1K, 114.4K)
-        now_cap_match = re.search(r'Now:\s*([\d,]+\.?[\d]*)K', text)
-        market_cap = 0
-        if now_cap_match:
-            cap_str = now_cap_match.group(1).replace(',', '')
-            market_cap = int(float(cap_str) * 1000)
-
-        # Extract contract address (handles newline after Contract:)
-        contract_match = re.search(r'Contract:\n*(\w+)', text)
-        token_id = contract_match.group(1).strip() if contract_match else None
-
-        if not token_id:
-            # print("⚠️ BullishCallsPremium: Could not find contract address")
-            return None
-
-        # print(f"✅ Parsed BullishCallsPremium: Token={token_name}, Cap=${market_cap:,}, Contract={token_id}")
-
-        return {
-            "token_id": token_id,
-            "token_name": token_name,
-            "market_cap": market_cap,
-            "total_liq": 0,  # Not available in this format
-            "liq_percent": 0,  # Not available in this format
-            "bonding": 0,      # Not available in this format
-            "age": "Unknown"   # Not available in this format
-        }
-    except Exception as e:
-        # print(f"❌ Error parsing bullish calls info: {e}")
-        return None
-
-def parse_solearlytrending(text):
-    try:
-        logger.info(f"🔍 Parsing solearlytrending message: {text[:200]}...")
-        
-        # Extract token name and contract address from URL
-        token_url_match = re.search(r'📈\s*\[\*\*(.+?)\*\*\]\((https://www\.geckoterminal\.com/solana/pools/(\w+))\)', text)
-        if not token_url_match:
-            # Try alternative format without bold name
-            token_url_match = re.search(r'📈\s*\s*(.+?)\s*\((https://www\.geckoterminal\.com/solana/pools/(\w+))\)', text)
-            if not token_url_match:
-                # Try new format with soul_sniper_bot
-                token_url_match = re.search(r'🔥\s*(.+?)\s*\(https://t\.me/soul_sniper_bot\?start=15_(\w+)\)', text)
-                if not token_url_match:
-                    logger.warning("⚠️ Could not find token name or URL in message")
-                    return None
-
-        token_name = token_url_match.group(1).strip()
-        contract_address = token_url_match.group(2) if len(token_url_match.groups()) == 2 else token_url_match.group(3)
-        logger.info(f"✅ Found token: {token_name} with contract: {contract_address}")
-
-        # Extract market cap
-        mc_match = re.search(r'💰 MC: \$([\d,]+)', text)
-        if mc_match:
-            new_cap_str = mc_match.group(1).replace(',', '')
-            new_cap = int(float(new_cap_str))
-            old_cap = 0  # For new format, we don't have old cap
-            logger.info(f"✅ Found market cap: ${new_cap:,}")
-        else:
-            # Try new format MC: $106,925 • 🔝 $119K
-            new_format_match = re.search(r'MC: \$([\d,]+).*?🔝 \$([\d,]+\.?[\d]*)K', text)
-            if new_format_match:
-                old_cap_str = new_format_match.group(1).replace(',', '')
-                new_cap_str = new_format_match.group(2).replace(',', '')
-                old_cap = int(float(old_cap_str))
-                new_cap = int(float(new_cap_str) * 1000)
-                logger.info(f"✅ Found market cap in new format: ${old_cap:,} —> ${new_cap:,}")
-            else:
-                # Try new format $80.3K —> $1.2M
-                mega_kilo_match = re.search(r'\$([\d,]+\.?[\d]*)([KM])\s*—>\s*\$([\d,]+\.?[\d]*)([KM])', text)
-                if mega_kilo_match:
-                    old_value_str = mega_kilo_match.group(1).replace(',', '')
-                    old_unit = mega_kilo_match.group(2)
-                    new_value_str = mega_kilo_match.group(3).replace(',', '')
-                    new_unit = mega_kilo_match.group(4)
-
-                    old_cap = float(old_value_str)
-                    if old_unit == 'K':
-                        old_cap *= 1000
-                    elif old_unit == 'M':
-                        old_cap *= 1000000
-
-                    new_cap = float(new_value_str)
-                    if new_unit == 'K':
-                        new_cap *= 1000
-                    elif new_unit == 'M':
-                        new_cap *= 1000000
-                        
-                    old_cap = int(old_cap)
-                    new_cap = int(new_cap)
-                    logger.info(f"✅ Found market cap in $K —> $M format: ${old_cap:,} —> ${new_cap:,}")
-                else:
-                    # Try old format market cap change
-                    cap_match = re.search(r'\*\*\$([\d,]+\.?[\d]*)K\*\*\s*—>\s*\*\*\$([\d,]+\.?[\d]*)K\*\*', text)
-                    if not cap_match:
-                        cap_match = re.search(r'\$([\d,]+\.?[\d]*)K\s*—>\s*\$([\d,]+\.?[\d]*)K', text)
-                    if not cap_match:
-                        cap_match = re.search(r'\$([\d,]+\.?[\d]*)K\s*—>\s*\$([\d,]+\.?[\d]*)K\s*💵', text)
-                    
-                    old_cap = 0
-                    new_cap = 0
-                    if cap_match:
-                        old_cap_str = cap_match.group(1).replace(',', '')
-                        new_cap_str = cap_match.group(2).replace(',', '')
-                        old_cap = int(float(old_cap_str) * 1000)
-                        new_cap = int(float(new_cap_str) * 1000)
-                        logger.info(f"✅ Found market cap: ${old_cap:,} —> ${new_cap:,}")
-                    else:
-                        logger.warning("⚠️ Could not find market cap in message")
-
-        # Calculate percentage change automatically
-        percent_change = 0
-        if old_cap > 0 and new_cap > 0:
-            percent_change = int(((new_cap - old_cap) / old_cap) * 100)
-            logger.info(f"✅ Calculated percentage change: {percent_change}%")
-        else:
-            # Try to get percentage from message if available
-            percent_match = re.search(r'is up\s*\*\*(\d+(?:\.\d+)?)X?\*\*', text)
-            if not percent_match:
-                percent_match = re.search(r'is up\s*(\d+(?:\.\d+)?)X?', text)
-            
-            if percent_match:
-                percent_str = percent_match.group(1)
-                if 'X' in text:
-                    percent_change = int(float(percent_str) * 100)
-                else:
-                    percent_change = int(float(percent_str))
-                logger.info(f"✅ Found percentage change in message: {percent_change}%")
-
-        # Check if this is a new token
-        cursor.execute("SELECT 1 FROM tokens WHERE token_id = ?", (contract_address,))
-        is_new_token = not cursor.fetchone()
-
-        # Send notification immediately for new token
-        msg = (
-            f"🚨 New Token Alert from Demo All Bot!\n\n"
-            f"🪙 Token: {token_name}\n"
-            f"📊 Market Cap Update:\n"
-            f"📉 Previous: ${old_cap:,}\n"
-            f"📈 Updated: ${new_cap:,}\n"
-            f"📈 Change: +{percent_change}%\n\n"
-            f"🔗 Contract: `{contract_address}`\n\n"
-            f"🔍 Check on GeckoTerminal:\n"
-            f"https://www.geckoterminal.com/solana/pools/{contract_address}"
-        )
-        bot.send_message(ADMIN_ID, msg, parse_mode="Markdown")
-
-        # If it's a new token, save it immediately
-        if is_new_token:
-            cursor.execute('''
-                INSERT INTO tokens (token_id, token_name, market_cap, total_liq, liq_percent, bonding, age, channel_name)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (contract_address, token_name, new_cap, 0, 0, 0, "Unknown", "solearlytrending"))
-            conn.commit()
-            logger.info(f"💾 New token saved immediately: {token_name} ({contract_address})")
-
-        return {
-            "token_id": contract_address,
-            "token_name": token_name,
-            "market_cap": new_cap,
-            "total_liq": 0,
-            "liq_percent": 0,
-            "bonding": 0,
-            "age": "Unknown",
-            "percent_change": percent_change
-        }
-    except Exception as e:
-        logger.error(f"❌ Error parsing solearlytrending info: {e}")
-        return None
-
-# === AGE CONVERTER === #
-def calculate_age(iso_timestamp):
-    try:
-        if not iso_timestamp:
-            return "Unknown"
-            
-        created_time = datetime.strptime(iso_timestamp, "%Y-%m-%dT%H:%M:%S.%fZ")
-        now = datetime.utcnow()
-        delta = now - created_time
-        minutes = int(delta.total_seconds() // 60)
-        return f"{minutes} minutes ago"
-    except Exception as e:
-        logger.error(f"❌ Error calculating age: {e}")
-        return "Unknown"
-
-# === API FETCH === #
-def fetch_tokens_from_api():
-    try:
-        logger.info("\n🔄 Fetching tokens from API...")
-        response = requests.get('https://api.dexscreener.com/token-profiles/latest/v1')
-        data = response.json()
-        logger.info(f"✅ Successfully fetched {len(data)} tokens from API")
-
-        for token in data:
-            try:
-                token_id = token.get('tokenId')
-                if not token_id:
-                    continue
-                    
-                market_cap = int(float(token.get('marketCapUsd', 0)))
-                total_liq = float(token.get('liquidity', {}).get('solAmount', 0))
-                liq_percent = float(token.get('liquidity', {}).get('solPercent', 0))
-                bonding = float(token.get('bondingRate', 0))
-                created_at = token.get('createdAt')
-
-                age = calculate_age(created_at)
-
-                token_data = {
-                    'token_id': token_id,
-                    'market_cap': market_cap,
-                    'total_liq': total_liq,
-                    'liq_percent': liq_percent,
-                    'bonding': bonding,
-                    'age': age
-                }
-                save_token(token_data, "solearlytrending")
-            except Exception as e:
-                logger.error(f"❌ Error processing token: {e}")
-                continue
-    except Exception as e:
-        logger.error(f"❌ API Fetch Error: {e}")
-
-# === DB INSERT / UPDATE === #
-def save_token(data, channel_name):
-    try:
-        if not data or not data.get('token_id'):
-            logger.warning("❌ Invalid token data, skipping...")
-            return
-            
-        cursor.execute("SELECT market_cap, time, notified, age FROM tokens WHERE token_id = ?", (data['token_id'],))
-        row = cursor.fetchone()
-        if row:
-            old_cap = row[0]
-            old_time = row[1]
-            notified = row[2]
-            old_age = row[3]
-            
-            # Only process if market cap has increased
-            if data['market_cap'] > old_cap:
-                # Calculate time difference
-                current_time = datetime.now()
-                time_diff = (current_time - datetime.strptime(old_time, "%Y-%m-%d %H:%M:%S")).total_seconds() / 60
-                
-                # Calculate age in minutes
-                age_in_minutes = 0
-                if data['age'] != "Unknown":
-                    try:
-                        age_match = re.search(r'(\d+)\s*minutes?', data['age'])
-                        if age_match:
-                            age_in_minutes = int(age_match.group(1))
-                    except:
-                        age_in_minutes = 0
-                
-                # Send notification if token is less than 10 minutes old or market cap has doubled
-                should_notify = False
-                notification_type = ""
-                
-                if age_in_minutes <= 10:
-                    should_notify = True
-                    notification_type = "🚨 New Token Alert (Under 10 minutes)"
-                elif data['market_cap'] >= old_cap * 2:
-                    should_notify = True
-                    notification_type = "🚀 Market Cap Doubled Alert"
-                
-                if should_notify:
-                    # Calculate percentage increase
-                    percent_increase = ((data['market_cap'] - old_cap) / old_cap) * 100
-                    
-                    # Prepare notification message
-                    notification_msg = (
-                        f"{notification_type}!\n\n"
-                        f"🪙 Token: {data.get('token_name', 'Unknown')}\n"
-                        f"📊 Market Cap Update:\n"
-                        f"📉 Previous: ${old_cap:,}\n"
-                        f"📈 Updated: ${data['market_cap']:,}\n"
-                        f"📈 Increase: +{percent_increase:.1f}%\n"
-                        f"⏱️ Age: {data['age']}\n"
-                        f"⏱️ Time since last update: {time_diff:.1f} minutes\n\n"
-                        f"🔗 Contract: `{data['token_id']}`\n\n"
-                        f"🔍 Check on GeckoTerminal:\n"
-                        f"https://www.geckoterminal.com/solana/pools/{data['token_id']}"
-                    )
-                    
-                    # Send notification to all subscribers
-                    send_notification_to_all(notification_msg)
-                    logger.info(f"📢 Sent {notification_type} for token {data['token_id']}")
-                
-                # Update token data
-                cursor.execute("""
-                    UPDATE tokens 
-                    SET market_cap = ?, token_name = ?, channel_name = ?, time = CURRENT_TIMESTAMP, age = ?
-                    WHERE token_id = ?
-                """, (data['market_cap'], data.get('token_name', 'Unknown'), channel_name, data['age'], data['token_id']))
-                
-                # Record this market cap value
-                cursor.execute("""
-                    INSERT INTO market_updates (token_id, old_cap, new_cap, change_type) 
-                    VALUES (?, ?, ?, ?)
-                """, (data['token_id'], old_cap, data['market_cap'], 'Increase'))
-            else:
-                logger.info(f"ℹ️ No market cap increase for token {data['token_id']}, skipping notification")
-        else:
-            # New token
-            cursor.execute('''
-                INSERT INTO tokens (token_id, token_name, market_cap, total_liq, liq_percent, bonding, age, channel_name, time)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-            ''', (data['token_id'], data.get('token_name', 'Unknown'), data['market_cap'], data['total_liq'], 
-                 data['liq_percent'], data['bonding'], data['age'], channel_name))
-            logger.info(f"💾 New token saved: {data.get('token_name', 'Unknown')} ({data['token_id']}) from {channel_name}")
-            
-            # Send notification for new token
-            notification_msg = (
-                f"🆕 New Token Alert!\n\n"
-                f"🪙 Token: {data.get('token_name', 'Unknown')}\n"
-                f"📊 Market Cap Update:\n"
-                f"📉 Previous: $0\n"
-                f"📈 Updated: ${data['market_cap']:,}\n"
-                f"⏱️ Age: {data['age']}\n\n"
-                f"🔗 Contract: `{data['token_id']}`\n\n"
-                f"🔍 Check on GeckoTerminal:\n"
-                f"https://www.geckoterminal.com/solana/pools/{data['token_id']}"
-            )
-            send_notification_to_all(notification_msg)
-            logger.info(f"📢 Sent new token notification for {data['token_id']}")
-            
-        conn.commit()
-    except Exception as e:
-        logger.error(f"❌ Error saving token: {e}")
-
-# === TOKEN MATCHING === #
-def check_token_match(token_name, token_id):
-    try:
-        # Search in solearlytrending channel for matching token name
-        cursor.execute("""
-            SELECT token_id, market_cap, channel_name 
-            FROM tokens 
-            WHERE token_name LIKE ? 
-            AND channel_name = 'solearlytrending'
-        """, (f"%{token_name}%",))
-        match = cursor.fetchone()
-        return match
-    except Exception as e:
-        logger.error(f"❌ Error checking token match: {e}")
-        return None
-
-def send_match_notification(token_data, match_data):
-    try:
-        msg = (
-            f"🎯 Token Match Found in solearlytrending!\n\n"
-            f"🪙 Token: {token_data['token_name']}\n"
-            f"🔗 Contract: `{token_data['token_id']}`\n\n"
-            f"📊 Market Cap Update:\n"
-            f"📈 New MC: ${token_data['market_cap']:,}\n"
-            f"💧 Liquidity: {token_data['total_liq']} SOL\n"
-            f"⏱️ Age: {token_data['age']}\n\n"
-            f"🚀 Potential 100x Gem!"
-        )
-        bot.send_message(ADMIN_ID, msg, parse_mode="Markdown")
-    except Exception as e:
-        logger.error(f"❌ Error sending match notification: {e}")
-
-# === BOT COMMANDS === #
-@bot.message_handler(commands=['start'])
-def send_welcome(message):
-    user_id = message.from_user.id
-    username = message.from_user.username
-    
-    # Add user to subscribers
-    try:
-        cursor.execute('''
-            INSERT OR IGNORE INTO subscribers (user_id, username)
-            VALUES (?, ?)
-        ''', (user_id, username))
-        conn.commit()
-        
-        welcome_msg = (
-            "👋 Welcome to the Market Cap Update Bot!\n\n"
-            "You will now receive notifications about market cap updates.\n"
-            "Use /stop to unsubscribe from notifications."
-        )
-        bot.reply_to(message, welcome_msg)
-    except Exception as e:
-        logger.error(f"❌ Error adding subscriber: {e}")
-
-@bot.message_handler(commands=['stop'])
-def unsubscribe(message):
-    user_id = message.from_user.id
-    
-    try:
-        cursor.execute('DELETE FROM subscribers WHERE user_id = ?', (user_id,))
-        conn.commit()
-        
-        stop_msg = "You have been unsubscribed from notifications. Use /start to subscribe again."
-        bot.reply_to(message, stop_msg)
-    except Exception as e:
-        logger.error(f"❌ Error removing subscriber: {e}")
-
-# === NOTIFICATION FUNCTION === #
-def send_notification_to_all(message):
-    try:
-        cursor.execute('SELECT user_id FROM subscribers')
-        subscribers = cursor.fetchall()
-        
-        for subscriber in subscribers:
-            try:
-                bot.send_message(subscriber[0], message, parse_mode="Markdown")
-            except Exception as e:
-                logger.error(f"❌ Error sending message to user {subscriber[0]}: {e}")
-                # Remove failed subscribers
-                cursor.execute('DELETE FROM subscribers WHERE user_id = ?', (subscriber[0],))
-                conn.commit()
-    except Exception as e:
-        logger.error(f"❌ Error sending notifications: {e}")
-
-# === MAIN LOOP === #
-async def main():
-    logger.info("\n🤖 Starting main loop...")
-    try:
-        await client.connect()
-        if not await client.is_user_authorized():
-            logger.warning("🔐 First time login required!")
-            logger.warning("Please enter your phone number with country code (e.g., +1234567890):")
-            phone = input()
-            await client.send_code_request(phone)
-            logger.warning("Enter the code you received: ")
-            code = input()
-            try:
-                await client.sign_in(phone, code)
-            except Exception as e:
-                if "password" in str(e).lower():
-                    logger.warning("🔒 Two-step verification is enabled. Please enter your password:")
-                    password = input()
-                    await client.sign_in(password=password)
-                else:
-                    raise e
-            logger.info("✅ Successfully authorized!")
-        
-        logger.info("✅ Telegram client started successfully")
-        
-        # Start the bot in a separate thread
-        import threading
-        bot_thread = threading.Thread(target=bot.polling, daemon=True)
-        bot_thread.start()
-        
-        while True:
-            try:
-                logger.info("\n⏳ Starting new iteration...")
-                
-                # Check solearlytrending channel first
-                try:
-                    channel = await client.get_entity('solearlytrending')
-                    logger.info("\n📢 Checking solearlytrending channel...")
-                    messages_count = 0
-                    async for message in client.iter_messages(channel, limit=5):  # Check last 5 messages
-                        messages_count += 1
-                        if message.text:
-                            logger.info(f"📥 Processing message from solearlytrending: {message.text[:200]}...")
-                            data = parse_solearlytrending(message.text)
-                            if data:
-                                logger.info(f"✅ Successfully parsed token from solearlytrending: {data['token_name']}")
-                                save_token(data, 'solearlytrending')
-                            else:
-                                logger.warning("❌ Failed to parse token from solearlytrending")
-
-                    if messages_count == 0:
-                        logger.warning("⚠️ No recent messages found in solearlytrending")
-                except Exception as e:
-                    logger.error(f"❌ Error accessing solearlytrending channel: {e}")
-
-                # Then check other channels
-                for username in [x for x in CHANNEL_USERNAMES if x != 'solearlytrending']:
-                    logger.info(f"\n📢 Checking channel: {username}")
-                    try:
-                        channel = await client.get_entity(username)
-                        messages_count = 0
-                        async for message in client.iter_messages(channel, limit=10):
-                            messages_count += 1
-                            if message.text:
-                                try:
-                                    data = None
-                                    if username == 'early100xgems':
-                                        data = parse_token_info(message.text)
-                                    elif username == 'BullishCallsPremium':
-                                        data = parse_bullish_calls(message.text)
-                                    else:
-                                        data = parse_token_info(message.text)
-                                        
-                                    if data:
-                                        save_token(data, username)
-                                except Exception as e:
-                                    logger.error(f"❌ Error processing message from {username}: {e}")
-                                    continue
-
-                        if messages_count == 0:
-                            logger.warning(f"⚠️ No recent messages found in {username}")
-
-                    except Exception as e:
-                        logger.error(f"❌ Error accessing channel {username}: {e}")
-                        continue
-                
-                logger.info("💤 Waiting for 60 seconds before next iteration...")
-                await asyncio.sleep(60)
-            except Exception as e:
-                logger.error(f"❌ Error in main loop: {e}")
-                logger.info("💤 Waiting 120 seconds before retry...")
-                await asyncio.sleep(60)
-    except Exception as e:
-        logger.error(f"❌ Error in main function: {e}")
-    finally:
-        await client.disconnect()
-        logger.info("✅ Client disconnected")
-
-# === RUN === #
-if __name__ == '__main__':
-    logger.info("\n🚀 Bot is ready to start!")
-    asyncio.run(main())
+import re
+import asyncio
+import time
+import sqlite3
+import requests
+import os
+import signal
+import logging
+import atexit
+import sys
+import threading
+import queue
+import itertools
+import heapq
+import bisect
+import hashlib
+import uuid
+import json
+import math
+import string
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field, replace
+from functools import cached_property
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import datetime, timezone
+from telethon.sync import TelegramClient
+from telethon import events
+from telethon.errors import ChannelInvalidError, ChannelPrivateError
+from telethon.tl.types import InputPeerChannel
+from telebot import TeleBot
+from telebot.apihelper import ApiTelegramException
+from dotenv import load_dotenv
+
+LAUNCHED = time.monotonic()  # cold start is measured from here; bench_startup.py times the imports on their own
+logger = logging.getLogger(__name__)
+
+# Pass as extra= on hot-path log calls: SamplingFilter lets one through per LOG_SAMPLE_INTERVAL
+SAMPLED = {'sampled': True}
+
+class SamplingFilter(logging.Filter):
+    """Rate-limits records logged with extra=SAMPLED to one per call site per interval.
+
+    The record that gets through says how many from the same call site were
+    dropped since the last one, so repetitive events still show their volume.
+    """
+
+    def __init__(self, interval):
+        super().__init__()
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.sites = {}  # (pathname, lineno) -> [next allowed time, records dropped since]
+
+    def filter(self, record):
+        if not getattr(record, 'sampled', False) or self.interval <= 0:
+            return True
+        key = (record.pathname, record.lineno)
+        with self.lock:
+            site = self.sites.get(key)
+            if site and record.created < site[0]:
+                site[1] += 1
+                return False
+            dropped = site[1] if site else 0
+            self.sites[key] = [record.created + self.interval, 0]
+        if dropped:
+            record.msg = f"{record.msg} (+{dropped} similar)"
+            record.dropped = dropped
+        return True
+
+# Attributes every LogRecord has; anything else on a record came in through extra=
+LOG_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'sampled'}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger and message, plus any extra= fields."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in LOG_RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+log_listener = None
+
+def configure_logging(console=True):
+    """Log to stdout and a rotating LOG_FILE through a queue; called by run(), not on import.
+
+    Logging calls only build the record and put it on the queue; the
+    listener thread does the formatting and the terminal and disk writes, so
+    none of that I/O happens on the event loop or the delivery threads.
+    """
+    global log_listener
+    if log_listener is not None:
+        return
+    if LOG_FORMAT == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    handlers = [RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')]
+    if console:
+        handlers.append(logging.StreamHandler(sys.stdout))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_INTERVAL))
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(queue_handler)
+    log_listener = QueueListener(log_queue, *handlers)
+    log_listener.start()
+    atexit.register(log_listener.stop)  # drains the queue before the process exits
+
+# Load environment variables
+load_dotenv()
+
+# === CONFIG === #
+# Get environment variables
+# Credentials are only checked when the Telegram clients are created, so importing never fails
+API_ID = os.getenv('API_ID')
+API_HASH = os.getenv('API_HASH')
+BOT_TOKEN = os.getenv('BOT_TOKEN')
+ADMIN_ID = int(os.getenv('ADMIN_ID') or 0)
+
+# Logging
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')  # 'text' or 'json' (one object per line)
+LOG_FILE = os.getenv('LOG_FILE', 'bot.log')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))  # rotate the log file at this size
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))  # rotated files kept
+LOG_SAMPLE_INTERVAL = float(os.getenv('LOG_SAMPLE_INTERVAL', '10'))  # seconds between repeats of a hot-path log line, 0 logs them all
+
+# Watched channels come from SOURCES_FILE (or DEFAULT_SOURCES) and can be changed without a restart
+SOURCES_FILE = os.getenv('SOURCES_FILE')  # JSON list of channel sources (see DEFAULT_SOURCES), unset = built-in sources
+SOURCES_RELOAD_INTERVAL = int(os.getenv('SOURCES_RELOAD_INTERVAL', '30'))  # seconds between checks of SOURCES_FILE for changes, 0 = only /reload
+SOURCE_ERROR_WINDOW = 50  # recent messages of a source its error budget is measured over
+SOURCE_PAUSE_SECONDS = int(os.getenv('SOURCE_PAUSE_SECONDS', '300'))  # how long a source over its error budget is ignored
+
+# Polling is only a catch-up path now; live messages arrive through event handlers
+CATCH_UP_INTERVAL = int(os.getenv('CATCH_UP_INTERVAL', '900'))  # seconds, 0 disables periodic catch-up
+RECONNECT_CHECK_INTERVAL = 5  # seconds between connection checks
+BACKFILL_LIMIT = int(os.getenv('BACKFILL_LIMIT', '200'))  # messages per get_messages call when catching up
+CHANNEL_FETCH_TIMEOUT = float(os.getenv('CHANNEL_FETCH_TIMEOUT', '30'))  # seconds per channel fetch; a slow channel is retried on the next catch-up
+PARSE_WORKERS = int(os.getenv('PARSE_WORKERS', '0'))  # parser processes for large backfills, 0 = use threads
+PARSE_BATCH_THRESHOLD = 50  # backfills smaller than this are parsed inline
+
+# Outgoing message limits (Telegram allows ~30 msgs/sec overall and ~1 msg/sec per chat)
+GLOBAL_SEND_RATE = float(os.getenv('GLOBAL_SEND_RATE', '25'))  # messages per second
+PER_CHAT_SEND_INTERVAL = float(os.getenv('PER_CHAT_SEND_INTERVAL', '1'))  # seconds between messages to one chat
+DELIVERY_WORKERS = int(os.getenv('DELIVERY_WORKERS', '8'))
+SEND_MAX_RETRIES = int(os.getenv('SEND_MAX_RETRIES', '5'))
+SEND_RETRY_BASE_DELAY = 2  # seconds, doubled on every retry
+OUTBOX_MAX_AGE = int(os.getenv('OUTBOX_MAX_AGE', '3600'))  # seconds; older unsent alerts are dropped on restart instead of sent
+OUTBOX_RETENTION_HOURS = int(os.getenv('OUTBOX_RETENTION_HOURS', '24'))  # delivered sends are kept this long to dedupe by key
+OUTBOX_ACK_INTERVAL = 0.2  # seconds between writes marking finished sends done in the outbox
+OUTBOX_ACK_BATCH = 200  # finished sends that trigger a write before the interval is up
+ALERT_RULES_FILE = os.getenv('ALERT_RULES_FILE')  # JSON list of alert rules (see DEFAULT_ALERT_RULES), unset = built-in rules
+ALERT_COALESCE_WINDOW = float(os.getenv('ALERT_COALESCE_WINDOW', '5'))  # seconds to merge one token's alerts across sources, 0 sends at once
+
+# DexScreener feed (polling is off unless API_POLL_INTERVAL is set)
+DEXSCREENER_URL = os.getenv('DEXSCREENER_URL', 'https://api.dexscreener.com/token-profiles/latest/v1')
+API_POLL_INTERVAL = int(os.getenv('API_POLL_INTERVAL', '0'))  # seconds, 0 disables the poller
+API_TIMEOUT = (5, 15)  # connect / read timeout in seconds
+
+DB_BUSY_TIMEOUT = float(os.getenv('DB_BUSY_TIMEOUT', '10'))  # seconds to wait on a locked database
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', '50000'))  # tokens kept in memory
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', str(6 * 3600)))  # seconds before a cached token is re-read
+
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))  # serve Prometheus metrics on 127.0.0.1:<port>/metrics, 0 disables
+
+MAINTENANCE_INTERVAL = int(os.getenv('MAINTENANCE_INTERVAL', '3600'))  # seconds between retention passes, 0 disables
+RAW_HISTORY_HOURS = int(os.getenv('RAW_HISTORY_HOURS', '24'))  # market updates older than this are rolled up hourly
+TOKEN_RETENTION_DAYS = int(os.getenv('TOKEN_RETENTION_DAYS', '7'))  # tokens not updated for this long are removed
+ROLLUP_RETENTION_DAYS = int(os.getenv('ROLLUP_RETENTION_DAYS', '90'))  # hourly rollups older than this are dropped
+ARCHIVE_DEAD_TOKENS = os.getenv('ARCHIVE_DEAD_TOKENS', '0') == '1'  # move removed tokens to tokens_archive instead of deleting
+MAINTENANCE_BATCH = 500  # rows per maintenance transaction, keeps each hold on the writer short
+VACUUM_STEP_PAGES = 256  # free pages released per incremental vacuum step
+MAINTENANCE_PAUSE = 0.01  # seconds between maintenance transactions so the writer can get in
+
+# Use a persistent volume path for Railway deployment (created when the database is first opened)
+DATA_DIR = os.getenv('DATA_DIR', '/mnt/volume/data') # Default to /mnt/volume/data for Railway
+# DATA_DIR = 'data' # Original local data directory
+
+# === DATABASE === #
+class Database:
+    """SQLite access shared by the event loop, the bot polling thread and the workers.
+
+    Every thread reads through its own connection, so cursors and fetchone()
+    results can never interleave between threads. All writes go through one
+    writer connection guarded by a lock, so there is only ever one writer and
+    "database is locked" can't happen between our own connections. WAL mode
+    lets readers keep going while the writer commits, and the busy timeout
+    covers anything else holding the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.write_lock = threading.RLock()
+        self.writer = self._connect()
+        self.writer.execute('PRAGMA journal_mode=WAL')
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=DB_BUSY_TIMEOUT, check_same_thread=False)
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def reader(self):
+        """This thread's read connection (opened on first use)."""
+        reader = getattr(self.local, 'conn', None)
+        if reader is None:
+            reader = self.local.conn = self._connect()
+        return reader
+
+    def query(self, sql, params=()):
+        return self.reader().execute(sql, params).fetchall()
+
+    def query_one(self, sql, params=()):
+        return self.reader().execute(sql, params).fetchone()
+
+    @contextmanager
+    def write(self):
+        """Serialized write transaction: commits on success, rolls back on error."""
+        with self.write_lock:
+            with self.writer:
+                yield self.writer
+
+# === APP === #
+class App:
+    """Handles to everything outside the process, each created on first use.
+
+    Importing the module opens nothing: app.db creates DATA_DIR, opens SQLite
+    and applies pending migrations the first time it is touched, app.bot and
+    app.client are only built when the bot actually runs. Tests and
+    benchmarks can import any function and only pay for what it uses (or
+    assign a fake, e.g. app.bot = FakeBot()).
+    """
+
+    has_name_index = False  # set when the database is opened
+
+    @cached_property
+    def db(self):
+        os.makedirs(DATA_DIR, exist_ok=True)
+        database = Database(os.path.join(DATA_DIR, 'token_data.db'))
+        migrate(database)
+        self.has_name_index = database.query_one("SELECT 1 FROM sqlite_master WHERE name = 'tokens_name_fts'") is not None
+        logger.info("✅ Database connection established")
+        return database
+
+    @cached_property
+    def writer(self):
+        return TokenWriter(self.db)
+
+    @cached_property
+    def bot(self):
+        telebot = TeleBot(BOT_TOKEN)
+        for handler, names in COMMANDS:
+            telebot.register_message_handler(handler, commands=names)
+        return telebot
+
+    @cached_property
+    def client(self):
+        telegram = TelegramClient('bot_session', int(API_ID), API_HASH)
+        logger.info("✅ Telegram client initialized")
+        return telegram
+
+    @cached_property
+    def http(self):
+        return create_http_session()
+
+    @cached_property
+    def rules(self):
+        return create_rule_engine()
+
+    @cached_property
+    def sources(self):
+        return create_source_registry()
+
+app = App()
+
+# Bot commands, registered on app.bot when it is created
+COMMANDS = []
+
+def command(*names):
+    def register(handler):
+        COMMANDS.append((handler, list(names)))
+        return handler
+    return register
+
+# === AGE CONVERTER === #
+# Ages are kept as creation epochs and only turned into text when a message is formatted
+AGE_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+AGE_PART_RE = re.compile(r'(\d+)\s*([smhd])', re.IGNORECASE)
+
+def created_from_age(text, now=None):
+    """Creation epoch from a relative age like '27m', '5 minutes' or '1h 5m' (None if unreadable)."""
+    parts = AGE_PART_RE.findall(text or '')
+    if not parts:
+        return None
+    seconds = sum(int(amount) * AGE_UNITS[unit.lower()] for amount, unit in parts)
+    return int(now or time.time()) - seconds
+
+def parse_created_at(iso_timestamp):
+    """Creation epoch from an API timestamp like '2024-01-01T12:00:00.000Z' (None if missing)."""
+    try:
+        if not iso_timestamp:
+            return None
+        created_time = datetime.strptime(iso_timestamp, "%Y-%m-%dT%H:%M:%S.%fZ")
+        return int(created_time.replace(tzinfo=timezone.utc).timestamp())
+    except Exception as e:
+        logger.error(f"❌ Error calculating age: {e}")
+        return None
+
+def format_age(created_at, now=None):
+    if not created_at:
+        return "Unknown"
+    return f"{int((now or time.time()) - created_at) // 60} minutes ago"
+
+# === DB SETUP === #
+def create_tables(database):
+    """Create any missing table in its current shape (a new database needs no other step)."""
+    with database.write() as w:
+        # created_at / updated_at are unix epochs (created_at NULL if unknown);
+        # age and time are the old text columns, no longer written
+        w.execute('''
+        CREATE TABLE IF NOT EXISTS tokens (
+            token_id TEXT PRIMARY KEY,
+            token_name TEXT,
+            market_cap INTEGER,
+            total_liq REAL,
+            liq_percent REAL,
+            bonding REAL,
+            age TEXT,
+            channel_name TEXT,
+            notified INTEGER DEFAULT 0,
+            time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            created_at INTEGER,
+            updated_at INTEGER
+        )
+        ''')
+
+    # Add time column if it doesn't exist (ALTER TABLE can't use a CURRENT_TIMESTAMP
+    # default, so existing rows are back-filled instead)
+    if 'time' not in [row[1] for row in database.query('PRAGMA table_info(tokens)')]:
+        with database.write() as w:
+            w.execute('ALTER TABLE tokens ADD COLUMN time TIMESTAMP')
+            w.execute('UPDATE tokens SET time = CURRENT_TIMESTAMP WHERE time IS NULL')
+        logger.info("✅ Added time column to tokens table")
+
+    with database.write() as w:
+        # Market cap history; time is a unix epoch (seconds)
+        w.execute('''
+        CREATE TABLE IF NOT EXISTS market_updates (
+            id INTEGER PRIMARY KEY,
+            token_id TEXT NOT NULL,
+            old_cap INTEGER,
+            new_cap INTEGER,
+            change_type TEXT,
+            time INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+        )
+        ''')
+
+        w.execute('''
+        CREATE TABLE IF NOT EXISTS subscribers (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            subscribed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            min_cap INTEGER NOT NULL DEFAULT 0,
+            min_multiplier REAL NOT NULL DEFAULT 0,
+            sources TEXT,  -- comma-separated source names, NULL = every source
+            mute_start INTEGER,  -- UTC hour, NULL = never muted
+            mute_end INTEGER
+        )
+        ''')
+
+        w.execute('''
+        CREATE TABLE IF NOT EXISTS outbox_alerts (
+            id INTEGER PRIMARY KEY,
+            alert_key TEXT NOT NULL UNIQUE,  -- idempotency key: a chat is only ever queued once per key
+            message TEXT NOT NULL,
+            prune INTEGER NOT NULL DEFAULT 1,
+            created_at INTEGER NOT NULL
+        )
+        ''')
+
+        # One row per (alert, chat), written before sending so a restart resumes the fan-out
+        w.execute('''
+        CREATE TABLE IF NOT EXISTS outbox (
+            alert_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            done_at INTEGER,  -- sent or given up; NULL = still to send
+            error TEXT,  -- why it was given up, NULL when sent
+            PRIMARY KEY (alert_id, chat_id)
+        ) WITHOUT ROWID
+        ''')
+
+        w.execute('''
+        CREATE TABLE IF NOT EXISTS channel_state (
+            channel_name TEXT PRIMARY KEY,
+            last_message_id INTEGER NOT NULL DEFAULT 0,
+            channel_id INTEGER,  -- resolved input peer, NULL until the channel is first resolved
+            access_hash INTEGER
+        )
+        ''')
+
+        # Hourly rollups of market updates past RAW_HISTORY_HOURS; hour is the epoch of the hour start
+        w.execute('''
+        CREATE TABLE IF NOT EXISTS market_updates_hourly (
+            token_id TEXT NOT NULL,
+            hour INTEGER NOT NULL,
+            min_cap INTEGER,
+            max_cap INTEGER,
+            last_cap INTEGER,
+            last_time INTEGER,
+            samples INTEGER NOT NULL,
+            PRIMARY KEY (token_id, hour)
+        ) WITHOUT ROWID
+        ''')
+
+        w.execute('''
+        CREATE TABLE IF NOT EXISTS tokens_archive (
+            token_id TEXT PRIMARY KEY,
+            token_name TEXT,
+            market_cap INTEGER,
+            total_liq REAL,
+            liq_percent REAL,
+            bonding REAL,
+            age TEXT,
+            channel_name TEXT,
+            notified INTEGER,
+            time TIMESTAMP,
+            created_at INTEGER,
+            updated_at INTEGER,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+
+def migrate_market_updates(database):
+    """Rebuild a pre-index market_updates table (TIMESTAMP text, no key) with epoch times."""
+    columns = [row[1] for row in database.query('PRAGMA table_info(market_updates)')]
+    if 'id' in columns:
+        return
+    logger.info("🔧 Migrating market_updates to integer timestamps...")
+    with database.write() as w:
+        w.execute('BEGIN')
+        w.execute('ALTER TABLE market_updates RENAME TO market_updates_old')
+        w.execute('''
+        CREATE TABLE market_updates (
+            id INTEGER PRIMARY KEY,
+            token_id TEXT NOT NULL,
+            old_cap INTEGER,
+            new_cap INTEGER,
+            change_type TEXT,
+            time INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+        )
+        ''')
+        w.execute('''
+        INSERT INTO market_updates (token_id, old_cap, new_cap, change_type, time)
+        SELECT token_id, old_cap, new_cap, change_type, COALESCE(CAST(strftime('%s', time) AS INTEGER), 0)
+        FROM market_updates_old
+        WHERE token_id IS NOT NULL
+        ORDER BY rowid
+        ''')
+        w.execute('DROP TABLE market_updates_old')
+    logger.info("✅ market_updates migrated")
+
+def migrate_token_times(database):
+    """Add the epoch created_at/updated_at columns and back-fill them from the old text time/age."""
+    for table in ('tokens', 'tokens_archive'):
+        columns = [row[1] for row in database.query(f'PRAGMA table_info({table})')]
+        if 'updated_at' in columns:
+            continue
+        logger.info(f"🔧 Migrating {table} to epoch timestamps...")
+        with database.write() as w:
+            w.execute('BEGIN')
+            w.execute(f'ALTER TABLE {table} ADD COLUMN created_at INTEGER')
+            w.execute(f'ALTER TABLE {table} ADD COLUMN updated_at INTEGER')
+            w.execute(f'''
+            UPDATE {table} SET updated_at = COALESCE(CAST(strftime('%s', time) AS INTEGER),
+                                                     CAST(strftime('%s', 'now') AS INTEGER))
+            ''')
+            # Stored ages ("27m", "5 minutes ago", "9 hours ago") are relative to the last update
+            rows = w.execute(f'SELECT rowid, age, updated_at FROM {table} WHERE age IS NOT NULL').fetchall()
+            w.executemany(f'UPDATE {table} SET created_at = ? WHERE rowid = ?',
+                          [(created_from_age(age, updated_at), rowid) for rowid, age, updated_at in rows])
+        logger.info(f"✅ {table} migrated")
+
+def migrate_subscriber_prefs(database):
+    """Add the alert filter columns to a subscribers table created before preferences existed."""
+    columns = [row[1] for row in database.query('PRAGMA table_info(subscribers)')]
+    if 'min_cap' in columns:
+        return
+    logger.info("🔧 Adding subscriber preference columns...")
+    with database.write() as w:
+        w.execute('BEGIN')
+        w.execute('ALTER TABLE subscribers ADD COLUMN min_cap INTEGER NOT NULL DEFAULT 0')
+        w.execute('ALTER TABLE subscribers ADD COLUMN min_multiplier REAL NOT NULL DEFAULT 0')
+        w.execute('ALTER TABLE subscribers ADD COLUMN sources TEXT')
+        w.execute('ALTER TABLE subscribers ADD COLUMN mute_start INTEGER')
+        w.execute('ALTER TABLE subscribers ADD COLUMN mute_end INTEGER')
+    logger.info("✅ subscribers migrated")
+
+def migrate_channel_peers(database):
+    """Add the resolved peer columns to a channel_state table created before they were cached."""
+    columns = [row[1] for row in database.query('PRAGMA table_info(channel_state)')]
+    if 'channel_id' in columns:
+        return
+    with database.write() as w:
+        w.execute('BEGIN')
+        w.execute('ALTER TABLE channel_state ADD COLUMN channel_id INTEGER')
+        w.execute('ALTER TABLE channel_state ADD COLUMN access_hash INTEGER')
+
+def enable_incremental_vacuum(database):
+    """Switch the file to incremental auto-vacuum so maintenance can give space back in small steps.
+
+    Converting an existing database takes one full VACUUM, done as a migration
+    before anything else is writing. VACUUM may renumber the tokens rowids,
+    which is why the name index step comes after this one.
+    """
+    if database.query_one('PRAGMA auto_vacuum')[0] == 2:
+        return False
+    logger.info("🔧 Enabling incremental auto-vacuum (one-time VACUUM)...")
+    with database.write() as w:
+        w.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        w.execute('VACUUM')
+    logger.info("✅ Incremental auto-vacuum enabled")
+    return True
+
+def create_name_index(database, rebuild=False):
+    """Trigram FTS5 index over the names of solearlytrending tokens, kept in sync by triggers.
+
+    Name matching only ever looks at solearlytrending, so other channels stay
+    out of the index, and an upsert that leaves name and channel alone doesn't
+    touch it at all. Returns False when this SQLite build has no FTS5, in which
+    case name matching falls back to a LIKE scan.
+    """
+    try:
+        exists = database.query_one("SELECT 1 FROM sqlite_master WHERE name = 'tokens_name_fts'")
+        insert_trigger = database.query_one("SELECT sql FROM sqlite_master WHERE name = 'tokens_name_fts_insert'")
+        # Earlier versions indexed every channel and re-indexed on every upsert
+        outdated = insert_trigger is not None and 'solearlytrending' not in insert_trigger[0]
+        with database.write() as w:
+            w.execute('BEGIN')
+            w.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS tokens_name_fts
+            USING fts5(token_name, content='tokens', content_rowid='rowid', tokenize='trigram')
+            ''')
+            if outdated:
+                for trigger in ('insert', 'delete', 'update'):
+                    w.execute(f'DROP TRIGGER IF EXISTS tokens_name_fts_{trigger}')
+            w.execute('''
+            CREATE TRIGGER IF NOT EXISTS tokens_name_fts_insert AFTER INSERT ON tokens
+            WHEN new.channel_name = 'solearlytrending' BEGIN
+                INSERT INTO tokens_name_fts(rowid, token_name) VALUES (new.rowid, new.token_name);
+            END
+            ''')
+            w.execute('''
+            CREATE TRIGGER IF NOT EXISTS tokens_name_fts_delete AFTER DELETE ON tokens
+            WHEN old.channel_name = 'solearlytrending' BEGIN
+                INSERT INTO tokens_name_fts(tokens_name_fts, rowid, token_name) VALUES ('delete', old.rowid, old.token_name);
+            END
+            ''')
+            w.execute('''
+            CREATE TRIGGER IF NOT EXISTS tokens_name_fts_update AFTER UPDATE OF token_name, channel_name ON tokens
+            WHEN old.token_name IS NOT new.token_name OR old.channel_name IS NOT new.channel_name BEGIN
+                INSERT INTO tokens_name_fts(tokens_name_fts, rowid, token_name)
+                SELECT 'delete', old.rowid, old.token_name WHERE old.channel_name = 'solearlytrending';
+                INSERT INTO tokens_name_fts(rowid, token_name)
+                SELECT new.rowid, new.token_name WHERE new.channel_name = 'solearlytrending';
+            END
+            ''')
+            if rebuild or outdated or not exists:
+                # Index the names already in the database ('rebuild' would take every channel)
+                w.execute("INSERT INTO tokens_name_fts(tokens_name_fts) VALUES ('delete-all')")
+                w.execute('''
+                INSERT INTO tokens_name_fts(rowid, token_name)
+                SELECT rowid, token_name FROM tokens WHERE channel_name = 'solearlytrending'
+                ''')
+        return True
+    except sqlite3.OperationalError as e:
+        logger.warning(f"⚠️ FTS5 not available, token name matching will scan: {e}")
+        return False
+
+def create_indexes(database):
+    with database.write() as w:
+        w.execute('CREATE INDEX IF NOT EXISTS idx_market_updates_token_time ON market_updates(token_id, time)')
+        w.execute('CREATE INDEX IF NOT EXISTS idx_tokens_channel ON tokens(channel_name)')
+        w.execute('CREATE INDEX IF NOT EXISTS idx_outbox_pending ON outbox(alert_id) WHERE done_at IS NULL')
+
+def create_token_age_index(database):
+    """Index for the dead-token purge (updated_at < ?) and the cache warm-up (newest updated_at first)."""
+    with database.write() as w:
+        w.execute('CREATE INDEX IF NOT EXISTS idx_tokens_updated_at ON tokens(updated_at)')
+
+# Schema steps in order; PRAGMA user_version records the last one applied. Each
+# step checks the schema before changing it, so a database from before
+# versioning (user_version 0) is brought up to date by the same steps, and a
+# crash between a step and its version bump only repeats that step.
+MIGRATIONS = [
+    (1, "create tables", create_tables),
+    (2, "market_updates with epoch times", migrate_market_updates),
+    (3, "token epoch timestamps", migrate_token_times),
+    (4, "subscriber preference columns", migrate_subscriber_prefs),
+    (5, "incremental auto-vacuum", enable_incremental_vacuum),
+    # After the VACUUM above, which may renumber the rowids the index points at
+    (6, "token name index", lambda database: create_name_index(database, rebuild=True)),
+    (7, "query indexes", create_indexes),
+    (8, "channel peer columns", migrate_channel_peers),
+    (9, "token age index", create_token_age_index),
+]
+
+def migrate(database):
+    """Apply the migrations this database hasn't had yet."""
+    version = database.query_one('PRAGMA user_version')[0]
+    for number, description, step in MIGRATIONS:
+        if number <= version:
+            continue
+        start = time.perf_counter()
+        step(database)
+        with database.write() as w:
+            w.execute(f'PRAGMA user_version = {number}')
+        logger.info(f"🔧 Migration {number} ({description}) applied in {time.perf_counter() - start:.2f}s")
+
+# === METRICS === #
+TIME_BUCKETS = tuple(0.00001 * 2 ** (i / 2) for i in range(46))  # seconds, 10 us up to ~60 s in steps of sqrt(2)
+SIZE_BUCKETS = tuple(2 ** i for i in range(21))  # counts, 1 up to ~1M
+
+class Histogram:
+    """Fixed-bucket histogram; quantiles are interpolated within the bucket they fall in."""
+
+    __slots__ = ('bounds', 'counts', 'count', 'total', 'peak')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # the last bucket is everything above the top bound
+        self.count = 0
+        self.total = 0.0
+        self.peak = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.peak = max(self.peak, value)
+
+    def quantile(self, q):
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = self.bounds[i - 1] if i else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.peak
+                return min(lower + (upper - lower) * (rank - seen) / n, self.peak)
+            seen += n
+        return self.peak
+
+    def summary(self):
+        return {'count': self.count, 'avg': self.total / self.count, 'max': self.peak,
+                'p50': self.quantile(0.5), 'p95': self.quantile(0.95), 'p99': self.quantile(0.99)}
+
+class Metrics:
+    """Small in-process counters, histograms and gauges for the hot path.
+
+    Counters also keep what was added during the last full minute, which is
+    where the per-minute rates in /stats come from.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.timings = {}  # name -> Histogram
+        self.gauges = {}  # name -> function returning the current value
+        self.minute = int(time.time() // 60)
+        self.this_minute = {}
+        self.last_minute = {}
+
+    def _roll(self):
+        minute = int(time.time() // 60)
+        if minute != self.minute:
+            self.last_minute = self.this_minute if minute == self.minute + 1 else {}
+            self.this_minute = {}
+            self.minute = minute
+
+    def incr(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+            self._roll()
+            self.this_minute[name] = self.this_minute.get(name, 0) + amount
+
+    def observe(self, name, value, buckets=TIME_BUCKETS):
+        """Record a sample; durations are in seconds, use SIZE_BUCKETS for counts."""
+        with self.lock:
+            histogram = self.timings.get(name)
+            if histogram is None:
+                histogram = self.timings[name] = Histogram(buckets)
+            histogram.observe(value)
+
+    def gauge(self, name, read):
+        """Register a value that is read when a snapshot is taken (queue depths and the like)."""
+        self.gauges[name] = read
+
+    def _read_gauges(self):
+        gauges = {}
+        for name, read in list(self.gauges.items()):
+            try:
+                gauges[name] = read()
+            except Exception as e:
+                logger.error(f"❌ Error reading gauge {name}: {e}")
+        return gauges
+
+    def snapshot(self):
+        with self.lock:
+            self._roll()
+            timings = {name: histogram.summary() for name, histogram in self.timings.items()}
+            counters = dict(self.counters)
+            per_minute = dict(self.last_minute)
+        return {'counters': counters, 'per_minute': per_minute, 'timings': timings, 'gauges': self._read_gauges()}
+
+    def prometheus(self):
+        """Render everything in the Prometheus text exposition format."""
+        def metric_name(name):
+            return 'bot_' + re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+        lines = []
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                lines += [f"# TYPE {metric_name(name)}_total counter", f"{metric_name(name)}_total {value}"]
+            for name, histogram in sorted(self.timings.items()):
+                base = metric_name(name)
+                lines.append(f"# TYPE {base} histogram")
+                cumulative = 0
+                for bound, n in zip(histogram.bounds, histogram.counts):
+                    cumulative += n
+                    lines.append(f'{base}_bucket{{le="{bound:g}"}} {cumulative}')
+                lines += [f'{base}_bucket{{le="+Inf"}} {histogram.count}',
+                          f"{base}_sum {histogram.total}", f"{base}_count {histogram.count}"]
+        for name, value in sorted(self._read_gauges().items()):
+            lines += [f"# TYPE {metric_name(name)} gauge", f"{metric_name(name)} {value}"]
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics.prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scrapes would otherwise flood the log
+
+def start_metrics_server(port):
+    """Serve the Prometheus text format on localhost only; the bot has no other HTTP surface."""
+    server = ThreadingHTTPServer(('127.0.0.1', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    logger.info(f"📈 Metrics available at http://127.0.0.1:{port}/metrics")
+    return server
+
+# === DB WRITER === #
+TOKEN_UPSERT_SQL = '''
+    INSERT INTO tokens (token_id, token_name, market_cap, total_liq, liq_percent, bonding, created_at, channel_name, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(token_id) DO UPDATE SET
+        market_cap = excluded.market_cap,
+        token_name = excluded.token_name,
+        channel_name = excluded.channel_name,
+        updated_at = excluded.updated_at,
+        created_at = COALESCE(excluded.created_at, created_at)
+'''
+
+MARKET_UPDATE_SQL = '''
+    INSERT INTO market_updates (token_id, old_cap, new_cap, change_type, time) VALUES (?, ?, ?, ?, ?)
+'''  # time is a unix epoch
+
+CHANNEL_MARK_SQL = '''
+    INSERT INTO channel_state (channel_name, last_message_id) VALUES (?, ?)
+    ON CONFLICT(channel_name) DO UPDATE SET last_message_id = MAX(last_message_id, excluded.last_message_id)
+'''
+
+class TokenWriter:
+    """Write-behind writer for token upserts, market updates and channel marks.
+
+    Ingestion queues rows with upsert_token()/record_market_update() and
+    calls commit_cycle() once per ingestion cycle (a message, a backfill or
+    an API poll). A single writer thread applies each cycle, and any cycles
+    that queued up behind it, in one transaction on the shared serialized
+    writer connection. Until a row is on disk it is served from the pending
+    overlay so reads never see stale data. A channel's last-seen message id
+    (mark_channel()) is written in the same transaction as, or after, the
+    rows of the messages it covers, so it never gets ahead of them on disk.
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self.lock = threading.Lock()
+        self.buffer_tokens = {}
+        self.buffer_updates = []
+        self.buffer_marks = {}  # channel -> last processed message id
+        self.pending = {}  # token_id -> queued upsert row, until it has been written
+        self.cycles = queue.Queue()
+        self.thread = None
+
+    def start(self):
+        if self.thread:
+            return
+        self.thread = threading.Thread(target=self._run, name='token-writer', daemon=True)
+        self.thread.start()
+
+    def pending_token(self, token_id):
+        """Latest queued (not yet written) row for a token, or None."""
+        with self.lock:
+            return self.pending.get(token_id)
+
+    def upsert_token(self, row):
+        with self.lock:
+            self.buffer_tokens[row[0]] = row
+            self.pending[row[0]] = row
+
+    def record_market_update(self, row):
+        with self.lock:
+            self.buffer_updates.append(row)
+
+    def mark_channel(self, username, message_id):
+        with self.lock:
+            self.buffer_marks[username] = message_id
+
+    def commit_cycle(self):
+        """Hand everything queued since the last cycle to the writer thread."""
+        with self.lock:
+            if not self.buffer_tokens and not self.buffer_updates and not self.buffer_marks:
+                return
+            cycle = (list(self.buffer_tokens.values()), self.buffer_updates, self.buffer_marks)
+            self.buffer_tokens = {}
+            self.buffer_updates = []
+            self.buffer_marks = {}
+        self.cycles.put(cycle)
+        self.start()
+
+    def wait(self):
+        """Block until every committed cycle has been written."""
+        self.cycles.join()
+
+    def close(self):
+        self.commit_cycle()
+        if self.thread:
+            self.wait()
+
+    def _run(self):
+        while True:
+            cycles = [self.cycles.get()]
+            # Fold any cycles that queued up meanwhile into the same transaction
+            while True:
+                try:
+                    cycles.append(self.cycles.get_nowait())
+                except queue.Empty:
+                    break
+            token_rows = {}
+            update_rows = []
+            marks = {}
+            for tokens, updates, channel_marks in cycles:
+                token_rows.update((row[0], row) for row in tokens)
+                update_rows.extend(updates)
+                marks.update(channel_marks)
+
+            start = time.perf_counter()
+            try:
+                with self.database.write() as w:
+                    w.executemany(TOKEN_UPSERT_SQL, token_rows.values())
+                    w.executemany(MARKET_UPDATE_SQL, update_rows)
+                    w.executemany(CHANNEL_MARK_SQL, marks.items())
+                metrics.observe('db_write_seconds', time.perf_counter() - start)
+                metrics.incr('db_rows_written', len(token_rows) + len(update_rows))
+            except Exception as e:
+                metrics.incr('db_write_errors')
+                logger.error(f"❌ Error writing token batch: {e}")
+            finally:
+                with self.lock:
+                    for token_id, row in token_rows.items():
+                        if self.pending.get(token_id) is row:
+                            del self.pending[token_id]
+                for _ in cycles:
+                    self.cycles.task_done()
+
+
+# === TOKEN CACHE === #
+class TokenCache:
+    """Bounded LRU cache of per-token state with a time-to-live.
+
+    Keyed by token_id, each entry holds what the alert decision needs, the
+    same (market_cap, updated_at, notified, created_at) tuple the tokens table returns.
+    Entries older than the TTL are treated as misses and dropped.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # token_id -> (state, cached_at)
+        self.lock = threading.Lock()
+
+    def get(self, token_id):
+        with self.lock:
+            entry = self.entries.get(token_id)
+            if entry is None:
+                metrics.incr('token_cache.misses')
+                return None
+            state, cached_at = entry
+            if time.monotonic() - cached_at > self.ttl:
+                del self.entries[token_id]
+                metrics.incr('token_cache.expired')
+                metrics.incr('token_cache.misses')
+                return None
+            self.entries.move_to_end(token_id)
+            metrics.incr('token_cache.hits')
+            return state
+
+    def put(self, token_id, state):
+        with self.lock:
+            self.entries[token_id] = (state, time.monotonic())
+            self.entries.move_to_end(token_id)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                metrics.incr('token_cache.evictions')
+
+    def discard(self, token_ids):
+        with self.lock:
+            for token_id in token_ids:
+                self.entries.pop(token_id, None)
+
+    def warm(self):
+        """Load the most recently updated tokens so the first messages after a restart hit the cache."""
+        rows = app.db.query('''
+            SELECT token_id, market_cap, updated_at, notified, created_at FROM tokens
+            WHERE updated_at >= ? ORDER BY updated_at DESC LIMIT ?
+        ''', (int(time.time() - self.ttl), self.max_size))
+        # Oldest first, so the most recently updated tokens end up most recently used
+        for token_id, *state in reversed(rows):
+            self.put(token_id, tuple(state))
+        logger.info(f"✅ Token cache warmed with {len(rows)} recent tokens")
+
+    def __len__(self):
+        return len(self.entries)
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
+
+def lookup_token(token_id):
+    """Last known (market_cap, updated_at, notified, created_at) of a token, or None if we've never seen it.
+
+    Served from the cache when possible, then from writes still queued on the
+    writer, and only then from SQLite (the result is cached for next time).
+    """
+    state = token_cache.get(token_id)
+    if state is not None:
+        return state
+    pending = app.writer.pending_token(token_id)
+    if pending:
+        state = (pending[2], pending[8], 0, pending[6])
+    else:
+        state = app.db.query_one("SELECT market_cap, updated_at, notified, created_at FROM tokens WHERE token_id = ?",
+                             (token_id,))
+    if state:
+        token_cache.put(token_id, state)
+    return state
+
+def store_token(row):
+    """Queue a token upsert on the writer and write it through to the cache."""
+    app.writer.upsert_token(row)
+    token_cache.put(row[0], (row[2], row[8], 0, row[6]))
+
+# === MAINTENANCE === #
+ROLLUP_UPSERT_SQL = '''
+    INSERT INTO market_updates_hourly (token_id, hour, min_cap, max_cap, last_cap, last_time, samples)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(token_id, hour) DO UPDATE SET
+        min_cap = MIN(min_cap, excluded.min_cap),
+        max_cap = MAX(max_cap, excluded.max_cap),
+        last_cap = CASE WHEN excluded.last_time >= last_time THEN excluded.last_cap ELSE last_cap END,
+        last_time = MAX(last_time, excluded.last_time),
+        samples = samples + excluded.samples
+'''
+
+ARCHIVE_TOKEN_SQL = '''
+    INSERT OR REPLACE INTO tokens_archive
+        (token_id, token_name, market_cap, total_liq, liq_percent, bonding, age, channel_name, notified, time,
+         created_at, updated_at)
+    SELECT token_id, token_name, market_cap, total_liq, liq_percent, bonding, age, channel_name, notified, time,
+           created_at, updated_at
+    FROM tokens WHERE rowid = ?
+'''
+
+def database_size():
+    """Bytes used by the database pages (what a checkpoint leaves on disk)."""
+    return app.db.query_one('PRAGMA page_count')[0] * app.db.query_one('PRAGMA page_size')[0]
+
+def roll_up_market_updates(cutoff):
+    """Fold market updates older than cutoff (epoch) into hourly min/max/last rows.
+
+    Walks the table in id order, one short transaction per batch of old rows.
+    """
+    rolled = 0
+    last_id = 0
+    while True:
+        with app.db.write() as w:
+            rows = w.execute(
+                'SELECT id, token_id, new_cap, time FROM market_updates WHERE id > ? AND time < ? ORDER BY id LIMIT ?',
+                (last_id, cutoff, MAINTENANCE_BATCH)).fetchall()
+            if not rows:
+                break
+            buckets = {}
+            for _, token_id, cap, ts in rows:
+                if cap is None:
+                    continue
+                key = (token_id, ts - ts % 3600)
+                bucket = buckets.get(key)
+                if bucket is None:
+                    buckets[key] = [cap, cap, cap, ts, 1]
+                    continue
+                bucket[0] = min(bucket[0], cap)
+                bucket[1] = max(bucket[1], cap)
+                if ts >= bucket[3]:
+                    bucket[2], bucket[3] = cap, ts
+                bucket[4] += 1
+            w.executemany(ROLLUP_UPSERT_SQL, [(*key, *bucket) for key, bucket in buckets.items()])
+            w.execute('DELETE FROM market_updates WHERE id > ? AND id <= ? AND time < ?',
+                      (last_id, rows[-1][0], cutoff))
+            last_id = rows[-1][0]
+        rolled += len(rows)
+        if len(rows) < MAINTENANCE_BATCH:
+            break
+        time.sleep(MAINTENANCE_PAUSE)
+    return rolled
+
+def remove_dead_tokens(cutoff):
+    """Delete (or archive, with ARCHIVE_DEAD_TOKENS) tokens not updated since cutoff (epoch), a batch at a time."""
+    removed = 0
+    while True:
+        with app.db.write() as w:
+            rows = w.execute('SELECT rowid, token_id FROM tokens WHERE updated_at < ? LIMIT ?',
+                             (cutoff, MAINTENANCE_BATCH)).fetchall()
+            rowids = [(row[0],) for row in rows]
+            if ARCHIVE_DEAD_TOKENS:
+                w.executemany(ARCHIVE_TOKEN_SQL, rowids)
+            w.executemany('DELETE FROM tokens WHERE rowid = ?', rowids)
+        token_cache.discard(row[1] for row in rows)
+        removed += len(rows)
+        if len(rows) < MAINTENANCE_BATCH:
+            break
+        time.sleep(MAINTENANCE_PAUSE)
+    return removed
+
+def prune_outbox(cutoff):
+    """Drop outbox alerts queued before cutoff (epoch) once none of their sends are pending, a batch at a time."""
+    pruned = 0
+    while True:
+        with app.db.write() as w:
+            rows = w.execute('''
+                SELECT alert_id, chat_id FROM outbox
+                WHERE alert_id IN (SELECT id FROM outbox_alerts WHERE created_at < ?) AND done_at IS NOT NULL
+                LIMIT ?
+            ''', (cutoff, MAINTENANCE_BATCH)).fetchall()
+            w.executemany('DELETE FROM outbox WHERE alert_id = ? AND chat_id = ?', rows)
+            if len(rows) < MAINTENANCE_BATCH:
+                w.execute('''
+                    DELETE FROM outbox_alerts
+                    WHERE created_at < ? AND NOT EXISTS (SELECT 1 FROM outbox WHERE alert_id = outbox_alerts.id)
+                ''', (cutoff,))
+        pruned += len(rows)
+        if len(rows) < MAINTENANCE_BATCH:
+            break
+        time.sleep(MAINTENANCE_PAUSE)
+    return pruned
+
+def release_free_pages():
+    """Give free pages back to the filesystem in small incremental_vacuum steps; returns bytes released."""
+    page_size = app.db.query_one('PRAGMA page_size')[0]
+    released = 0
+    while True:
+        with app.db.write() as w:
+            pages = w.execute('PRAGMA page_count').fetchone()[0]
+            if not w.execute('PRAGMA freelist_count').fetchone()[0]:
+                break
+            w.execute(f'PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})').fetchall()
+            shrunk = pages - w.execute('PRAGMA page_count').fetchone()[0]
+        if not shrunk:
+            break  # auto_vacuum isn't incremental on this file
+        released += shrunk * page_size
+        time.sleep(MAINTENANCE_PAUSE)
+    return released
+
+def run_maintenance():
+    """One retention pass: roll up old history, drop dead tokens and give the space back.
+
+    Every step runs as many short write transactions rather than one long one,
+    so the token writer only ever waits for a single batch.
+    """
+    start = time.perf_counter()
+    now = int(time.time())
+    rolled = roll_up_market_updates(now - RAW_HISTORY_HOURS * 3600)
+    with app.db.write() as w:
+        pruned = w.execute('DELETE FROM market_updates_hourly WHERE hour < ?',
+                           (now - ROLLUP_RETENTION_DAYS * 86400,)).rowcount
+    removed = remove_dead_tokens(now - TOKEN_RETENTION_DAYS * 86400)
+    sends = prune_outbox(now - OUTBOX_RETENTION_HOURS * 3600)
+    reclaimed = release_free_pages()
+    with app.db.write() as w:
+        w.execute('PRAGMA optimize')
+    metrics.incr('maintenance.rows_rolled_up', rolled)
+    metrics.incr('maintenance.tokens_removed', removed)
+    metrics.incr('maintenance.outbox_rows_removed', sends)
+    metrics.incr('maintenance.bytes_reclaimed', reclaimed)
+    metrics.observe('maintenance_seconds', time.perf_counter() - start)
+    action = "archived" if ARCHIVE_DEAD_TOKENS else "removed"
+    logger.info(f"🧹 Maintenance: rolled up {rolled} market updates, {action} {removed} dead tokens, "
+                f"pruned {pruned} old rollups and {sends} delivered sends, reclaimed {reclaimed:,} bytes "
+                f"(database now {database_size():,} bytes) in {time.perf_counter() - start:.1f}s")
+    return reclaimed
+
+async def maintenance_loop():
+    while True:
+        await asyncio.sleep(MAINTENANCE_INTERVAL)
+        try:
+            await asyncio.to_thread(run_maintenance)
+        except Exception as e:
+            logger.error(f"❌ Maintenance error: {e}")
+
+# === PARSER === #
+@dataclass(slots=True)
+class TokenUpdate:
+    """A token sighting extracted from a channel message or the API."""
+    token_id: str
+    token_name: str = "Unknown"
+    market_cap: int = 0
+    total_liq: float = 0.0
+    liq_percent: float = 0.0
+    bonding: float = 0.0
+    created_at: int | None = None  # unix epoch, None if unknown
+    old_cap: int = 0
+    percent_change: int = 0
+
+AMOUNT_UNITS = {'': 1, 'K': 1_000, 'M': 1_000_000, 'B': 1_000_000_000}
+# A unit letter only counts on its own: in '$45,000 Buy now' the B starts a word
+AMOUNT_RE = re.compile(r'\$?([\d,]*\.?\d+)\s*([KMB](?![A-Za-z])|)')
+
+def parse_amount(text):
+    """Normalize a '$1,234', '51.1K', '$1.2M' style amount to whole dollars."""
+    number, unit = AMOUNT_RE.match(text).groups()
+    return int(float(number.replace(',', '')) * AMOUNT_UNITS[unit])
+
+def leading_number(text):
+    """Parse the number at the start of a field value like '12.5%' or '85.3 SOL'."""
+    return float(AMOUNT_RE.match(text).group(1).replace(',', ''))
+
+class LabeledFormat:
+    """A 'Label: value' message format scanned in a single regex pass.
+
+    All labels are folded into one precompiled, line-anchored pattern, so
+    findall() walks the text once and returns every field instead of running
+    one search per field. Labels may be preceded by emoji; the first
+    occurrence of a label wins.
+    """
+
+    def __init__(self, labels):
+        alternatives = '|'.join(re.escape(label) for label in labels)
+        self.pattern = re.compile(rf'^[^\w\n]*({alternatives}):\s*(.*)', re.MULTILINE)
+
+    def scan(self, text):
+        fields = {}
+        for label, value in self.pattern.findall(text):
+            fields.setdefault(label, value)
+        return fields
+
+TOKEN_INFO_FORMAT = LabeledFormat(['Token name', 'Token ID', 'Liq %', 'Total Liq', 'Age', 'Market Cap', 'Bonding %'])
+BULLISH_CALLS_FORMAT = LabeledFormat(['Token', 'Now', 'Contract'])
+
+# solearlytrending posts come in several layouts; each pattern is only tried
+# when its marker text is present in the message
+GECKO_BOLD_RE = re.compile(r'📈\s*\[\*\*(.+?)\*\*\]\(https://www\.geckoterminal\.com/solana/pools/(\w+)\)')
+GECKO_PLAIN_RE = re.compile(r'📈\s*(.+?)\s*\(https://www\.geckoterminal\.com/solana/pools/(\w+)\)')
+SNIPER_RE = re.compile(r'🔥\s*(.+?)\s*\(https://t\.me/soul_sniper_bot\?start=15_(\w+)\)')
+MC_RE = re.compile(r'💰 MC: (\$[\d,]+)')
+MC_TOP_RE = re.compile(r'MC: (\$[\d,]+).*?🔝 (\$[\d,]+\.?\d*[KMB])')
+CAP_CHANGE_RE = re.compile(r'(\$[\d,]+\.?\d*[KMB])\**\s*—>\s*\**(\$[\d,]+\.?\d*[KMB])')
+PERCENT_UP_RE = re.compile(r'is up\s*\**(\d+(?:\.\d+)?)(X?)')
+
+def parse_token_info(text):
+    try:
+        fields = TOKEN_INFO_FORMAT.scan(text)
+        return TokenUpdate(
+            token_id=fields['Token ID'].split()[0],
+            token_name=fields.get('Token name', '').lstrip('💬 ').strip() or "Unknown",
+            liq_percent=leading_number(fields['Liq %']),
+            total_liq=leading_number(fields['Total Liq']),
+            created_at=created_from_age(fields['Age']),
+            market_cap=parse_amount(fields['Market Cap']),
+            bonding=leading_number(fields['Bonding %']),
+        )
+    except Exception as e:
+        logger.error(f"❌ Error parsing token info: {e}", extra=SAMPLED)
+        return None
+
+def parse_bullish_calls(text):
+    try:
+        fields = BULLISH_CALLS_FORMAT.scan(text)
+
+        # Contract address may sit on the line after "Contract:"
+        contract = fields.get('Contract', '').split()
+        if not contract:
+            return None
+
+        # Current market cap (handles formats like 51.1K, 114.4K, 1.2M)
+        now = fields.get('Now')
+        return TokenUpdate(
+            token_id=contract[0],
+            token_name=fields.get('Token', '').strip() or "Unknown",
+            market_cap=parse_amount(now) if now else 0,
+        )
+    except Exception as e:
+        return None
+
+def parse_solearlytrending(text):
+    """Pull token, market cap change and percentage out of a solearlytrending message."""
+    try:
+        logger.debug(f"🔍 Parsing solearlytrending message: {text[:200]}...")
+
+        token_match = None
+        if '📈' in text:
+            token_match = GECKO_BOLD_RE.search(text) or GECKO_PLAIN_RE.search(text)
+        if not token_match and '🔥' in text:
+            token_match = SNIPER_RE.search(text)
+        if not token_match:
+            logger.warning("⚠️ Could not find token name or URL in message", extra=SAMPLED)
+            return None
+        token_name = token_match.group(1).strip()
+        contract_address = token_match.group(2)
+
+        old_cap = 0
+        new_cap = 0
+        cap_match = None
+        if '💰 MC' in text:
+            cap_match = MC_RE.search(text)
+            if cap_match:
+                new_cap = parse_amount(cap_match.group(1))
+        if not cap_match and '🔝' in text:
+            cap_match = MC_TOP_RE.search(text)
+            if cap_match:
+                old_cap, new_cap = parse_amount(cap_match.group(1)), parse_amount(cap_match.group(2))
+        if not cap_match and '—>' in text:
+            cap_match = CAP_CHANGE_RE.search(text)
+            if cap_match:
+                old_cap, new_cap = parse_amount(cap_match.group(1)), parse_amount(cap_match.group(2))
+        if not cap_match:
+            logger.warning("⚠️ Could not find market cap in message", extra=SAMPLED)
+
+        # Calculate percentage change automatically, or fall back to the "is up" figure
+        percent_change = 0
+        if old_cap > 0 and new_cap > 0:
+            percent_change = int(((new_cap - old_cap) / old_cap) * 100)
+        elif 'is up' in text:
+            up_match = PERCENT_UP_RE.search(text)
+            if up_match:
+                percent_change = int(float(up_match.group(1)) * (100 if up_match.group(2) else 1))
+
+        logger.debug(f"✅ Parsed {token_name} ({contract_address}): ${old_cap:,} —> ${new_cap:,} (+{percent_change}%)")
+        return TokenUpdate(
+            token_id=contract_address,
+            token_name=token_name,
+            market_cap=new_cap,
+            old_cap=old_cap,
+            percent_change=percent_change,
+        )
+    except Exception as e:
+        logger.error(f"❌ Error parsing solearlytrending info: {e}")
+        return None
+
+# Message formats a source can name as its "parser"
+PARSERS = {
+    'token_info': parse_token_info,
+    'bullish_calls': parse_bullish_calls,
+    'solearlytrending': parse_solearlytrending,
+}
+
+def parse_message(username, text):
+    """Pure parse stage: no database or Telegram access, safe to run in a worker pool."""
+    return app.sources.parser(username)(text)
+
+def parse_timed(parser, text):
+    """Parse one message; a parser that raises gives its exception in place of data."""
+    start = time.perf_counter()
+    try:
+        data = parser(text)
+    except Exception as e:
+        data = e
+    return data, time.perf_counter() - start
+
+def parse_batch(parser, texts):
+    """Parse several messages; returns (data, seconds) pairs so timings survive the trip back from a worker process."""
+    return [parse_timed(parser, text) for text in texts]
+
+# === SOURCES === #
+# Each source is one channel: "channel" (username) and "parser" (a PARSERS
+# name, default token_info) are required. Optional: "mode" is "push" (live
+# updates, the default) or "poll" (fetched every "poll_interval" seconds);
+# "first_fetch" is how many recent messages to read the first time the
+# channel is seen; "max_pending" bounds the live messages queued for it, past
+# which it sheds them and catches up in one fetch instead; "max_error_rate"
+# is the share of its last SOURCE_ERROR_WINDOW messages and fetches that may
+# raise an error before it is paused for SOURCE_PAUSE_SECONDS (1 never pauses
+# it). Posts that just aren't token calls ("gm", ads) are not errors.
+DEFAULT_SOURCES = [
+    {'channel': 'early100xgems', 'parser': 'token_info'},
+    {'channel': 'BullishCallsPremium', 'parser': 'bullish_calls'},
+    {'channel': 'solearlytrending', 'parser': 'solearlytrending', 'first_fetch': 5},
+]
+
+SOURCE_KEYS = {'channel', 'parser', 'mode', 'poll_interval', 'first_fetch', 'max_pending', 'max_error_rate'}
+
+@dataclass(slots=True, eq=False)
+class Source:
+    channel: str
+    parser: str
+    mode: str = 'push'
+    poll_interval: float = 60
+    first_fetch: int = 10
+    max_pending: int = 100
+    max_error_rate: float = 0.5
+    # Runtime state, kept across reloads that leave the source's settings alone
+    queue: asyncio.Queue | None = None  # live messages waiting for the worker, None is a wake-up
+    worker: asyncio.Task | None = None
+    lock: asyncio.Lock | None = None  # one fetch at a time, so a gap is never processed twice
+    outcomes: deque = field(default_factory=lambda: deque(maxlen=SOURCE_ERROR_WINDOW))  # True/False per recent message
+    behind: bool = False  # live messages are being dropped until a catch-up fills the gap
+    paused_until: float = 0.0  # monotonic time
+
+    def settings(self):
+        return (self.channel, self.parser, self.mode, self.poll_interval, self.first_fetch,
+                self.max_pending, self.max_error_rate)
+
+    def paused(self):
+        return time.monotonic() < self.paused_until
+
+    def fall_behind(self):
+        """Stop queueing live messages; the worker drops what is queued and catches up from the last processed one."""
+        self.behind = True
+        if self.queue is not None and self.queue.empty():
+            self.queue.put_nowait(None)
+
+    def record(self, ok):
+        """Count a message (or fetch) against the error budget, pausing the source when it is spent."""
+        if self.paused():
+            return
+        self.outcomes.append(ok)
+        if len(self.outcomes) < SOURCE_ERROR_WINDOW:
+            return
+        failed = self.outcomes.count(False)
+        if failed <= self.max_error_rate * len(self.outcomes):
+            return
+        self.outcomes.clear()
+        self.paused_until = time.monotonic() + SOURCE_PAUSE_SECONDS
+        self.fall_behind()
+        metrics.incr(f'source_paused.{self.channel}')
+        logger.warning(f"⏸️ {self.channel}: {failed}/{SOURCE_ERROR_WINDOW} recent messages failed, "
+                       f"pausing it for {SOURCE_PAUSE_SECONDS}s")
+        send_admin_message(f"⏸️ Source {escape_markdown(self.channel)} paused for {SOURCE_PAUSE_SECONDS}s: "
+                           f"{failed} of its last {SOURCE_ERROR_WINDOW} messages failed")
+
+def source_from_spec(index, spec):
+    if not isinstance(spec, dict) or 'channel' not in spec or set(spec) - SOURCE_KEYS:
+        unknown = sorted(set(spec) - SOURCE_KEYS) if isinstance(spec, dict) else []
+        raise ValueError(f"source {index}: needs a channel, unknown keys {unknown}")
+    source = Source(str(spec['channel']).lstrip('@'), spec.get('parser', 'token_info'), spec.get('mode', 'push'))
+    if source.parser not in PARSERS:
+        raise ValueError(f"source {index}: parser must be one of {sorted(PARSERS)}")
+    if source.mode not in ('push', 'poll'):
+        raise ValueError(f"source {index}: 'mode' must be 'push' or 'poll'")
+    source.poll_interval = float(spec.get('poll_interval', source.poll_interval))
+    source.first_fetch = int(spec.get('first_fetch', source.first_fetch))
+    source.max_pending = int(spec.get('max_pending', source.max_pending))
+    source.max_error_rate = float(spec.get('max_error_rate', source.max_error_rate))
+    if not source.poll_interval > 0 or source.first_fetch < 0 or source.max_pending < 1 \
+            or not 0 <= source.max_error_rate <= 1:
+        raise ValueError(f"source {index}: poll_interval must be positive, first_fetch >= 0, "
+                         f"max_pending >= 1 and max_error_rate between 0 and 1")
+    return source
+
+class SourceRegistry:
+    """The watched channels by username, replaceable at runtime with configure()."""
+
+    def __init__(self, specs):
+        self.sources = {}
+        self.by_key = {}  # lowercased username -> Source
+        self.configure(specs)
+
+    def configure(self, specs):
+        """Validate and apply a new source list; returns (added, removed, changed) Sources.
+
+        Nothing changes if any spec is invalid. Sources whose settings are the
+        same keep their runtime state (queue, worker, error budget).
+        """
+        new = {}
+        for index, spec in enumerate(specs):
+            source = source_from_spec(index, spec)
+            if source.channel.lower() in {channel.lower() for channel in new}:
+                raise ValueError(f"source {index}: {source.channel} is listed twice")
+            new[source.channel] = source
+        added, removed, changed = [], [], []
+        for channel, source in new.items():
+            old = self.sources.get(channel)
+            if old is None:
+                added.append(source)
+            elif old.settings() == source.settings():
+                new[channel] = old
+            else:
+                changed.append((old, source))
+        removed = [source for channel, source in self.sources.items() if channel not in new]
+        self.sources = new
+        self.by_key = {channel.lower(): source for channel, source in new.items()}
+        return added, removed, changed
+
+    def get(self, username):
+        return self.sources.get(username)
+
+    def lookup(self, username):
+        """Source for a chat username in any case, None if it isn't watched."""
+        return self.by_key.get((username or '').lower())
+
+    def parser(self, username):
+        # Channels that aren't configured (e.g. stored data from a removed source) parse as token info
+        source = self.sources.get(username)
+        return PARSERS[source.parser] if source else parse_token_info
+
+    def channels(self, mode=None):
+        return [channel for channel, source in self.sources.items() if mode in (None, source.mode)]
+
+    def __iter__(self):
+        return iter(list(self.sources.values()))
+
+    def __len__(self):
+        return len(self.sources)
+
+sources_mtime = None  # of SOURCES_FILE when it was last read
+
+def read_source_specs():
+    """The configured source list: SOURCES_FILE if set, otherwise DEFAULT_SOURCES."""
+    global sources_mtime
+    if not SOURCES_FILE:
+        return DEFAULT_SOURCES
+    sources_mtime = os.path.getmtime(SOURCES_FILE)
+    with open(SOURCES_FILE, encoding='utf-8') as f:
+        specs = json.load(f)
+    if not isinstance(specs, list):
+        raise ValueError("expected a JSON list of sources")
+    return specs
+
+def create_source_registry():
+    try:
+        registry = SourceRegistry(read_source_specs())
+        if SOURCES_FILE:
+            logger.info(f"✅ Loaded {len(registry)} sources from {SOURCES_FILE}")
+        return registry
+    except Exception as e:
+        logger.error(f"❌ Error loading sources from {SOURCES_FILE}, using the built-in sources: {e}")
+    return SourceRegistry(DEFAULT_SOURCES)
+
+# === API FETCH === #
+def create_http_session():
+    """Keep-alive HTTP session with a bounded connection pool, shared by every API poll."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=1)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+# Conditional-request validators and per-token payload hashes from the previous poll
+api_validators = {}
+api_token_hashes = {}
+
+def fetch_api_payload(url):
+    """Blocking GET with conditional headers; returns the JSON list, or None if unchanged (304)."""
+    headers = {}
+    if api_validators.get('etag'):
+        headers['If-None-Match'] = api_validators['etag']
+    if api_validators.get('last_modified'):
+        headers['If-Modified-Since'] = api_validators['last_modified']
+
+    response = app.http.get(url, headers=headers, timeout=API_TIMEOUT)
+    if response.status_code == 304:
+        return None
+    response.raise_for_status()
+    api_validators['etag'] = response.headers.get('ETag')
+    api_validators['last_modified'] = response.headers.get('Last-Modified')
+    return response.json()
+
+def token_from_api(token):
+    """Convert one API token profile into a TokenUpdate (None if it has no id)."""
+    token_id = token.get('tokenId')
+    if not token_id:
+        return None
+    liquidity = token.get('liquidity') or {}
+    return TokenUpdate(
+        token_id=token_id,
+        market_cap=int(float(token.get('marketCapUsd', 0))),
+        total_liq=float(liquidity.get('solAmount', 0)),
+        liq_percent=float(liquidity.get('solPercent', 0)),
+        bonding=float(token.get('bondingRate', 0)),
+        created_at=parse_created_at(token.get('createdAt')),
+    )
+
+def changed_api_tokens(payload):
+    """Return updates for tokens whose payload differs from the previous poll."""
+    hashes = {}
+    updates = []
+    for token in payload:
+        try:
+            update = token_from_api(token)
+            if not update:
+                continue
+            digest = hashlib.blake2b(json.dumps(token, sort_keys=True).encode(), digest_size=16).digest()
+            hashes[update.token_id] = digest
+            if api_token_hashes.get(update.token_id) != digest:
+                updates.append(update)
+        except Exception as e:
+            logger.error(f"❌ Error processing token: {e}")
+    # Only remember tokens from this poll so the table can't grow without bound
+    api_token_hashes.clear()
+    api_token_hashes.update(hashes)
+    return updates
+
+async def fetch_tokens_from_api(url=None):
+    """Poll the DexScreener feed without blocking the event loop.
+
+    The HTTP request runs on a worker thread through a pooled keep-alive
+    session. Unchanged responses (304) and unchanged tokens are skipped, and
+    the remaining tokens are written in one transaction.
+    """
+    start = time.perf_counter()
+    try:
+        logger.info("\n🔄 Fetching tokens from API...")
+        payload = await asyncio.to_thread(fetch_api_payload, url or DEXSCREENER_URL)
+        if payload is None:
+            logger.info("ℹ️ API feed unchanged since last poll")
+            return
+        updates = changed_api_tokens(payload)
+        logger.info(f"✅ Successfully fetched {len(payload)} tokens from API, {len(updates)} changed")
+        if updates:
+            notify(save_tokens(updates, "solearlytrending", source="dexscreener"))
+    except Exception as e:
+        metrics.incr('api_fetch_errors')
+        logger.error(f"❌ API Fetch Error: {e}")
+    finally:
+        metrics.observe('api_fetch_seconds', time.perf_counter() - start)
+
+async def api_poll_loop():
+    while True:
+        await fetch_tokens_from_api()
+        await asyncio.sleep(API_POLL_INTERVAL)
+
+# === ALERT RULES === #
+# Rules are checked in order and the first one that matches decides the alert.
+# "on" is "increase" (a known token's market cap went up, the default) or "new"
+# (first sighting). Optional conditions: channels, min_cap / max_cap,
+# min_age_minutes / max_age_minutes, min_liquidity (SOL), min_liq_percent,
+# min_bonding, and min_multiplier over the previous cap or, with
+# window_minutes, over the lowest cap seen in that window. "once" fires a rule
+# at most once per token.
+DEFAULT_ALERT_RULES = [
+    {'name': '🆕 New Token Alert', 'on': 'new'},
+    {'name': '🚨 New Token Alert (Under 10 minutes)', 'max_age_minutes': 10},
+    {'name': '🚀 Market Cap Doubled Alert', 'min_multiplier': 2},
+]
+
+RULE_CONDITIONS = {
+    'min_cap': 'cap >= {}',
+    'max_cap': 'cap <= {}',
+    'min_age_minutes': 'age >= {}',
+    'max_age_minutes': 'age <= {}',
+    'min_liquidity': 'liq >= {}',
+    'min_liq_percent': 'liq_pct >= {}',
+    'min_bonding': 'bonding >= {}',
+}
+RULE_KEYS = set(RULE_CONDITIONS) | {'name', 'on', 'channels', 'min_multiplier', 'window_minutes', 'once'}
+
+@dataclass(slots=True)
+class AlertRule:
+    index: int
+    name: str
+    on: str
+    channels: frozenset | None
+    window: int  # seconds, 0 compares with the previous cap
+    once: bool
+    condition: str  # Python expression over the matcher arguments
+
+@dataclass(slots=True)
+class TokenRuleState:
+    lows: list  # per rule window: deque of (epoch, cap) with rising caps, the front is the window's low
+    fired: set  # indexes of once-rules that already fired
+
+def rule_number(spec, key):
+    value = float(spec[key])
+    if not math.isfinite(value):
+        raise ValueError(f"{key} must be a finite number")
+    return value
+
+def compile_rule(index, spec, windows):
+    """Validate a rule spec and turn its conditions into one Python expression."""
+    unknown = set(spec) - RULE_KEYS
+    if unknown or 'name' not in spec:
+        raise ValueError(f"rule {index}: needs a name, unknown keys {sorted(unknown)}")
+    on = spec.get('on', 'increase')
+    if on not in ('increase', 'new'):
+        raise ValueError(f"rule {index}: 'on' must be 'increase' or 'new'")
+    checks = [template.format(rule_number(spec, key)) for key, template in RULE_CONDITIONS.items() if key in spec]
+    window = int(rule_number(spec, 'window_minutes') * 60) if 'window_minutes' in spec else 0
+    if 'min_multiplier' in spec:
+        multiplier = rule_number(spec, 'min_multiplier')
+        # Last, so the window low is only read once the cheap checks pass
+        checks.append(f"cap >= lows[{windows.index(window)}][0][1] * {multiplier}" if window
+                      else f"cap >= prev * {multiplier}")
+    channels = spec.get('channels')
+    return AlertRule(index, spec['name'], on, frozenset(channels) if channels else None, window,
+                     bool(spec.get('once')), ' and '.join(checks) or 'True')
+
+def compile_matcher(rules):
+    """Compile rules into one function returning the index of the first rule that matches (-1 if none).
+
+    Every condition is inlined, so an update costs one call however many rules apply.
+    """
+    lines = ['def match(cap, prev, age, liq, liq_pct, bonding, lows, fired):']
+    for rule in rules:
+        condition = f"{rule.index} not in fired and ({rule.condition})" if rule.once else rule.condition
+        lines.append(f"    if {condition}: return {rule.index}")
+    lines.append('    return -1')
+    namespace = {'__builtins__': {}}
+    exec('\n'.join(lines), namespace)
+    return namespace['match']
+
+class RuleEngine:
+    """Compiled alert rules and the per-token state they are evaluated against.
+
+    Rules are indexed by trigger and channel, and each index entry is compiled
+    into a single matcher, so an update only tests the rules that apply to it,
+    in priority order, skipping once-rules that already fired for the token.
+    For windowed multipliers each token keeps a sliding-window minimum per
+    window length, seeded from market_updates the first time it shows up.
+    """
+
+    def __init__(self, specs, max_tokens):
+        self.windows = sorted({int(float(spec['window_minutes']) * 60) for spec in specs
+                               if spec.get('window_minutes') and 'min_multiplier' in spec})
+        self.rules = [compile_rule(index, spec, self.windows) for index, spec in enumerate(specs)]
+        self.max_tokens = max_tokens
+        self.index = {}  # (on, channel) -> applicable rules in priority order
+        self.matchers = {}  # (on, channel) -> compiled matcher for those rules
+        self.tokens = OrderedDict()  # token_id -> TokenRuleState, least recently updated first
+        self.lock = threading.Lock()
+
+    def candidates(self, on, channel):
+        rules = self.index.get((on, channel))
+        if rules is None:
+            rules = self.index[(on, channel)] = tuple(
+                rule for rule in self.rules if rule.on == on and (rule.channels is None or channel in rule.channels))
+        return rules
+
+    def matcher(self, on, channel):
+        match = self.matchers.get((on, channel))
+        if match is None:
+            match = self.matchers[(on, channel)] = compile_matcher(self.candidates(on, channel))
+        return match
+
+    def _state(self, token_id, now, prev, prev_time):
+        state = self.tokens.get(token_id)
+        if state is not None:
+            self.tokens.move_to_end(token_id)
+            return state
+        state = self.tokens[token_id] = TokenRuleState([deque() for _ in self.windows], set())
+        if len(self.tokens) > self.max_tokens:
+            self.tokens.popitem(last=False)
+        if self.windows:
+            seen = app.db.query('SELECT time, new_cap FROM market_updates WHERE token_id = ? AND time >= ?',
+                            (token_id, now - self.windows[-1]))
+            if prev_time:
+                seen.append((prev_time, prev))
+            for seen_at, cap in sorted(seen):
+                self._push(state, seen_at, cap, now)
+        return state
+
+    def _push(self, state, seen_at, cap, now):
+        for window, low in zip(self.windows, state.lows):
+            # Caps that are no lower than a newer one can never be the low again
+            while low and low[-1][1] >= cap:
+                low.pop()
+            low.append((seen_at, cap))
+            while low and low[0][0] < now - window:
+                low.popleft()
+
+    def record(self, token_id, cap, prev=0, prev_time=0):
+        """Note a cap that didn't trigger evaluation (no increase) for windowed rules."""
+        if not self.windows:
+            return
+        now = int(time.time())
+        with self.lock:
+            self._push(self._state(token_id, now, prev, prev_time), now, cap, now)
+
+    def evaluate(self, on, channel, data, prev=0, prev_time=0, age=0):
+        """Record the update and return the first rule it fires, or None."""
+        now = int(time.time())
+        match = self.matcher(on, channel)
+        with self.lock:
+            state = self._state(data.token_id, now, prev, prev_time)
+            if self.windows:
+                self._push(state, now, data.market_cap, now)
+            index = match(data.market_cap, prev, age, data.total_liq, data.liq_percent, data.bonding,
+                          state.lows, state.fired)
+            if index < 0:
+                return None
+            rule = self.rules[index]
+            if rule.once:
+                state.fired.add(index)
+            return rule
+
+def create_rule_engine():
+    if ALERT_RULES_FILE:
+        try:
+            with open(ALERT_RULES_FILE, encoding='utf-8') as f:
+                engine = RuleEngine(json.load(f), TOKEN_CACHE_SIZE)
+            logger.info(f"✅ Loaded {len(engine.rules)} alert rules from {ALERT_RULES_FILE}")
+            return engine
+        except Exception as e:
+            logger.error(f"❌ Error loading alert rules from {ALERT_RULES_FILE}, using the built-in rules: {e}")
+    return RuleEngine(DEFAULT_ALERT_RULES, TOKEN_CACHE_SIZE)
+
+# === VELOCITY === #
+VELOCITY_WINDOWS = (60, 300, 900)  # seconds
+VELOCITY_LABELS = ('1m', '5m', '15m')
+
+@dataclass(slots=True)
+class Movement:
+    """How fast a token's market cap was moving as of its latest update.
+
+    Rates are log growth per minute (ln(cap / cap at the window start) over the
+    minutes between them), one per VELOCITY_WINDOWS entry, None until there
+    are two samples to compare.
+    """
+    token_id: str
+    token_name: str
+    market_cap: int
+    updated_at: int
+    rates: tuple
+    acceleration: float | None  # 1m rate minus 5m rate, per minute
+    minutes_to_2x: float | None  # at the 5m rate, None unless it is rising
+
+    def percent_per_minute(self, window):
+        rate = self.rates[window]
+        return None if rate is None else math.expm1(rate) * 100
+
+@dataclass(slots=True)
+class TokenTrack:
+    times: list
+    caps: list
+    bases: list  # per window: index of the newest sample at or before the window start, else of the oldest
+    movement: Movement | None = None
+    sequence: int = -1  # of the update that produced movement
+
+class VelocityTracker:
+    """Rolling 1m / 5m / 15m windows of market cap samples per token.
+
+    A token keeps its samples from the last 15 minutes plus the newest older
+    one as a baseline, and a pointer per window to the sample the window is
+    measured from. Pointers only move forward, so an update is O(1)
+    amortized. A token seen for the first time since startup is seeded from
+    market_updates (indexed on token_id, time).
+
+    Each window also has a max-heap of (rate, update sequence, token).
+    Superseded entries are left in place and skipped (and dropped) when top()
+    reaches them, so top() only touches the leaders instead of every tracked
+    token. A heap is rebuilt from the current movements once stale entries
+    outnumber them. Entries hold only numbers and strings so the garbage
+    collector doesn't have to walk them.
+    """
+
+    def __init__(self, max_tokens):
+        self.max_tokens = max_tokens
+        self.tokens = OrderedDict()  # token_id -> TokenTrack, least recently updated first
+        self.heaps = [[] for _ in VELOCITY_WINDOWS]  # per window: (-rate, sequence, token_id)
+        self.sequence = itertools.count()
+        self.lock = threading.Lock()
+
+    def _track(self, token_id, now, prev, prev_time):
+        track = self.tokens.get(token_id)
+        if track is not None:
+            self.tokens.move_to_end(token_id)
+            return track
+        track = self.tokens[token_id] = TokenTrack([], [], [0] * len(VELOCITY_WINDOWS))
+        if len(self.tokens) > self.max_tokens:
+            self.tokens.popitem(last=False)
+        if prev_time:
+            start = now - VELOCITY_WINDOWS[-1]
+            seen = app.db.query('''
+                SELECT time, new_cap FROM market_updates
+                WHERE token_id = ? AND time >= COALESCE(
+                    (SELECT MAX(time) FROM market_updates WHERE token_id = ? AND time <= ?), ?)
+                ORDER BY time
+            ''', (token_id, token_id, start, start))
+            for seen_at, cap in seen:
+                self._append(track, seen_at, cap)
+            self._append(track, prev_time, prev)
+        return track
+
+    def _append(self, track, seen_at, cap):
+        times, caps, bases = track.times, track.caps, track.bases
+        if cap <= 0 or (times and seen_at < times[-1]):
+            return
+        if times and seen_at == times[-1]:
+            caps[-1] = cap
+            return
+        times.append(seen_at)
+        caps.append(cap)
+        last = len(times) - 1
+        for k, window in enumerate(VELOCITY_WINDOWS):
+            base = bases[k]
+            while base < last and times[base + 1] <= seen_at - window:
+                base += 1
+            bases[k] = base
+        # Samples older than the longest window's baseline are never needed again
+        first = bases[-1]
+        if first > 16 and first * 2 > len(times):
+            del times[:first], caps[:first]
+            track.bases = [base - first for base in bases]
+
+    def update(self, token_id, token_name, cap, now, prev=0, prev_time=0):
+        """Add a sample and return the token's Movement (None if the cap is unknown)."""
+        if cap <= 0:
+            return None
+        with self.lock:
+            track = self._track(token_id, now, prev, prev_time)
+            self._append(track, now, cap)
+            if not track.times:
+                return None
+            rates = []
+            for base in track.bases:
+                minutes = (now - track.times[base]) / 60
+                rates.append(math.log(cap / track.caps[base]) / minutes if minutes > 0 else None)
+            acceleration = rates[0] - rates[1] if rates[0] is not None and rates[1] is not None else None
+            doubling = math.log(2) / rates[1] if rates[1] else None
+            track.movement = Movement(token_id, token_name, cap, now, tuple(rates), acceleration,
+                                      doubling if doubling and doubling > 0 else None)
+            track.sequence = sequence = next(self.sequence)
+            for k, rate in enumerate(rates):
+                if rate is not None:
+                    heap = self.heaps[k]
+                    heapq.heappush(heap, (-rate, sequence, token_id))
+                    if len(heap) > 2 * len(self.tokens) + 1024:
+                        self._rebuild(k)
+            return track.movement
+
+    def _rebuild(self, window):
+        heap = self.heaps[window] = [(-track.movement.rates[window], track.sequence, token_id)
+                                     for token_id, track in self.tokens.items()
+                                     if track.movement is not None and track.movement.rates[window] is not None]
+        heapq.heapify(heap)
+
+    def top(self, window, count, now=None):
+        """The count tokens with the highest rate over VELOCITY_WINDOWS[window], among those updated within it."""
+        cutoff = (now or time.time()) - VELOCITY_WINDOWS[window]
+        movers = []
+        with self.lock:
+            heap = self.heaps[window]
+            leaders = []
+            while heap and len(movers) < count:
+                entry = heapq.heappop(heap)
+                track = self.tokens.get(entry[2])
+                # Superseded, evicted, or last updated before the window: only a new update brings it back
+                if track is None or track.sequence != entry[1] or track.movement.updated_at < cutoff:
+                    continue
+                movers.append(track.movement)
+                leaders.append(entry)
+            for entry in leaders:
+                heapq.heappush(heap, entry)
+        return movers
+
+    def __len__(self):
+        return len(self.tokens)
+
+velocity = VelocityTracker(TOKEN_CACHE_SIZE)
+
+def describe_movement(movement):
+    """Alert lines for a token's velocity, empty when there's nothing to compare yet."""
+    if movement is None:
+        return ""
+    pace = [f"{label} {movement.percent_per_minute(k):+.1f}%/min"
+            for k, label in enumerate(VELOCITY_LABELS) if movement.rates[k] is not None]
+    if not pace:
+        return ""
+    lines = [f"🏎️ Velocity: {' · '.join(pace)}"]
+    if movement.acceleration is not None:
+        trend = "speeding up" if movement.acceleration > 0 else "slowing down"
+        lines.append(f"⚡ Acceleration: {movement.acceleration * 100:+.2f}%/min per min ({trend})")
+    if movement.minutes_to_2x is not None:
+        lines.append(f"⏳ 2x in ~{movement.minutes_to_2x:.0f} min at the 5m pace")
+    return '\n'.join(lines) + '\n'
+
+# === ALERT TEMPLATES === #
+def escape_markdown(text):
+    """Make text safe to send with parse_mode="Markdown" (legacy Markdown marks up _ * ` and [)."""
+    # Chained replace beats str.translate and re.sub several times over on short names
+    return str(text).replace('_', '\\_').replace('*', '\\*').replace('`', '\\`').replace('[', '\\[')
+
+class Template:
+    """A Markdown message with {fields}, compiled once and filled in by render().
+
+    Every str field is escaped unless it's named in trusted (text the bot
+    built itself, like describe_movement()). Placeholders between backticks
+    get their backticks stripped instead, since Markdown can't escape inside
+    code, and are renamed to name__code so the same field can also appear
+    outside. Which treatment a placeholder gets is worked out here, so
+    render() is a few str.replace calls and one format_map.
+    """
+
+    def __init__(self, text, trusted=()):
+        parts = []
+        escaped = set()
+        code = set()
+        in_code = False
+        for literal, name, spec, conversion in string.Formatter().parse(text):
+            parts.append(literal.replace('{', '{{').replace('}', '}}'))
+            in_code ^= literal.count('`') % 2 == 1
+            if name is None:
+                continue
+            if in_code:
+                code.add(name)
+                name += '__code'
+            elif name not in trusted:
+                escaped.add(name)
+            parts.append('{' + name + (f'!{conversion}' if conversion else '') + (f':{spec}' if spec else '') + '}')
+        self.escaped = tuple(escaped)
+        self.code = tuple((name, name + '__code') for name in code)
+        self.format = ''.join(parts).format_map
+
+    def render(self, fields):
+        values = fields.copy()
+        for name in self.escaped:
+            value = fields[name]
+            if type(value) is str:
+                values[name] = escape_markdown(value)
+        for name, key in self.code:
+            values[key] = str(fields[name]).replace('`', '')
+        return self.format(values)
+
+GECKO_LINK = "🔍 Check on GeckoTerminal:\nhttps://www.geckoterminal.com/solana/pools/{token_id}"
+
+TRENDING_ALERT = Template(
+    "🚨 New Token Alert from Demo All Bot!\n\n"
+    "🪙 Token: {token_name}\n"
+    "📊 Market Cap Update:\n"
+    "📉 Previous: ${old_cap:,}\n"
+    "📈 Updated: ${market_cap:,}\n"
+    "📈 Change: +{percent_change}%\n\n"
+    "🔗 Contract: `{token_id}`\n\n"
+    + GECKO_LINK
+)
+
+INCREASE_ALERT = Template(
+    "{rule}!\n\n"
+    "🪙 Token: {token_name}\n"
+    "📊 Market Cap Update:\n"
+    "📉 Previous: ${old_cap:,}\n"
+    "📈 Updated: ${market_cap:,}\n"
+    "📈 Increase: +{percent_increase:.1f}%\n"
+    "⏱️ Age: {age}\n"
+    "⏱️ Time since last update: {minutes_since_update:.1f} minutes\n"
+    "{movement}\n"
+    "🔗 Contract: `{token_id}`\n\n"
+    + GECKO_LINK,
+    trusted=('age', 'movement'),
+)
+
+NEW_TOKEN_ALERT = Template(
+    "{rule}!\n\n"
+    "🪙 Token: {token_name}\n"
+    "📊 Market Cap Update:\n"
+    "📉 Previous: $0\n"
+    "📈 Updated: ${market_cap:,}\n"
+    "⏱️ Age: {age}\n\n"
+    "🔗 Contract: `{token_id}`\n\n"
+    + GECKO_LINK,
+    trusted=('age',),
+)
+
+MATCH_ALERT = Template(
+    "🎯 Token Match Found in solearlytrending!\n\n"
+    "🪙 Token: {token_name}\n"
+    "🔗 Contract: `{token_id}`\n\n"
+    "📊 Market Cap Update:\n"
+    "📈 New MC: ${market_cap:,}\n"
+    "💧 Liquidity: {total_liq} SOL\n"
+    "⏱️ Age: {age}\n\n"
+    "🚀 Potential 100x Gem!",
+    trusted=('age',),
+)
+
+SEEN_IN = Template("\n\n📡 Seen in: {sources}")
+
+# === DB INSERT / UPDATE === #
+@dataclass(slots=True)
+class Notification:
+    """An alert decided by the persist stage and delivered by the notify stage.
+
+    It carries a template and its fields rather than the text: render() runs
+    at delivery, so alerts the coalescer replaces or that reach nobody are
+    never rendered.
+    """
+    token_id: str
+    channel_name: str
+    template: Template
+    fields: dict
+    admin_only: bool = False
+    market_cap: int = 0  # figures subscribers filter on
+    multiplier: float = 0.0  # new cap over the previous one, 0 for new tokens
+    sources: tuple = ()  # every source that reported the token, set by the coalescer
+    source: str = ''  # the feed that reported it when that isn't channel_name (the API poller)
+
+    def render(self):
+        message = self.template.render(self.fields)
+        if len(self.sources) > 1:
+            message += SEEN_IN.render({'sources': ', '.join(self.sources)})
+        return message
+
+    def key(self):
+        """The alert's outbox key, so the same alert decided again (a replay after a restart) isn't sent twice."""
+        audience = 'admin' if self.admin_only else 'subscribers'
+        rule = self.fields.get('rule', self.channel_name)
+        return f"{audience}:{self.token_id}:{rule}:{self.fields.get('market_cap', self.market_cap)}"
+
+def record_trending_sighting(data):
+    """Persist step for solearlytrending: store first sightings right away and alert the admin."""
+    is_new_token = not lookup_token(data.token_id)
+
+    # If it's a new token, save it immediately
+    if is_new_token:
+        store_token((data.token_id, data.token_name, data.market_cap, 0, 0, 0, None,
+                     "solearlytrending", int(time.time())))
+        logger.info(f"💾 New token saved immediately: {data.token_name} ({data.token_id})", extra=SAMPLED)
+
+    fields = {'token_name': data.token_name, 'token_id': data.token_id, 'old_cap': data.old_cap,
+              'market_cap': data.market_cap, 'percent_change': data.percent_change}
+    return Notification(data.token_id, 'solearlytrending', TRENDING_ALERT, fields, admin_only=True)
+
+def save_token(data, channel_name):
+    """Decide/persist stage: store the update and return the alerts it should trigger."""
+    return save_tokens([data], channel_name)
+
+def save_tokens(updates, channel_name, source=None):
+    """Queue a batch of updates as one write cycle and return the alerts they trigger.
+
+    source names the feed in merged alerts when it isn't the channel the
+    tokens are filed under (the API poller files into solearlytrending).
+    """
+    start = time.perf_counter()
+    alerts = []
+    for data in updates:
+        try:
+            if data:
+                coalescer.mention(data.token_id, source or channel_name)
+            found = apply_token_update(data, channel_name)
+            if source:
+                found = [replace(notification, source=source) for notification in found]
+            alerts.extend(found)
+        except Exception as e:
+            logger.error(f"❌ Error saving token: {e}")
+    app.writer.commit_cycle()
+    metrics.observe('save_seconds', time.perf_counter() - start)
+    return alerts
+
+def apply_token_update(data, channel_name):
+    """Queue the writes for one update and return the alerts it triggers."""
+    alerts = []
+    if not data or not data.token_id:
+        logger.warning("❌ Invalid token data, skipping...")
+        return alerts
+
+    row = lookup_token(data.token_id)
+    now = int(time.time())
+    # A stored cap of 0 (a post with no readable cap) is no baseline: the first real cap counts as a new sighting
+    if row and not row[0] <= 0 < data.market_cap:
+        old_cap = row[0]
+        old_time = row[1]
+        notified = row[2]
+        # Keep the creation time we already know if this source doesn't report one
+        created_at = data.created_at or row[3]
+        movement = velocity.update(data.token_id, data.token_name, data.market_cap, now, old_cap, old_time)
+        
+        # Only process if market cap has increased
+        if data.market_cap > old_cap:
+            # Calculate time difference
+            time_diff = (now - old_time) / 60
+            
+            # Age in minutes (unknown counts as brand new)
+            age_in_minutes = (now - created_at) // 60 if created_at else 0
+            
+            # First matching alert rule decides the notification
+            rule = app.rules.evaluate('increase', channel_name, data, old_cap, old_time, age_in_minutes)
+            
+            if rule:
+                notification_type = rule.name
+                # Calculate percentage increase
+                percent_increase = ((data.market_cap - old_cap) / old_cap) * 100
+                
+                # Message fields; the text is rendered when the alert is delivered
+                fields = {'rule': notification_type, 'token_name': data.token_name, 'token_id': data.token_id,
+                          'old_cap': old_cap, 'market_cap': data.market_cap, 'percent_increase': percent_increase,
+                          'age': format_age(created_at, now), 'minutes_since_update': time_diff,
+                          'movement': describe_movement(movement)}
+                
+                # Notify the subscribers whose filters it passes
+                alerts.append(Notification(data.token_id, channel_name, INCREASE_ALERT, fields,
+                                           market_cap=data.market_cap, multiplier=data.market_cap / old_cap))
+                logger.info(f"📢 Queued {notification_type} for token {data.token_id}")
+            
+            # Update token data (liquidity fields are kept as first seen)
+            store_token((data.token_id, data.token_name, data.market_cap, data.total_liq,
+                         data.liq_percent, data.bonding, created_at, channel_name, now))
+
+            # Record this market cap value
+            app.writer.record_market_update((data.token_id, old_cap, data.market_cap, 'Increase', now))
+        else:
+            app.rules.record(data.token_id, data.market_cap, old_cap, old_time)
+            logger.debug(f"ℹ️ No market cap increase for token {data.token_id}, skipping notification")
+    else:
+        # New token
+        created_at = data.created_at or (row[3] if row else None)
+        velocity.update(data.token_id, data.token_name, data.market_cap, now)
+        store_token((data.token_id, data.token_name, data.market_cap, data.total_liq,
+                     data.liq_percent, data.bonding, created_at, channel_name, now))
+        logger.info(f"💾 New token saved: {data.token_name} ({data.token_id}) from {channel_name}", extra=SAMPLED)
+        
+        # Send notification for new token if a rule matches
+        rule = app.rules.evaluate('new', channel_name, data,
+                                    age=(now - created_at) // 60 if created_at else 0)
+        if rule:
+            fields = {'rule': rule.name, 'token_name': data.token_name, 'token_id': data.token_id,
+                      'market_cap': data.market_cap, 'age': format_age(created_at, now)}
+            alerts.append(Notification(data.token_id, channel_name, NEW_TOKEN_ALERT, fields,
+                                       market_cap=data.market_cap))
+            logger.info(f"📢 Queued new token notification for {data.token_id}")
+
+    return alerts
+
+# === TOKEN MATCHING === #
+def check_token_match(token_name, token_id):
+    try:
+        database = app.db
+        # Search in solearlytrending channel for matching token name
+        if app.has_name_index and len(token_name) >= 3:
+            # Trigram index: substring match without scanning the whole table
+            match = database.query_one("""
+                SELECT token_id, market_cap, channel_name
+                FROM tokens
+                WHERE rowid IN (SELECT rowid FROM tokens_name_fts WHERE tokens_name_fts MATCH ?)
+                AND channel_name = 'solearlytrending'
+                LIMIT 1
+            """, ('"' + token_name.replace('"', '""') + '"',))
+        else:
+            match = database.query_one("""
+                SELECT token_id, market_cap, channel_name 
+                FROM tokens 
+                WHERE token_name LIKE ? 
+                AND channel_name = 'solearlytrending'
+            """, (f"%{token_name}%",))
+        return match
+    except Exception as e:
+        logger.error(f"❌ Error checking token match: {e}")
+        return None
+
+def send_match_notification(token_data, match_data):
+    try:
+        send_admin_message(MATCH_ALERT.render({
+            'token_name': token_data.token_name, 'token_id': token_data.token_id,
+            'market_cap': token_data.market_cap, 'total_liq': token_data.total_liq,
+            'age': format_age(token_data.created_at),
+        }))
+    except Exception as e:
+        logger.error(f"❌ Error sending match notification: {e}")
+
+# === SUBSCRIBER ROUTING === #
+def alert_sources():
+    """Source names subscribers can filter on, by lowercased name."""
+    return {name.lower(): name for name in app.sources.channels() + ['dexscreener']}
+
+@dataclass(slots=True)
+class SubscriberPrefs:
+    user_id: int
+    min_cap: int = 0
+    min_multiplier: float = 0.0
+    sources: frozenset | None = None  # None means every source
+    mute_start: int | None = None  # UTC hour, inclusive
+    mute_end: int | None = None  # UTC hour, exclusive
+
+    def muted_hours(self):
+        if self.mute_start is None:
+            return []
+        return [(self.mute_start + i) % 24 for i in range((self.mute_end - self.mute_start) % 24)]
+
+    def describe(self):
+        sources = ', '.join(sorted(self.sources)) if self.sources else 'all'
+        mute = f"{self.mute_start:02d}:00-{self.mute_end:02d}:00 UTC" if self.mute_start is not None else 'off'
+        return (
+            f"⚙️ Your alert filters:\n\n"
+            f"💰 Min market cap: ${self.min_cap:,}\n"
+            f"📈 Min multiplier: {self.min_multiplier:g}x\n"
+            f"📡 Sources: {sources}\n"
+            f"🔕 Mute: {mute}"
+        )
+
+SUBSCRIBER_COLUMNS = 'user_id, min_cap, min_multiplier, sources, mute_start, mute_end'
+
+def prefs_from_row(row):
+    user_id, min_cap, min_multiplier, sources, mute_start, mute_end = row
+    return SubscriberPrefs(user_id, min_cap, min_multiplier,
+                           frozenset(sources.split(',')) if sources else None, mute_start, mute_end)
+
+class SubscriberIndex:
+    """In-memory routing table: which subscribers an alert's figures pass.
+
+    Subscribers are bucketed by source (None for "every source"), grouped by
+    identical (min_cap, min_multiplier) within a bucket and the groups sorted
+    by min_cap, so the groups an alert's cap clears are a prefix found by
+    bisect. Only those groups are checked against min_multiplier, and the
+    users muted in the current UTC hour are taken out with one set
+    difference. Preference changes only mark the table dirty and it is
+    rebuilt on the next alert.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.prefs = {}  # user_id -> SubscriberPrefs
+        self.buckets = {}  # source -> (min caps, [(min_cap, min_multiplier, user_ids)]), both sorted
+        self.muted = [set() for _ in range(24)]
+        self.dirty = True
+
+    def load(self):
+        rows = app.db.query(f'SELECT {SUBSCRIBER_COLUMNS} FROM subscribers')
+        with self.lock:
+            self.prefs = {row[0]: prefs_from_row(row) for row in rows}
+            self.dirty = True
+        logger.info(f"✅ Loaded {len(rows)} subscribers for routing")
+
+    def get(self, user_id):
+        with self.lock:
+            return self.prefs.get(user_id)
+
+    def put(self, prefs):
+        with self.lock:
+            self.prefs[prefs.user_id] = prefs
+            self.dirty = True
+
+    def remove(self, user_ids):
+        with self.lock:
+            for user_id in user_ids:
+                self.prefs.pop(user_id, None)
+            self.dirty = True
+
+    def __len__(self):
+        return len(self.prefs)
+
+    def _build(self):
+        groups = {}
+        muted = [set() for _ in range(24)]
+        for prefs in self.prefs.values():
+            for source in prefs.sources or (None,):
+                groups.setdefault(source, {}).setdefault((prefs.min_cap, prefs.min_multiplier), set()).add(prefs.user_id)
+            for hour in prefs.muted_hours():
+                muted[hour].add(prefs.user_id)
+        self.buckets = {}
+        for source, by_threshold in groups.items():
+            entries = sorted((min_cap, min_multiplier, frozenset(user_ids))
+                             for (min_cap, min_multiplier), user_ids in by_threshold.items())
+            self.buckets[source] = ([entry[0] for entry in entries], entries)
+        self.muted = muted
+        self.dirty = False
+
+    def route(self, market_cap, multiplier, sources, hour=None):
+        """Return the user_ids whose filters an alert with these figures passes."""
+        if hour is None:
+            hour = time.gmtime().tm_hour
+        recipients = set()
+        with self.lock:
+            if self.dirty:
+                self._build()
+            muted = self.muted[hour]
+            for source in (None, *sources):
+                bucket = self.buckets.get(source)
+                if not bucket:
+                    continue
+                caps, entries = bucket
+                for _, min_multiplier, user_ids in itertools.islice(entries, bisect.bisect_right(caps, market_cap)):
+                    if multiplier >= min_multiplier:
+                        recipients |= user_ids
+        return list(recipients - muted)
+
+subscriber_index = SubscriberIndex()
+
+# === BOT COMMANDS === #
+@command('start')
+def send_welcome(message):
+    user_id = message.from_user.id
+    username = message.from_user.username
+    
+    # Add user to subscribers
+    try:
+        with app.db.write() as w:
+            w.execute('''
+                INSERT OR IGNORE INTO subscribers (user_id, username)
+                VALUES (?, ?)
+            ''', (user_id, username))
+        # Re-running /start keeps the filters already set
+        if subscriber_index.get(user_id) is None:
+            subscriber_index.put(SubscriberPrefs(user_id))
+        
+        welcome_msg = (
+            "👋 Welcome to the Market Cap Update Bot!\n\n"
+            "You will now receive notifications about market cap updates.\n"
+            "Narrow them down with /mincap, /minmult, /sources and /mute (see /prefs).\n"
+            "See the fastest movers right now with /top.\n"
+            "Use /stop to unsubscribe from notifications."
+        )
+        app.bot.reply_to(message, welcome_msg)
+    except Exception as e:
+        logger.error(f"❌ Error adding subscriber: {e}")
+
+@command('stop')
+def unsubscribe(message):
+    user_id = message.from_user.id
+    
+    try:
+        with app.db.write() as w:
+            w.execute('DELETE FROM subscribers WHERE user_id = ?', (user_id,))
+        subscriber_index.remove([user_id])
+        
+        stop_msg = "You have been unsubscribed from notifications. Use /start to subscribe again."
+        app.bot.reply_to(message, stop_msg)
+    except Exception as e:
+        logger.error(f"❌ Error removing subscriber: {e}")
+
+def prefs_usage():
+    return (
+        "/mincap 50K - only alerts at or above this market cap (0 = any)\n"
+        "/minmult 2 - only increases of at least this multiple (0 = any, new tokens count as 0)\n"
+        f"/sources {' '.join(alert_sources().values())} - only these sources (all = every source)\n"
+        "/mute 22 7 - no alerts from 22:00 to 07:00 UTC (off = never muted)"
+    )
+
+def parse_pref_command(command, args):
+    """Turn a preference command's arguments into column changes; raises ValueError if malformed."""
+    if command == 'mincap':
+        min_cap = parse_amount(args[0].upper())
+        return {'min_cap': min_cap}
+    if command == 'minmult':
+        min_multiplier = float(args[0].rstrip('xX'))
+        if not math.isfinite(min_multiplier) or min_multiplier < 0:
+            raise ValueError(min_multiplier)
+        return {'min_multiplier': min_multiplier}
+    if command == 'sources':
+        if not args:
+            raise ValueError('no sources')
+        if [arg.lower() for arg in args] == ['all']:
+            return {'sources': None}
+        known = alert_sources()
+        return {'sources': frozenset(known[arg.lower().lstrip('@')] for arg in args)}
+    if command == 'mute':
+        if [arg.lower() for arg in args] == ['off']:
+            return {'mute_start': None, 'mute_end': None}
+        start, end = (int(arg.split(':')[0]) for arg in args)
+        if not (0 <= start < 24 and 0 <= end < 24) or start == end:
+            raise ValueError((start, end))
+        return {'mute_start': start, 'mute_end': end}
+    raise ValueError(command)
+
+@command('mincap', 'minmult', 'sources', 'mute')
+def update_prefs(message):
+    user_id = message.from_user.id
+    command, *args = message.text.split()
+    command = command.lstrip('/').split('@')[0].lower()
+
+    try:
+        prefs = subscriber_index.get(user_id)
+        if prefs is None:
+            app.bot.reply_to(message, "You are not subscribed. Use /start first.")
+            return
+        try:
+            changes = parse_pref_command(command, args)
+        except (ValueError, KeyError, IndexError, AttributeError):
+            app.bot.reply_to(message, f"⚠️ Couldn't read that.\n\n{prefs_usage()}")
+            return
+
+        stored = {key: ','.join(sorted(value)) if key == 'sources' and value else value for key, value in changes.items()}
+        with app.db.write() as w:
+            w.execute(f"UPDATE subscribers SET {', '.join(f'{key} = ?' for key in stored)} WHERE user_id = ?",
+                      (*stored.values(), user_id))
+        prefs = replace(prefs, **changes)
+        subscriber_index.put(prefs)
+        app.bot.reply_to(message, prefs.describe())
+    except Exception as e:
+        logger.error(f"❌ Error updating subscriber preferences: {e}")
+
+@command('prefs')
+def show_prefs(message):
+    prefs = subscriber_index.get(message.from_user.id)
+    if prefs is None:
+        app.bot.reply_to(message, "You are not subscribed. Use /start first.")
+        return
+    app.bot.reply_to(message, f"{prefs.describe()}\n\n{prefs_usage()}")
+
+TOP_USAGE = "/top [1m|5m|15m] [count] - fastest movers over the window (default 5m, 10 tokens)"
+
+def format_top(movers, window):
+    label = VELOCITY_LABELS[window]
+    if not movers:
+        return f"😴 No token moved in the last {label}."
+    lines = [f"🏎️ Fastest movers ({label})", ""]
+    for rank, movement in enumerate(movers, 1):
+        line = f"{rank}. {movement.token_name} {movement.percent_per_minute(window):+.1f}%/min, ${movement.market_cap:,}"
+        if movement.minutes_to_2x is not None:
+            line += f", 2x in ~{movement.minutes_to_2x:.0f} min"
+        lines += [line, f"    {movement.token_id}"]
+    return '\n'.join(lines)
+
+@command('top')
+def show_top(message):
+    args = message.text.split()[1:]
+    try:
+        window = VELOCITY_LABELS.index(args[0].lower()) if args else 1
+        count = max(1, min(int(args[1]) if len(args) > 1 else 10, 25))
+    except ValueError:
+        app.bot.reply_to(message, f"⚠️ Couldn't read that.\n\n{TOP_USAGE}")
+        return
+    try:
+        start = time.perf_counter()
+        movers = velocity.top(window, count)
+        metrics.observe('top_seconds', time.perf_counter() - start)
+        app.bot.reply_to(message, format_top(movers, window))
+    except Exception as e:
+        logger.error(f"❌ Error sending top movers: {e}")
+
+def format_stats(snapshot):
+    """Render a metrics snapshot as a plain-text /stats reply."""
+    per_minute = snapshot['per_minute']
+    lines = [
+        "📊 Bot stats",
+        "",
+        f"⏱️ Last minute: {per_minute.get('messages_processed', 0)} messages, "
+        f"{per_minute.get('alerts_queued', 0)} alerts, {per_minute.get('messages_sent', 0)} sends",
+        "",
+        "⏳ Timings (p50 / p95 / p99, count):",
+    ]
+    for name, timing in sorted(snapshot['timings'].items()):
+        if 'seconds' in name or 'latency' in name:
+            figures = ' / '.join(f"{timing[q] * 1000:.2f}" for q in ('p50', 'p95', 'p99')) + ' ms'
+        else:
+            figures = ' / '.join(f"{timing[q]:,.0f}" for q in ('p50', 'p95', 'p99'))
+        lines.append(f"{name}: {figures} ({timing['count']:,})")
+    lines += ["", "🔢 Counters:"]
+    lines += [f"{name}: {value:,}" for name, value in sorted(snapshot['counters'].items())]
+    lines += ["", "📏 Gauges:"]
+    lines += [f"{name}: {value:,}" for name, value in sorted(snapshot['gauges'].items())]
+    text = '\n'.join(lines)
+    return text if len(text) <= 4000 else text[:4000] + '\n…'
+
+@command('stats')
+def show_stats(message):
+    if message.from_user.id != ADMIN_ID:
+        return
+    try:
+        app.bot.reply_to(message, format_stats(metrics.snapshot()))
+    except Exception as e:
+        logger.error(f"❌ Error sending stats: {e}")
+
+@command('reload')
+def reload_sources_command(message):
+    """Admin: re-read SOURCES_FILE now instead of waiting for the next change check."""
+    if message.from_user.id != ADMIN_ID:
+        return
+    try:
+        summary = asyncio.run_coroutine_threadsafe(reload_sources(), main_loop).result(timeout=60)
+        app.bot.reply_to(message, summary)
+    except Exception as e:
+        logger.error(f"❌ Error reloading sources: {e}")
+
+# === DELIVERY === #
+class TokenBucket:
+    """Thread-safe token bucket; acquire() blocks until a send is allowed."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def pause(self, seconds):
+        """Stop handing out tokens for a while (used when Telegram answers 429)."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now >= self.paused_until:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    self.updated = now
+                    wait = self.paused_until - now
+            time.sleep(wait)
+
+class Alert:
+    """One outgoing message and the bookkeeping for its fan-out."""
+
+    def __init__(self, key, message, recipients=None, prune=True):
+        self.key = key
+        self.alert_id = None  # outbox_alerts id, set once persisted
+        self.message = message
+        self.recipients = recipients  # None means every subscriber
+        self.prune = prune
+        self.created = time.monotonic()
+        self.total = 0
+        self.pending = 0
+        self.sent = 0
+        self.blocked = []  # chats to prune once the whole fan-out has finished
+        self.lock = threading.Lock()
+
+def classify_send_error(error):
+    """Sort a send failure into blocked, rate_limited, transient or rejected.
+
+    blocked: the chat is gone for good (bot blocked, user deactivated, chat not found).
+    rate_limited: Telegram answered 429.
+    transient: network problems and Telegram server errors, worth retrying.
+    rejected: Telegram refused this particular message (e.g. bad Markdown); the
+    subscriber is fine and retrying the same text won't help.
+    """
+    if isinstance(error, ApiTelegramException):
+        description = (error.description or '').lower()
+        if error.error_code == 429:
+            return 'rate_limited'
+        if error.error_code == 403:
+            return 'blocked'
+        if error.error_code == 400 and ('chat not found' in description or 'user is deactivated' in description):
+            return 'blocked'
+        if error.error_code >= 500:
+            return 'transient'
+        return 'rejected'
+    # Timeouts, connection resets and anything else raised by the HTTP layer
+    return 'transient'
+
+class NotificationDispatcher:
+    """Sends alerts from a pool of worker threads so ingestion never waits on Telegram.
+
+    Alerts are expanded into (alert, chat) jobs by a fan-out thread and sent by
+    DELIVERY_WORKERS threads, throttled by a global token bucket and a minimum
+    interval per chat (a job whose chat isn't due yet waits on the retry queue
+    instead of in a worker). Failures are classified with classify_send_error:
+    rate-limited and transient sends go to a retry queue with backoff, blocked
+    chats are pruned in one transaction once the alert's fan-out is finished.
+
+    The fan-out writes every (alert, chat) pair to the outbox before queueing
+    it and finished sends are marked done in batches (every
+    OUTBOX_ACK_INTERVAL or OUTBOX_ACK_BATCH sends), so start() can resume
+    whatever a previous run left unsent. An alert's key (unique per submit
+    unless the caller passes one; deliver() passes Notification.key()) makes
+    re-submitting that alert a no-op for chats it was already queued for. Delivery is at-least-once: sends finished in the last ack interval
+    before a crash are repeated on restart. On shutdown save_queued() writes
+    the alerts the fan-out hasn't reached yet to the outbox as well.
+    """
+
+    def __init__(self, workers, global_rate, per_chat_interval):
+        self.workers = workers
+        self.per_chat_interval = per_chat_interval
+        self.bucket = TokenBucket(global_rate, global_rate)
+        self.alerts = queue.Queue()
+        self.jobs = queue.Queue()
+        self.retries = []  # heap of (ready_at, seq, job)
+        self.retry_cond = threading.Condition()
+        self.retry_seq = itertools.count()
+        self.chat_next_send = {}
+        self.chat_lock = threading.Lock()
+        self.acks = []  # (done_at, error, alert_id, chat_id) not yet written to the outbox
+        self.ack_lock = threading.Lock()
+        self.started = False
+
+    def start(self):
+        if self.started:
+            return
+        self.started = True
+        self.resume()
+        threading.Thread(target=self._fan_out, name='fan-out', daemon=True).start()
+        threading.Thread(target=self._retry_loop, name='send-retry', daemon=True).start()
+        threading.Thread(target=self._ack_loop, name='outbox-ack', daemon=True).start()
+        for i in range(self.workers):
+            threading.Thread(target=self._send_loop, name=f'sender-{i}', daemon=True).start()
+        logger.info(f"✅ Notification dispatcher started with {self.workers} senders")
+
+    def submit(self, message, recipients=None, prune=True, key=None):
+        """Queue an alert for delivery and return immediately.
+
+        Pass the same key only to re-submit the same alert: separate alerts
+        with identical text (a repeated admin warning) must still go out.
+        """
+        alert = Alert(key or uuid.uuid4().hex, message, recipients, prune)
+        self.alerts.put(alert)
+        metrics.incr('alerts_queued')
+        return alert
+
+    def resume(self):
+        """Queue the sends a previous run left in the outbox; ones older than OUTBOX_MAX_AGE are given up."""
+        now = int(time.time())
+        with app.db.write() as w:
+            expired = w.execute('''
+                UPDATE outbox SET done_at = ?, error = 'expired'
+                WHERE done_at IS NULL AND alert_id IN (SELECT id FROM outbox_alerts WHERE created_at < ?)
+            ''', (now, now - OUTBOX_MAX_AGE)).rowcount
+        # Each alert's rendered text is read once, not once per unsent chat
+        pending = {}
+        for alert_id, key, message, prune in app.db.query('''
+            SELECT id, alert_key, message, prune FROM outbox_alerts
+            WHERE id IN (SELECT alert_id FROM outbox WHERE done_at IS NULL)
+        '''):
+            alert = Alert(key, message, prune=bool(prune))
+            alert.alert_id = alert_id
+            pending[alert_id] = (alert, [])
+        rows = app.db.query('SELECT alert_id, chat_id FROM outbox WHERE done_at IS NULL ORDER BY alert_id')
+        for alert_id, chat_id in rows:
+            pending[alert_id][1].append(chat_id)
+        for alert, chat_ids in pending.values():
+            self._enqueue(alert, chat_ids)
+        if rows or expired:
+            logger.info(f"📤 Resuming {len(rows)} unsent messages from {len(pending)} alerts in the outbox "
+                        f"({expired} too old, dropped)")
+
+    def backlog(self):
+        """(unsent outbox rows, seconds since the oldest of them was queued)."""
+        depth, oldest = app.db.query_one('SELECT COUNT(*), MIN(alert_id) FROM outbox WHERE done_at IS NULL')
+        if not depth:
+            return 0, 0
+        created_at = app.db.query_one('SELECT created_at FROM outbox_alerts WHERE id = ?', (oldest,))[0]
+        return depth, int(time.time()) - created_at
+
+    def _persist(self, alert, recipients):
+        """Write the alert and its chats to the outbox; returns the chats not already queued under its key."""
+        with app.db.write() as w:
+            w.execute('INSERT OR IGNORE INTO outbox_alerts (alert_key, message, prune, created_at) VALUES (?, ?, ?, ?)',
+                      (alert.key, alert.message, int(alert.prune), int(time.time())))
+            alert.alert_id = w.execute('SELECT id FROM outbox_alerts WHERE alert_key = ?', (alert.key,)).fetchone()[0]
+            queued = {row[0] for row in w.execute('SELECT chat_id FROM outbox WHERE alert_id = ?', (alert.alert_id,))}
+            fresh = [chat_id for chat_id in dict.fromkeys(recipients) if chat_id not in queued]
+            w.executemany('INSERT INTO outbox (alert_id, chat_id) VALUES (?, ?)',
+                          [(alert.alert_id, chat_id) for chat_id in fresh])
+        if len(fresh) < len(recipients):
+            metrics.incr('outbox_duplicates_skipped', len(recipients) - len(fresh))
+        return fresh
+
+    def _enqueue(self, alert, chat_ids):
+        alert.total = alert.pending = len(chat_ids)
+        for chat_id in chat_ids:
+            self.jobs.put((alert, chat_id, 0))
+
+    def _mark_done(self, alert, chat_id, error=None):
+        with self.ack_lock:
+            self.acks.append((int(time.time()), error, alert.alert_id, chat_id))
+            if len(self.acks) < OUTBOX_ACK_BATCH:
+                return
+            acks, self.acks = self.acks, []
+        self._write_acks(acks)
+
+    def save_queued(self):
+        """Write the alerts still waiting for the fan-out to the outbox, so the next start() sends them."""
+        saved = 0
+        while True:
+            try:
+                alert = self.alerts.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                recipients = alert.recipients
+                if recipients is None:
+                    recipients = [row[0] for row in app.db.query('SELECT user_id FROM subscribers')]
+                self._persist(alert, recipients)
+                saved += 1
+            except Exception as e:
+                logger.error(f"❌ Error saving alert to the outbox: {e}")
+        if saved:
+            logger.info(f"📤 Saved {saved} queued alerts to the outbox for the next start")
+
+    def flush_acks(self):
+        """Write every finished send to the outbox now."""
+        with self.ack_lock:
+            acks, self.acks = self.acks, []
+        if acks:
+            self._write_acks(acks)
+
+    def _write_acks(self, acks):
+        try:
+            with app.db.write() as w:
+                w.executemany('UPDATE outbox SET done_at = ?, error = ? WHERE alert_id = ? AND chat_id = ?', acks)
+        except Exception as e:
+            logger.error(f"❌ Error marking {len(acks)} sends done in the outbox: {e}")
+
+    def _ack_loop(self):
+        while True:
+            time.sleep(OUTBOX_ACK_INTERVAL)
+            self.flush_acks()
+
+    def _fan_out(self):
+        while True:
+            alert = self.alerts.get()
+            try:
+                recipients = alert.recipients
+                if recipients is None:
+                    recipients = [row[0] for row in app.db.query('SELECT user_id FROM subscribers')]
+                self._enqueue(alert, self._persist(alert, recipients))
+            except Exception as e:
+                logger.error(f"❌ Error sending notifications: {e}")
+
+    def _claim_chat(self, chat_id):
+        """Take the chat's send slot if it's free; otherwise return the seconds until it is."""
+        with self.chat_lock:
+            now = time.monotonic()
+            slot = self.chat_next_send.get(chat_id, 0.0)
+            if slot > now:
+                return slot - now
+            self.chat_next_send[chat_id] = now + self.per_chat_interval
+            return 0
+
+    def _send_loop(self):
+        while True:
+            alert, chat_id, attempt = self.jobs.get()
+            wait = self._claim_chat(chat_id)
+            if wait:
+                # Park the job rather than the worker, so a busy chat doesn't hold up everyone else
+                self._schedule_retry((alert, chat_id, attempt), wait)
+                continue
+            self.bucket.acquire()
+            error = None
+            start = time.perf_counter()
+            try:
+                app.bot.send_message(chat_id, alert.message, parse_mode="Markdown")
+                metrics.observe('send_seconds', time.perf_counter() - start)
+                with alert.lock:
+                    alert.sent += 1
+                metrics.incr('messages_sent')
+            except Exception as e:
+                if self._handle_failure(alert, chat_id, attempt, e):
+                    continue
+                error = classify_send_error(e)
+            self._mark_done(alert, chat_id, error)
+            self._job_done(alert)
+
+    def _handle_failure(self, alert, chat_id, attempt, error):
+        """Record a failed send; returns True if the job was scheduled for a retry."""
+        failure = classify_send_error(error)
+        metrics.incr(f'send_failures.{failure}')
+
+        if failure == 'blocked':
+            logger.warning(f"🚫 User {chat_id} is unreachable: {error}")
+            if alert.prune:
+                with alert.lock:
+                    alert.blocked.append(chat_id)
+            return False
+        if failure == 'rejected':
+            logger.error(f"❌ Telegram rejected message for user {chat_id}: {error}")
+            return False
+
+        if attempt >= SEND_MAX_RETRIES:
+            logger.error(f"❌ Giving up on user {chat_id} after {attempt + 1} attempts: {error}")
+            metrics.incr('send_gave_up')
+            return False
+
+        if failure == 'rate_limited':
+            delay = error.result_json.get('parameters', {}).get('retry_after', 1)
+            logger.warning(f"⚠️ Rate limited by Telegram, pausing sends for {delay}s")
+            self.bucket.pause(delay)
+        else:
+            delay = min(SEND_RETRY_BASE_DELAY * 2 ** attempt, 60)
+            logger.warning(f"⚠️ Transient error sending to user {chat_id}, retrying in {delay:.0f}s: {error}")
+        self._schedule_retry((alert, chat_id, attempt + 1), delay)
+        return True
+
+    def _schedule_retry(self, job, delay):
+        with self.retry_cond:
+            heapq.heappush(self.retries, (time.monotonic() + delay, next(self.retry_seq), job))
+            self.retry_cond.notify()
+
+    def _retry_loop(self):
+        """Move retry jobs back onto the send queue once their backoff has elapsed."""
+        while True:
+            with self.retry_cond:
+                while not self.retries or self.retries[0][0] > time.monotonic():
+                    timeout = self.retries[0][0] - time.monotonic() if self.retries else None
+                    self.retry_cond.wait(timeout)
+                _, _, job = heapq.heappop(self.retries)
+            self.jobs.put(job)
+
+    def _job_done(self, alert):
+        with alert.lock:
+            alert.pending -= 1
+            finished = alert.pending == 0
+        if not finished:
+            return
+        elapsed = time.monotonic() - alert.created
+        metrics.observe('alert_delivery_seconds', elapsed)
+        logger.info(f"📬 Alert {alert.alert_id} delivered to {alert.sent}/{alert.total} recipients in {elapsed:.2f}s",
+                    extra=SAMPLED)
+        if alert.blocked:
+            self._prune_subscribers(alert.blocked)
+
+    def _prune_subscribers(self, user_ids):
+        """Remove unreachable subscribers in a single transaction."""
+        try:
+            with app.db.write() as w:
+                w.executemany('DELETE FROM subscribers WHERE user_id = ?', [(user_id,) for user_id in user_ids])
+            subscriber_index.remove(user_ids)
+            metrics.incr('subscribers_pruned', len(user_ids))
+            logger.info(f"🧹 Removed {len(user_ids)} unreachable subscribers")
+        except Exception as e:
+            logger.error(f"❌ Error removing subscribers: {e}")
+
+dispatcher = NotificationDispatcher(DELIVERY_WORKERS, GLOBAL_SEND_RATE, PER_CHAT_SEND_INTERVAL)
+metrics.gauge('outbox_depth', lambda: dispatcher.backlog()[0])
+metrics.gauge('outbox_oldest_seconds', lambda: dispatcher.backlog()[1])
+
+@dataclass(slots=True)
+class PendingAlert:
+    notification: Notification
+    opened: float
+    merged: int = 1
+
+class AlertCoalescer:
+    """Merges the alerts one token triggers across sources into a single send.
+
+    The first alert for a token (per audience) opens a window of `window`
+    seconds. Alerts for the same token that arrive meanwhile replace the
+    pending one, so the latest figures win, and when the window closes one
+    alert goes out listing every source that mentioned the token around it.
+    """
+
+    def __init__(self, window, deliver):
+        self.window = window
+        self.deliver = deliver
+        self.pending = {}  # (token_id, admin_only) -> PendingAlert
+        self.deadlines = []  # heap of (flush_at, key)
+        self.mentions = OrderedDict()  # token_id -> (last_seen, {source: seen_at}), oldest first
+        self.cond = threading.Condition()
+        self.thread = None
+
+    def start(self):
+        if self.thread:
+            return
+        self.thread = threading.Thread(target=self._flush_loop, name='alert-coalescer', daemon=True)
+        self.thread.start()
+
+    def mention(self, token_id, source):
+        """Note that a source reported this token, whether or not it raised an alert."""
+        if self.window <= 0:
+            return
+        now = time.monotonic()
+        with self.cond:
+            _, sources = self.mentions.pop(token_id, (None, {}))
+            sources[source] = now
+            self.mentions[token_id] = (now, sources)
+            # Nothing older than two windows can still be listed in an alert
+            while self.mentions and next(iter(self.mentions.values()))[0] < now - 2 * self.window:
+                self.mentions.popitem(last=False)
+
+    def add(self, notification):
+        if self.window <= 0:
+            self.deliver(notification)
+            return
+        key = (notification.token_id, notification.admin_only)
+        with self.cond:
+            entry = self.pending.get(key)
+            if entry:
+                entry.notification = notification
+                entry.merged += 1
+                metrics.incr('alerts_coalesced')
+                return
+            now = time.monotonic()
+            self.pending[key] = PendingAlert(notification, now)
+            heapq.heappush(self.deadlines, (now + self.window, key))
+            if self.deadlines[0][1] == key:
+                # Only wake the flusher if this window closes first
+                self.cond.notify()
+        self.start()
+
+    def _sources(self, token_id, opened):
+        _, sources = self.mentions.get(token_id, (None, {}))
+        return [source for source, seen_at in sources.items() if seen_at >= opened - self.window]
+
+    def flush(self):
+        """Send every pending alert now, without waiting for its window to close (on shutdown)."""
+        with self.cond:
+            closing = [(key, entry, self._sources(key[0], entry.opened)) for key, entry in self.pending.items()]
+            self.pending.clear()
+            self.deadlines.clear()
+        for key, entry, sources in closing:
+            self._send(key, entry, sources)
+
+    def _send(self, key, entry, sources):
+        notification = replace(entry.notification, sources=tuple(sources))
+        if entry.merged > 1 or len(sources) > 1:
+            logger.info(f"🔀 Merged {entry.merged} alerts for {key[0]} from {', '.join(sources)}")
+        try:
+            self.deliver(notification, sources)
+        except Exception as e:
+            logger.error(f"❌ Error sending merged alert: {e}")
+
+    def _flush_loop(self):
+        while True:
+            with self.cond:
+                while not self.deadlines or self.deadlines[0][0] > time.monotonic():
+                    timeout = self.deadlines[0][0] - time.monotonic() if self.deadlines else None
+                    self.cond.wait(timeout)
+                _, key = heapq.heappop(self.deadlines)
+                entry = self.pending.pop(key)
+                sources = self._sources(key[0], entry.opened)
+            self._send(key, entry, sources)
+
+# === NOTIFICATION FUNCTION === #
+def send_notification_to_all(message):
+    """Queue a message for every subscriber; delivery happens on the dispatcher threads."""
+    dispatcher.submit(message)
+
+def send_admin_message(message, key=None):
+    """Queue a message for the admin only (never pruned from subscribers on failure)."""
+    dispatcher.submit(message, recipients=[ADMIN_ID], prune=False, key=key)
+
+def deliver(notification, sources=None):
+    """Send an alert to the admin, or to the subscribers whose filters it passes."""
+    if notification.admin_only:
+        send_admin_message(notification.render(), key=notification.key())
+        return
+    recipients = subscriber_index.route(notification.market_cap, notification.multiplier,
+                                        sources or [notification.source or notification.channel_name])
+    metrics.observe('alert_fanout', len(recipients), SIZE_BUCKETS)
+    logger.info(f"📣 Alert for {notification.token_id} routed to {len(recipients)}/{len(subscriber_index)} subscribers",
+                extra=SAMPLED)
+    if recipients:
+        dispatcher.submit(notification.render(), recipients=recipients, key=notification.key())
+
+coalescer = AlertCoalescer(ALERT_COALESCE_WINDOW, deliver)
+
+def notify(notifications):
+    """Notify stage: hand alerts decided by the persist stage to the coalescer, which merges and sends them."""
+    for notification in notifications:
+        coalescer.add(notification)
+
+# === CHANNEL STATE === #
+last_message_ids = {}
+channel_peers = {}  # username -> InputPeerChannel, so catch-ups don't resolve usernames over the network
+
+def load_channel_state():
+    for username, last_id, channel_id, access_hash in app.db.query(
+            'SELECT channel_name, last_message_id, channel_id, access_hash FROM channel_state'):
+        last_message_ids[username] = last_id
+        if channel_id is not None:
+            channel_peers[username] = InputPeerChannel(channel_id, access_hash)
+
+def get_last_message_id(username):
+    return last_message_ids.get(username, 0)
+
+def set_last_message_id(username, message_id):
+    """Advance the high-water mark for a channel (never moves backwards).
+
+    The mark is queued on the token writer behind the message's own rows, so
+    the event loop never waits on the write lock and a crash can't persist a
+    mark for messages whose tokens weren't written.
+    """
+    if message_id <= last_message_ids.get(username, 0):
+        return
+    last_message_ids[username] = message_id
+    app.writer.mark_channel(username, message_id)
+    app.writer.commit_cycle()
+
+async def resolve_channel(username):
+    """Input peer for a channel: cached, persisted in channel_state, resolved over the network only once."""
+    peer = channel_peers.get(username)
+    if peer is not None:
+        return peer
+    start = time.perf_counter()
+    peer = await app.client.get_input_entity(username)
+    metrics.observe('resolve_seconds', time.perf_counter() - start)
+    channel_peers[username] = peer
+    if isinstance(peer, InputPeerChannel):
+        with app.db.write() as w:
+            w.execute('''
+                INSERT INTO channel_state (channel_name, channel_id, access_hash) VALUES (?, ?, ?)
+                ON CONFLICT(channel_name) DO UPDATE SET channel_id = excluded.channel_id, access_hash = excluded.access_hash
+            ''', (username, peer.channel_id, peer.access_hash))
+    logger.info(f"🔎 Resolved {username} in {time.perf_counter() - start:.2f}s")
+    return peer
+
+def forget_channel(username):
+    """Drop a cached peer Telegram rejected, so the next catch-up resolves the username again."""
+    channel_peers.pop(username, None)
+    with app.db.write() as w:
+        w.execute('UPDATE channel_state SET channel_id = NULL, access_hash = NULL WHERE channel_name = ?', (username,))
+
+# === INGESTION === #
+cold_start_recorded = False
+
+def record_cold_start():
+    """Log, once, how long it took from launch to the first ingested message."""
+    global cold_start_recorded
+    cold_start_recorded = True
+    elapsed = time.monotonic() - LAUNCHED
+    metrics.observe('cold_start_seconds', elapsed)
+    logger.info(f"🚀 Cold start: first message ingested {elapsed:.2f}s after launch")
+
+def handle_update(username, data):
+    """Persist a parsed message and return the alerts it triggers."""
+    if username == 'solearlytrending':
+        if not data:
+            logger.warning("❌ Failed to parse token from solearlytrending", extra=SAMPLED)
+            return []
+        logger.debug(f"✅ Successfully parsed token from solearlytrending: {data.token_name}")
+        alerts = [record_trending_sighting(data)]
+        alerts += save_token(data, username)
+    elif not data:
+        return []
+    else:
+        alerts = save_token(data, username)
+    if not cold_start_recorded:
+        record_cold_start()
+    return alerts
+
+def record_parse(username, data, seconds):
+    """Parse metrics only: the error budget is charged as each message is processed."""
+    metrics.observe(f'parse_seconds.{username}', seconds)
+    metrics.incr(f'parse_ok.{username}' if data and not isinstance(data, Exception) else f'parse_failed.{username}')
+    metrics.incr('messages_processed')
+
+def process_message(username, text):
+    """Run one channel message through the parse -> persist -> notify pipeline."""
+    data, seconds = parse_timed(app.sources.parser(username), text)
+    record_parse(username, data, seconds)
+    if isinstance(data, Exception):
+        raise data
+    notify(handle_update(username, data))
+    return data
+
+parse_pool = None
+
+def init_parse_worker(log_queue):
+    """Runs in each parse process: its log records go back to the parent, which writes them."""
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(QueueHandler(log_queue))
+
+def get_parse_pool():
+    """The parser process pool, started on first use.
+
+    Workers are spawned, not forked: a fork would copy this process
+    mid-flight, with the writer, dispatcher and log threads' locks possibly
+    held and never released in the child. A spawned worker imports this
+    module fresh (which opens nothing until app is used) and logs through a
+    queue the parent drains into its own handlers.
+    """
+    global parse_pool
+    if parse_pool is None and PARSE_WORKERS > 0:
+        context = multiprocessing.get_context('spawn')
+        log_queue = context.Queue()
+        # Logger.handle runs the parent's filters and handlers as if the record had been logged here
+        listener = QueueListener(log_queue, logger)
+        listener.start()
+        atexit.register(listener.stop)
+        parse_pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=context,
+                                         initializer=init_parse_worker, initargs=(log_queue,))
+    return parse_pool
+
+async def parse_messages(username, texts):
+    """Parse a batch of messages, off the event loop when the batch is large.
+
+    Big backfills go to the parse pool (a process pool when PARSE_WORKERS is
+    set, otherwise the loop's default thread pool); small batches are parsed
+    inline since handing them off costs more than parsing them.
+    """
+    # The parser is looked up here and sent along: worker processes have no sources configured
+    parser = app.sources.parser(username)
+    if len(texts) < PARSE_BATCH_THRESHOLD:
+        results = parse_batch(parser, texts)
+    else:
+        loop = asyncio.get_running_loop()
+        executor = get_parse_pool()
+        if not executor:
+            results = await loop.run_in_executor(None, parse_batch, parser, texts)
+        else:
+            chunk_size = -(-len(texts) // PARSE_WORKERS)
+            chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+            parsed = await asyncio.gather(*(loop.run_in_executor(executor, parse_batch, parser, chunk)
+                                            for chunk in chunks))
+            results = [result for chunk in parsed for result in chunk]
+    for data, seconds in results:
+        record_parse(username, data, seconds)
+    return [data for data, _ in results]
+
+def record_latency(username, message):
+    """Log how long a message took from being posted (or edited) to being processed."""
+    posted_at = message.edit_date or message.date
+    if not posted_at:
+        return
+    latency = time.time() - posted_at.timestamp()
+    metrics.observe(f'ingest_latency.{username}', latency)
+    logger.info(f"⏱️ {username} message {message.id} processed {latency:.2f}s after posting", extra=SAMPLED)
+
+async def on_channel_message(event):
+    """Push handler for new and edited messages: queues them for their source's worker."""
+    try:
+        if not event.message.text:
+            return
+        chat = await event.get_chat()
+        source = app.sources.lookup(getattr(chat, 'username', None))
+        if not source or source.mode != 'push' or source.queue is None:
+            return
+        # Edits change the content of a message we've already seen, so only new ones are deduplicated
+        is_edit = isinstance(event, events.MessageEdited.Event)
+        if not is_edit and event.message.id <= get_last_message_id(source.channel):
+            return
+        if source.behind:
+            return  # the catch-up this source is waiting for will fetch it
+        if source.queue.full():
+            metrics.incr(f'source_overflows.{source.channel}')
+            logger.warning(f"⚠️ {source.channel}: {source.max_pending} messages waiting, "
+                           f"shedding live updates and catching up in one fetch")
+            source.fall_behind()
+            return
+        source.queue.put_nowait(event.message)
+    except Exception as e:
+        logger.error(f"❌ Error handling channel event: {e}")
+
+async def process_live(source):
+    """Work through a push source's queued messages in order.
+
+    Each source has its own queue and worker, so a flood from one channel only
+    backs up that channel. When its queue overflows or its error budget runs
+    out the source "falls behind": queued and new live messages are dropped
+    (none of them is marked seen), and once any pause is over a single
+    catch-up fetches them all from the last processed message.
+
+    Messages are processed under the source's lock, so a live message waits
+    for a running catch-up and is skipped if that catch-up covered it; the
+    mark never jumps ahead of a gap that is still being backfilled. Workers
+    are only started once a new source's first catch-up is done.
+    """
+    while True:
+        if source.behind:
+            while not source.queue.empty():
+                source.queue.get_nowait()
+            if source.paused():
+                await asyncio.sleep(source.paused_until - time.monotonic())
+                continue
+            if not await catch_up_channel(source):
+                await asyncio.sleep(RECONNECT_CHECK_INTERVAL)
+            elif not source.paused():
+                source.behind = False
+                logger.info(f"✅ {source.channel} caught up, back to live updates")
+            continue
+        message = await source.queue.get()
+        if message is None or source.behind:
+            continue
+        async with source.lock:
+            # Edits change messages we've already seen; new ones may have been fetched by a catch-up meanwhile
+            if not message.edit_date and message.id <= get_last_message_id(source.channel):
+                continue
+            try:
+                logger.debug(f"📥 Processing message from {source.channel}: {message.text[:200]}...")
+                process_message(source.channel, message.text)
+                source.record(True)
+                record_latency(source.channel, message)
+                set_last_message_id(source.channel, message.id)
+            except Exception as e:
+                source.record(False)
+                logger.error(f"❌ Error processing message from {source.channel}: {e}")
+        await asyncio.sleep(0)  # let the other sources' workers in between messages
+
+async def poll_source(source):
+    """Fetch a poll-mode source every poll_interval seconds."""
+    while True:
+        if not source.paused():
+            await catch_up_channel(source)
+        await asyncio.sleep(max(source.poll_interval, source.paused_until - time.monotonic()))
+
+def prepare_source(source):
+    """Open a source's queue, so live messages are kept while it catches up before its worker starts."""
+    if source.queue is None:
+        source.queue = asyncio.Queue(maxsize=source.max_pending)
+        source.lock = asyncio.Lock()
+
+def start_source(source):
+    if source.worker is not None:
+        return
+    prepare_source(source)
+    worker = process_live if source.mode == 'push' else poll_source
+    source.worker = asyncio.create_task(worker(source), name=f'source-{source.channel}')
+
+def stop_source(source):
+    if source.worker is not None:
+        source.worker.cancel()
+        source.worker = None
+    source.queue = None
+
+async def fetch_channel(username, min_id, limit, reverse=False):
+    """Messages after min_id (newest first, or oldest first with reverse), through the channel's cached input peer."""
+    peer = await resolve_channel(username)
+    try:
+        return await app.client.get_messages(peer, min_id=min_id, limit=limit, reverse=reverse)
+    except (ChannelInvalidError, ChannelPrivateError):
+        forget_channel(username)
+        raise
+
+async def fetch_page(source, min_id, limit, reverse):
+    """One bounded fetch for a source; None if it failed (it counts against the source's error budget)."""
+    username = source.channel
+    fetch_start = time.perf_counter()
+    try:
+        messages = await asyncio.wait_for(fetch_channel(username, min_id, limit, reverse), CHANNEL_FETCH_TIMEOUT)
+    except asyncio.TimeoutError:
+        metrics.incr(f'fetch_timeouts.{username}')
+        logger.warning(f"⏱️ Fetching {username} timed out after {CHANNEL_FETCH_TIMEOUT:g}s, retrying on the next catch-up")
+        source.record(False)
+        return None
+    except Exception as e:
+        logger.error(f"❌ Error accessing channel {username}: {e}")
+        source.record(False)
+        return None
+    fetch_seconds = time.perf_counter() - fetch_start
+    metrics.observe(f'fetch_seconds.{username}', fetch_seconds)
+    logger.info(f"📥 Fetched {len(messages)} messages from {username} in {fetch_seconds * 1000:.0f} ms")
+    return messages
+
+async def process_backfill(source, messages):
+    """Process fetched messages in posting order; returns False if it stopped early.
+
+    Each message is charged to the error budget as it is processed and the
+    mark moves over it whatever the outcome, so a pause only stops the
+    messages after it and the next catch-up picks up from there.
+    """
+    username = source.channel
+    try:
+        texts = [message.text for message in messages if message.text]
+        parsed = iter(await parse_messages(username, texts))
+        for message in messages:
+            if source.paused():
+                return False  # out of error budget; the rest is fetched again once the pause is over
+            if message.text:
+                try:
+                    data = next(parsed)
+                    if isinstance(data, Exception):
+                        raise data
+                    notify(handle_update(username, data))
+                    source.record(True)
+                except Exception as e:
+                    source.record(False)
+                    logger.error(f"❌ Error processing message from {username}: {e}")
+            set_last_message_id(username, message.id)
+            await asyncio.sleep(0)  # let the other sources' workers in between messages of a long backfill
+    except Exception as e:
+        logger.error(f"❌ Error catching up {username}: {e}")
+        return False
+    logger.info(f"✅ Caught up {len(messages)} messages from {username}")
+    return True
+
+async def catch_up_channel(source):
+    """Backfill one source's gap since its last seen message.
+
+    The gap is read oldest first from the mark, BACKFILL_LIMIT messages per
+    get_messages call, until a short page says it's closed, so a long gap
+    is processed in full and the mark only moves over messages that were.
+    Returns False if a fetch failed (it counts against the source's error budget).
+    """
+    if source.lock is None:
+        source.lock = asyncio.Lock()
+    async with source.lock:
+        last_id = get_last_message_id(source.channel)
+        if not last_id:
+            # First run for this channel: only look at the latest few messages, newest first
+            messages = await fetch_page(source, 0, source.first_fetch, reverse=False)
+            if messages is None:
+                return False
+            await process_backfill(source, list(reversed(messages)))
+            return True
+        while True:
+            messages = await fetch_page(source, last_id, BACKFILL_LIMIT, reverse=True)
+            if messages is None:
+                return False
+            if not messages or not await process_backfill(source, messages) or len(messages) < BACKFILL_LIMIT:
+                return True
+            last_id = messages[-1].id
+
+async def catch_up():
+    """Fetch and process everything posted to the push sources since their last seen message.
+
+    Used at startup and after reconnects (poll sources fetch on their own
+    schedule). All channels are fetched concurrently, each with its own
+    CHANNEL_FETCH_TIMEOUT, so a pass takes about as long as the slowest
+    channel and one stuck channel doesn't hold up the others. Paused sources
+    are skipped. Already-processed messages are never fetched or parsed again.
+    """
+    logger.info("\n🔁 Catching up on recent channel messages...")
+    start = time.perf_counter()
+    pending = [source for source in app.sources if source.mode == 'push' and not source.paused()]
+    await asyncio.gather(*(catch_up_channel(source) for source in pending))
+    elapsed = time.perf_counter() - start
+    metrics.observe('catch_up_seconds', elapsed)
+    logger.info(f"🔁 Caught up {len(pending)} channels in {elapsed:.2f}s")
+
+def listen():
+    """(Re-)register the live update handlers for the current push sources."""
+    app.client.remove_event_handler(on_channel_message)
+    channels = app.sources.channels('push')
+    if channels:
+        app.client.add_event_handler(on_channel_message, events.NewMessage(chats=channels))
+        app.client.add_event_handler(on_channel_message, events.MessageEdited(chats=channels))
+    logger.info(f"👂 Listening for new messages in: {', '.join(channels) or 'no channels'}")
+
+main_loop = None  # the running event loop, for commands that arrive on the bot's polling thread
+
+async def reload_sources():
+    """Re-read the source list and apply it without a restart; returns a summary for the admin."""
+    try:
+        added, removed, changed = app.sources.configure(read_source_specs())
+    except Exception as e:
+        logger.error(f"❌ Error reloading sources from {SOURCES_FILE}, keeping the current ones: {e}")
+        return f"❌ Sources not reloaded: {e}"
+    for source in removed:
+        stop_source(source)
+    for old, new in changed:
+        stop_source(old)
+        # The budget and any pause carry over, only the settings change
+        new.outcomes, new.paused_until = old.outcomes, old.paused_until
+        start_source(new)
+        if new.mode == 'push':
+            new.fall_behind()  # pick up whatever was still queued for the old settings
+    for source in added:
+        prepare_source(source)
+    if added or removed or changed:
+        listen()
+        # New channels start from their first_fetch most recent messages
+        await asyncio.gather(*(catch_up_channel(source) for source in added if source.mode == 'push'))
+    for source in added:
+        start_source(source)
+    summary = (f"🔄 Sources reloaded: {len(app.sources)} watched, {len(added)} added, "
+               f"{len(removed)} removed, {len(changed)} changed")
+    logger.info(summary)
+    return summary
+
+async def sources_watch_loop():
+    """Reload the sources whenever SOURCES_FILE changes."""
+    while True:
+        await asyncio.sleep(SOURCES_RELOAD_INTERVAL)
+        try:
+            mtime = os.path.getmtime(SOURCES_FILE)
+        except OSError as e:
+            logger.error(f"❌ Can't read {SOURCES_FILE}: {e}")
+            continue
+        if mtime != sources_mtime:
+            await reload_sources()
+
+async def catch_up_watchdog():
+    """Run a catch-up pass whenever the client comes back after a disconnect.
+
+    A slow periodic pass (CATCH_UP_INTERVAL) also runs as a safety net in case
+    updates were dropped without the connection visibly going down.
+    """
+    was_connected = True
+    last_catch_up = time.monotonic()
+    while True:
+        await asyncio.sleep(RECONNECT_CHECK_INTERVAL)
+        connected = app.client.is_connected()
+        if not connected and was_connected:
+            logger.warning("⚠️ Telegram client disconnected, waiting for reconnect...")
+        reconnected = connected and not was_connected
+        overdue = CATCH_UP_INTERVAL > 0 and time.monotonic() - last_catch_up >= CATCH_UP_INTERVAL
+        if connected and (reconnected or overdue):
+            if reconnected:
+                logger.info("✅ Telegram client reconnected")
+            await catch_up()
+            last_catch_up = time.monotonic()
+        was_connected = connected
+
+# === MAIN LOOP === #
+def open_storage():
+    """Open the database (applying pending migrations) and load what the hot path keeps in memory."""
+    app.writer.start()
+    token_cache.warm()
+    subscriber_index.load()
+    load_channel_state()
+
+def request_shutdown():
+    """SIGTERM (how Railway stops a deploy): disconnect, so main() returns through its cleanup."""
+    logger.info("🛑 SIGTERM received, shutting down...")
+    asyncio.ensure_future(app.client.disconnect())
+
+async def main():
+    global main_loop
+    logger.info("\n🤖 Starting main loop...")
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, request_shutdown)
+    except NotImplementedError:
+        pass  # Windows event loops have no signal handlers
+    try:
+        # The database opens on a worker thread while Telegram connects
+        await asyncio.gather(app.client.connect(), asyncio.to_thread(open_storage))
+        if not await app.client.is_user_authorized():
+            logger.warning("🔐 First time login required!")
+            logger.warning("Please enter your phone number with country code (e.g., +1234567890):")
+            phone = input()
+            await app.client.send_code_request(phone)
+            logger.warning("Enter the code you received: ")
+            code = input()
+            try:
+                await app.client.sign_in(phone, code)
+            except Exception as e:
+                if "password" in str(e).lower():
+                    logger.warning("🔒 Two-step verification is enabled. Please enter your password:")
+                    password = input()
+                    await app.client.sign_in(password=password)
+                else:
+                    raise e
+            logger.info("✅ Successfully authorized!")
+        
+        logger.info("✅ Telegram client started successfully")
+        
+        dispatcher.start()
+        coalescer.start()
+        if METRICS_PORT > 0:
+            try:
+                start_metrics_server(METRICS_PORT)
+            except OSError as e:
+                logger.error(f"❌ Could not start metrics server on port {METRICS_PORT}: {e}")
+
+        # Start the bot in a separate thread
+        bot_thread = threading.Thread(target=app.bot.polling, daemon=True)
+        bot_thread.start()
+
+        # Push-based ingestion: handle messages as soon as Telegram delivers them, one worker per source
+        main_loop = asyncio.get_running_loop()
+        for source in app.sources:
+            prepare_source(source)
+        listen()
+
+        # Pick up anything posted while we were offline, then only poll after reconnects.
+        # Live messages queue up meanwhile and the workers start on them once the gap is processed.
+        await catch_up()
+        for source in app.sources:
+            start_source(source)
+        background = [asyncio.create_task(catch_up_watchdog())]
+        if SOURCES_FILE and SOURCES_RELOAD_INTERVAL > 0:
+            background.append(asyncio.create_task(sources_watch_loop()))
+        if API_POLL_INTERVAL > 0:
+            background.append(asyncio.create_task(api_poll_loop()))
+        if MAINTENANCE_INTERVAL > 0:
+            background.append(asyncio.create_task(maintenance_loop()))
+        try:
+            await app.client.run_until_disconnected()
+        finally:
+            for task in background:
+                task.cancel()
+    except Exception as e:
+        logger.error(f"❌ Error in main function: {e}")
+    finally:
+        if 'writer' in vars(app):
+            # Alerts still in a coalescing window or waiting for the fan-out go to the outbox for the next start
+            coalescer.flush()
+            dispatcher.save_queued()
+            app.writer.close()
+            dispatcher.flush_acks()
+        await app.client.disconnect()
+        logger.info("✅ Client disconnected")
+
+# === RUN === #
+def run():
+    """Entry point: set up logging and run the bot until the Telegram client disconnects."""
+    configure_logging()
+    logger.info("🚀 Bot is starting...")
+    asyncio.run(main())
+
+if __name__ == '__main__':
+    run()